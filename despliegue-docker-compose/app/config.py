@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -51,6 +52,124 @@ RETRAIN_INTERVAL_HOURS = int(os.getenv("RETRAIN_INTERVAL_HOURS", 1))
 MIN_SAMPLES_FOR_FOG_FINE_TUNING = int(os.getenv("MIN_SAMPLES_FOR_FOG_FINE_TUNING", 20))
 MIN_GLOBAL_SAMPLES_FOR_CLOUD_RETRAIN = int(os.getenv("MIN_GLOBAL_SAMPLES_FOR_CLOUD_RETRAIN", 500))
 
+# Caché de modelos del Nodo Edge: presupuesto de memoria, política de expulsión (lru/lfu)
+# y tiempo máximo sin uso de un modelo antes de descartarlo (0 = sin caducidad)
+EDGE_MODEL_CACHE_MAX_BYTES = int(os.getenv("EDGE_MODEL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+EDGE_MODEL_CACHE_POLICY = os.getenv("EDGE_MODEL_CACHE_POLICY", "lru")
+EDGE_MODEL_CACHE_TTL_SECONDS = float(os.getenv("EDGE_MODEL_CACHE_TTL_SECONDS", 0))
+
+# Publicador de la cola de ingesta del Nodo Edge: tamaño máximo de lote, espera máxima antes
+# de enviar un lote incompleto, mensajes pendientes admitidos en memoria y espera de una
+# petición cuando el buffer está lleno
+EDGE_PUBLISH_BATCH_SIZE = int(os.getenv("EDGE_PUBLISH_BATCH_SIZE", 100))
+EDGE_PUBLISH_FLUSH_INTERVAL_SECONDS = float(os.getenv("EDGE_PUBLISH_FLUSH_INTERVAL_SECONDS", 0.05))
+EDGE_PUBLISH_MAX_PENDING = int(os.getenv("EDGE_PUBLISH_MAX_PENDING", 10000))
+EDGE_PUBLISH_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("EDGE_PUBLISH_ENQUEUE_TIMEOUT_SECONDS", 5))
+# Codificación de los mensajes de la cola de ingesta: "json" o "msgpack" (formato binario por
+# columnas de app.data.wire_format). El Data Ingestor decodifica ambos según su content type.
+# Para pasar a "msgpack", actualizar antes todas las réplicas del Data Ingestor: las anteriores
+# a este formato no lo decodifican, y las que no conocen la columna utcoffset guardarían en UTC
+# las fechas con zona horaria
+EDGE_QUEUE_WIRE_FORMAT = os.getenv("EDGE_QUEUE_WIRE_FORMAT", "json")
+
+# Diario local (store-and-forward) de los lotes que no se pueden publicar en RabbitMQ: directorio
+# (vacío = desactivado), tamaño de cada segmento y del diario completo, política de fsync
+# (always, interval o never), y tamaño y ritmo máximo (mensajes/s, 0 = sin límite) del reenvío
+EDGE_JOURNAL_DIR = os.getenv("EDGE_JOURNAL_DIR", "/app/data/edge/journal")
+EDGE_JOURNAL_SEGMENT_BYTES = int(os.getenv("EDGE_JOURNAL_SEGMENT_BYTES", 8 * 1024 * 1024))
+EDGE_JOURNAL_MAX_BYTES = int(os.getenv("EDGE_JOURNAL_MAX_BYTES", 512 * 1024 * 1024))
+EDGE_JOURNAL_FSYNC = os.getenv("EDGE_JOURNAL_FSYNC", "interval")
+EDGE_JOURNAL_FSYNC_INTERVAL_SECONDS = float(os.getenv("EDGE_JOURNAL_FSYNC_INTERVAL_SECONDS", 1))
+EDGE_JOURNAL_REPLAY_BATCH_SIZE = int(os.getenv("EDGE_JOURNAL_REPLAY_BATCH_SIZE", 1000))
+EDGE_JOURNAL_REPLAY_RATE = float(os.getenv("EDGE_JOURNAL_REPLAY_RATE", 5000))
+
+# Consumidor del Data Ingestor: mensajes sin confirmar que entrega RabbitMQ (acota la memoria),
+# tamaño máximo de un micro-lote en muestras, espera máxima antes de guardar un micro-lote
+# incompleto, cada cuánto se informa de la profundidad de la cola, puerto de las métricas
+# Prometheus (0 = desactivadas) y cómo se escribe cada micro-lote en ticwatch_data: "copy"
+# (COPY ... FROM STDIN) o "values" (INSERT de varias filas con execute_values)
+INGESTOR_PREFETCH_COUNT = int(os.getenv("INGESTOR_PREFETCH_COUNT", 50))
+INGESTOR_MAX_BATCH_SIZE = int(os.getenv("INGESTOR_MAX_BATCH_SIZE", 1000))
+INGESTOR_FLUSH_INTERVAL_SECONDS = float(os.getenv("INGESTOR_FLUSH_INTERVAL_SECONDS", 0.05))
+INGESTOR_LAG_REPORT_INTERVAL_SECONDS = float(os.getenv("INGESTOR_LAG_REPORT_INTERVAL_SECONDS", 10))
+INGESTOR_METRICS_PORT = int(os.getenv("INGESTOR_METRICS_PORT", 8001))
+INGESTOR_WRITE_METHOD = os.getenv("INGESTOR_WRITE_METHOD", "copy")
+# Claves (user_id, session_id, timestamp) de las últimas muestras guardadas que el Data Ingestor
+# recuerda para descartar reenvíos antes de llegar a la base de datos (0 = desactivado)
+INGESTOR_DEDUP_CACHE_SIZE = int(os.getenv("INGESTOR_DEDUP_CACHE_SIZE", 100000))
+# Ventana en la que el Data Ingestor agrupa las muestras etiquetadas nuevas de cada usuario antes
+# de notificar al Fog (número de muestras, histograma de etiquetas y timestamp más reciente)
+INGESTOR_NOTIFICATION_WINDOW_SECONDS = float(os.getenv("INGESTOR_NOTIFICATION_WINDOW_SECONDS", 30))
+# Exchange (fanout) y cola donde el Data Ingestor deja las muestras que no se pueden guardar ni
+# por separado, para revisarlas sin bloquear la cola de ingesta (vacío = se devuelven a la cola)
+INGESTOR_DEAD_LETTER_EXCHANGE = os.getenv("INGESTOR_DEAD_LETTER_EXCHANGE", "ingest_dead_letter")
+INGESTOR_DEAD_LETTER_QUEUE = os.getenv("INGESTOR_DEAD_LETTER_QUEUE", "ingest_dead_letter")
+# Particiones de la cola de ingesta por usuario (0 = una única cola). Con particiones, el Nodo
+# Edge y todas las réplicas del Data Ingestor deben usar el mismo valor; las réplicas se
+# reparten las particiones anunciándose cada INGESTOR_HEARTBEAT_INTERVAL_SECONDS y dan por
+# caída a la que no se oye en INGESTOR_MEMBER_TIMEOUT_SECONDS
+INGEST_PARTITIONS = int(os.getenv("INGEST_PARTITIONS", 0))
+INGESTOR_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("INGESTOR_HEARTBEAT_INTERVAL_SECONDS", 2))
+INGESTOR_MEMBER_TIMEOUT_SECONDS = float(os.getenv("INGESTOR_MEMBER_TIMEOUT_SECONDS", 10))
+
+# Escritura diferida (write-behind) de la colección TicWatch de MongoDB en el Nodo Edge.
+# Durabilidad "buffered": se responde al encolar; "flushed": se responde tras escribir el lote
+EDGE_RECOVERY_WRITE_BATCH_SIZE = int(os.getenv("EDGE_RECOVERY_WRITE_BATCH_SIZE", 500))
+EDGE_RECOVERY_WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("EDGE_RECOVERY_WRITE_FLUSH_INTERVAL_SECONDS", 0.1))
+EDGE_RECOVERY_WRITE_MAX_PENDING = int(os.getenv("EDGE_RECOVERY_WRITE_MAX_PENDING", 50000))
+EDGE_RECOVERY_WRITE_DURABILITY = os.getenv("EDGE_RECOVERY_WRITE_DURABILITY", "buffered")
+
+# Características de ventana deslizante por sesión (tamaños de ventana en muestras). Los
+# entrenadores solo las usan si TRAIN_WITH_WINDOW_FEATURES está activo, y las calculan sobre las
+# sesiones completas (también las muestras sin etiquetar), como el Edge; el Edge detecta por el
+# número de características de cada modelo si las necesita
+FEATURE_WINDOW_SIZES = [int(size) for size in os.getenv("FEATURE_WINDOW_SIZES", "10,50").split(",") if size.strip()]
+TRAIN_WITH_WINDOW_FEATURES = os.getenv("TRAIN_WITH_WINDOW_FEATURES", "false").lower() in ("1", "true", "yes")
+# Sesiones con estado de ventana que guarda cada Nodo Edge y tiempo sin muestras antes de descartarlas
+EDGE_FEATURE_MAX_SESSIONS = int(os.getenv("EDGE_FEATURE_MAX_SESSIONS", 10000))
+EDGE_FEATURE_SESSION_IDLE_SECONDS = float(os.getenv("EDGE_FEATURE_SESSION_IDLE_SECONDS", 600))
+
+# Control de admisión de las rutas de predicción del Nodo Edge: peticiones simultáneas, cola
+# de espera, SLO de latencia (tiempo máximo en cola) y cargas de modelo en frío simultáneas
+EDGE_MAX_CONCURRENT_REQUESTS = int(os.getenv("EDGE_MAX_CONCURRENT_REQUESTS", 64))
+EDGE_MAX_QUEUED_REQUESTS = int(os.getenv("EDGE_MAX_QUEUED_REQUESTS", 256))
+EDGE_LATENCY_SLO_SECONDS = float(os.getenv("EDGE_LATENCY_SLO_SECONDS", 0.5))
+EDGE_MAX_COLD_LOADS = int(os.getenv("EDGE_MAX_COLD_LOADS", 8))
+
+# Calentamiento del Nodo Edge al arrancar: se precargan (y se hace una predicción de prueba con)
+# los modelos de los usuarios atendidos más recientemente por este nodo. La lista se persiste en
+# disco para sobrevivir a los reinicios. /health no indica "ready" hasta que termina
+EDGE_RECENT_USERS_PATH = os.getenv("EDGE_RECENT_USERS_PATH", "/app/data/edge/recent_users.json")
+EDGE_RECENT_USERS_MAX = int(os.getenv("EDGE_RECENT_USERS_MAX", 500))
+EDGE_RECENT_USERS_SAVE_INTERVAL_SECONDS = float(os.getenv("EDGE_RECENT_USERS_SAVE_INTERVAL_SECONDS", 30))
+EDGE_WARMUP_MAX_USERS = int(os.getenv("EDGE_WARMUP_MAX_USERS", 50))
+EDGE_WARMUP_CONCURRENCY = int(os.getenv("EDGE_WARMUP_CONCURRENCY", 4))
+EDGE_WARMUP_TIMEOUT_SECONDS = float(os.getenv("EDGE_WARMUP_TIMEOUT_SECONDS", 60))
+
+# Variantes de modelo por nivel (tier) de la arquitectura, con su presupuesto: número de árboles,
+# profundidad u hojas máximas, tamaño máximo del artefacto (0 = sin límite) y umbrales en float32
+# (la variante se guarda compilada, ver app.models.compiled_forest). La variante "cloud" es el
+# modelo por defecto. MODEL_VARIANT_BUDGETS (JSON) permite sobrescribir valores por tier
+MODEL_TIERS = ["edge", "fog", "cloud"]
+DEFAULT_MODEL_TIER = "cloud"
+MODEL_VARIANT_BUDGETS = {
+    "edge": {"n_estimators": 30, "max_depth": 12, "max_leaf_nodes": None, "max_bytes": 2 * 1024 * 1024, "float32_thresholds": True},
+    "fog": {"n_estimators": 60, "max_depth": 20, "max_leaf_nodes": None, "max_bytes": 16 * 1024 * 1024, "float32_thresholds": False},
+    "cloud": {"n_estimators": 100, "max_depth": None, "max_leaf_nodes": None, "max_bytes": 0, "float32_thresholds": False},
+}
+for _tier, _overrides in json.loads(os.getenv("MODEL_VARIANT_BUDGETS", "{}")).items():
+    MODEL_VARIANT_BUDGETS.setdefault(_tier, {}).update(_overrides)
+# Variantes adicionales que generan el Cloud Trainer (modelo genérico) y el Fog Trainer (modelos de usuario)
+CLOUD_MODEL_VARIANT_TIERS = [tier for tier in os.getenv("CLOUD_MODEL_VARIANT_TIERS", "edge,fog").split(",") if tier.strip()]
+FOG_MODEL_VARIANT_TIERS = [tier for tier in os.getenv("FOG_MODEL_VARIANT_TIERS", "edge").split(",") if tier.strip()]
+# Variante que descarga el Nodo Edge
+EDGE_MODEL_TIER = os.getenv("EDGE_MODEL_TIER", "edge")
+
+# Caché en disco de los modelos descargados de la Cloud API (Nodos Edge y Fog): permite
+# descargas condicionales (ETag) y sobrevive a los reinicios. 0 bytes = sin límite
+MODEL_ARTIFACT_CACHE_DIR = os.getenv("MODEL_ARTIFACT_CACHE_DIR", os.path.join(CONTAINER_DATA_DIR, "model_cache"))
+MODEL_ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("MODEL_ARTIFACT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
 # Asegurarse de que los directorios necesarios existan al iniciar el servicio
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.makedirs(USER_MODELS_DIR, exist_ok=True)
@@ -65,4 +184,11 @@ RABBITMQ_QUEUE = os.getenv("RABBITMQ_QUEUE")
 
 # Configuración de Cloud API (desde .env)
 CLOUD_API_HOST = os.getenv("CLOUD_API_HOST")
-CLOUD_API_PORT = int(os.getenv("CLOUD_API_PORT", 5000)) # FastAPI default port
\ No newline at end of file
+CLOUD_API_PORT = int(os.getenv("CLOUD_API_PORT", 5000)) # FastAPI default port
+
+# Pool de conexiones del cliente asíncrono de la Cloud API (usado por el Nodo Edge)
+CLOUD_API_MAX_CONNECTIONS = int(os.getenv("CLOUD_API_MAX_CONNECTIONS", 100))
+CLOUD_API_TIMEOUT_SECONDS = float(os.getenv("CLOUD_API_TIMEOUT_SECONDS", 30))
+
+# Tamaño del pool de hilos con el que el Nodo Edge consulta los mapeos de modelo en PostgreSQL
+EDGE_DB_POOL_SIZE = int(os.getenv("EDGE_DB_POOL_SIZE", 8))
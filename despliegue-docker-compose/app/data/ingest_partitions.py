@@ -0,0 +1,53 @@
+import zlib
+from collections import OrderedDict
+
+# Modo particionado de la cola de ingesta: el Nodo Edge publica cada muestra en la cola de la
+# partición de su usuario (exchange directo, clave de enrutado = número de partición) y cada
+# réplica del Data Ingestor consume un subconjunto de las particiones. Todas las muestras de un
+# usuario pasan por la misma cola, así que se guardan en orden.
+INGEST_PARTITIONED_EXCHANGE = "edge_ingest_partitioned"
+# Exchange fanout por el que las réplicas del Data Ingestor anuncian que siguen vivas
+INGESTOR_MEMBERS_EXCHANGE = "ingestor_members"
+
+
+def partition_for(user_id: str, partitions: int) -> int:
+    """Partición de un usuario. CRC32 y no hash(): tiene que ser igual en todos los procesos."""
+    return zlib.crc32(str(user_id).encode()) % partitions
+
+
+def partition_queue(queue_name: str, partition: int) -> str:
+    return f"{queue_name}.p{partition}"
+
+
+def group_by_partition(messages: list, partitions: int) -> "OrderedDict[int, list]":
+    """Agrupa los mensajes de un lote por partición, conservando el orden dentro de cada una."""
+    groups = OrderedDict()
+    for message in messages:
+        groups.setdefault(partition_for(message.get("user_id"), partitions), []).append(message)
+    return groups
+
+
+def declare_partitions(channel, queue_name: str, partitions: int):
+    """
+    Declara el exchange y las colas de las particiones (lo hacen tanto el Nodo Edge como el
+    Data Ingestor, para que no se pierdan mensajes según quién arranque antes). Las colas son
+    de consumidor activo único: aunque durante un reparto dos réplicas se suscriban a la misma
+    partición, RabbitMQ solo entrega a una, y se mantiene el orden por usuario.
+    """
+    channel.exchange_declare(exchange=INGEST_PARTITIONED_EXCHANGE, exchange_type="direct", durable=True)
+    for partition in range(partitions):
+        queue = partition_queue(queue_name, partition)
+        channel.queue_declare(queue=queue, durable=True, arguments={"x-single-active-consumer": True})
+        channel.queue_bind(exchange=INGEST_PARTITIONED_EXCHANGE, queue=queue, routing_key=str(partition))
+
+
+def assign_partitions(member: str, members: list, partitions: int) -> set:
+    """
+    Particiones que corresponden a member entre los miembros vivos: se reparten por turnos
+    sobre la lista ordenada de miembros, de modo que cada réplica recibe el mismo número de
+    particiones (±1) y el rendimiento crece con el número de réplicas. Todas las réplicas con
+    la misma lista de miembros calculan el mismo reparto.
+    """
+    members = sorted(set(members) | {member})
+    index = members.index(member)
+    return {partition for partition in range(partitions) if partition % len(members) == index}
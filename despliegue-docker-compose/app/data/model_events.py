@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+import pika
+
+from app.config import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS
+
+# Exchange fanout por el que se anuncian los modelos nuevos: cada Nodo Edge enlaza su propia
+# cola temporal y recibe todos los eventos, sin competir con los demás nodos.
+MODEL_UPDATES_EXCHANGE = os.getenv("MODEL_UPDATES_EXCHANGE", "model_updates")
+
+
+def _connection_parameters() -> pika.ConnectionParameters:
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials, heartbeat=600)
+
+
+def build_model_updated_event(user_id: Optional[str], model_type: str) -> dict:
+    """Evento de modelo actualizado. user_id es None cuando cambia el modelo genérico."""
+    return {
+        "event": "model_updated",
+        "user_id": user_id,
+        "model_type": model_type,
+        "updated_at": datetime.now().isoformat(),
+    }
+
+
+def publish_model_updated(user_id: Optional[str], model_type: str) -> bool:
+    """
+    Publica en MODEL_UPDATES_EXCHANGE que el modelo de un usuario (o el genérico, con
+    user_id=None) ha cambiado. Los eventos son poco frecuentes, así que se usa una conexión
+    por publicación. Retorna True si el evento se publicó.
+    """
+    event = build_model_updated_event(user_id, model_type)
+    connection = None
+    try:
+        connection = pika.BlockingConnection(_connection_parameters())
+        channel = connection.channel()
+        channel.exchange_declare(exchange=MODEL_UPDATES_EXCHANGE, exchange_type="fanout", durable=True)
+        channel.basic_publish(
+            exchange=MODEL_UPDATES_EXCHANGE,
+            routing_key="",
+            body=json.dumps(event),
+            properties=pika.BasicProperties(content_type="application/json"),
+        )
+        print(f"Model update event published: {event}", file=sys.stderr)
+        return True
+    except Exception as e:
+        print(f"Error publishing model update event {event}: {e}", file=sys.stderr)
+        return False
+    finally:
+        if connection and connection.is_open:
+            connection.close()
+
+
+class ModelUpdateListener:
+    """
+    Consume los eventos de MODEL_UPDATES_EXCHANGE en un hilo propio y llama a on_event(evento)
+    por cada uno. Usa una cola exclusiva que RabbitMQ borra al cerrar la conexión, y se
+    reconecta con espera creciente si el broker no está disponible.
+    """
+
+    def __init__(self, on_event: Callable[[dict], None], reconnect_delay: float = 5, max_reconnect_delay: float = 60):
+        self.on_event = on_event
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._stopping = threading.Event()
+        self._connection = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-update-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None and connection.is_open:
+            connection.add_callback_threadsafe(connection.close)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stopping.is_set():
+            try:
+                self._connection = pika.BlockingConnection(_connection_parameters())
+                channel = self._connection.channel()
+                channel.exchange_declare(exchange=MODEL_UPDATES_EXCHANGE, exchange_type="fanout", durable=True)
+                queue_name = channel.queue_declare(queue="", exclusive=True).method.queue
+                channel.queue_bind(exchange=MODEL_UPDATES_EXCHANGE, queue=queue_name)
+                channel.basic_consume(queue=queue_name, on_message_callback=self._on_message, auto_ack=True)
+                print(f"Listening for model update events on '{MODEL_UPDATES_EXCHANGE}'.", file=sys.stderr)
+                delay = self.reconnect_delay
+                channel.start_consuming()
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                print(f"Model update listener disconnected: {e}. Reconnecting in {delay} seconds...", file=sys.stderr)
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            event = json.loads(body)
+        except ValueError as e:
+            print(f"Discarding malformed model update event: {e}", file=sys.stderr)
+            return
+        try:
+            self.on_event(event)
+        except Exception as e:
+            print(f"Error handling model update event {event}: {e}", file=sys.stderr)
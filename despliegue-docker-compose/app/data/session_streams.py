@@ -0,0 +1,33 @@
+from typing import Callable, Optional
+
+import pandas as pd
+import psycopg2
+
+from app.config import DATABASE_URL
+from app.data.ticwatch_writer import TICWATCH_COLUMNS
+
+
+def get_labeled_session_streams(user_id: Optional[str] = None, dsn: str = DATABASE_URL,
+                                connect: Callable = psycopg2.connect) -> pd.DataFrame:
+    """
+    Todas las muestras (etiquetadas o no) de las sesiones que tienen alguna muestra etiquetada,
+    de un usuario o de todos (user_id None), en orden de timestamp. Son las que necesitan los
+    entrenadores para calcular las características de ventana como el Nodo Edge, que las
+    calcula sobre cada muestra que recibe (app.features.window_features.labeled_window_training_data).
+    """
+    user_filter = "AND user_id = %s " if user_id is not None else ""
+    query = (
+        f"SELECT {', '.join(f'd.{column}' for column in TICWATCH_COLUMNS)} FROM ticwatch_data d "
+        "WHERE (d.user_id, d.session_id) IN ("
+        f"SELECT DISTINCT user_id, session_id FROM ticwatch_data WHERE estado_real IS NOT NULL {user_filter}) "
+        "ORDER BY d.user_id, d.session_id, d.timestamp"
+    )
+    connection = connect(dsn)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query, (user_id,) if user_id is not None else None)
+            rows = cursor.fetchall()
+        connection.commit()
+    finally:
+        connection.close()
+    return pd.DataFrame(rows, columns=list(TICWATCH_COLUMNS))
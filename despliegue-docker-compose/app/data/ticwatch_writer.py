@@ -0,0 +1,209 @@
+import io
+import sys
+import time
+from datetime import datetime
+from typing import Callable
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from app.config import DATABASE_URL
+
+# Columnas de ticwatch_data que se escriben, en el orden de las filas de copy_ticwatch_rows
+# (empiezan por las de la clave natural)
+TICWATCH_COLUMNS = (
+    "user_id", "session_id", "timestamp",
+    "tic_accx", "tic_accy", "tic_accz",
+    "tic_acclx", "tic_accly", "tic_acclz",
+    "tic_girx", "tic_giry", "tic_girz",
+    "tic_hrppg", "tic_step", "ticwatchconnected",
+    "estado_real", "predicted_state",
+)
+WRITE_METHODS = ("copy", "values")
+# Clave natural de una muestra: un reenvío del broker o del diario del Edge no debe duplicarla
+NATURAL_KEY_COLUMNS = ("user_id", "session_id", "timestamp")
+NATURAL_KEY_INDEX = "ticwatch_data_natural_key"
+# Sin el índice único, cada cuántos segundos se vuelve a intentar crearlo
+NATURAL_KEY_INDEX_RETRY_SECONDS = 300
+# Filas por sentencia INSERT con execute_values
+VALUES_PAGE_SIZE = 1000
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def ticwatch_row(sample: dict) -> tuple:
+    """Fila de ticwatch_data (en el orden de TICWATCH_COLUMNS) a partir de una muestra."""
+    return tuple(sample.get(column) for column in TICWATCH_COLUMNS)
+
+
+def _copy_value(value) -> str:
+    # Formato de texto de COPY: \N para NULL y barras, tabuladores y saltos de línea escapados
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def copy_buffer(rows: list) -> io.StringIO:
+    """Cuerpo de un COPY ... FROM STDIN (formato de texto) con las filas dadas."""
+    buffer = io.StringIO()
+    buffer.writelines("\t".join(_copy_value(value) for value in row) + "\n" for row in rows)
+    buffer.seek(0)
+    return buffer
+
+
+def natural_key(sample: dict) -> tuple:
+    return tuple(sample.get(column) for column in NATURAL_KEY_COLUMNS)
+
+
+def ensure_natural_key_index(connection) -> bool:
+    """
+    Crea (si no existe) el índice único de la clave natural en ticwatch_data, en su propia
+    transacción. Si la tabla ya tiene duplicados no se puede crear: se avisa y retorna False
+    (copy_ticwatch_rows tiene que comprobar entonces la clave con WHERE NOT EXISTS). Retorna
+    si existe.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {NATURAL_KEY_INDEX} ON ticwatch_data ({', '.join(NATURAL_KEY_COLUMNS)})")
+        connection.commit()
+        return True
+    except psycopg2.Error as e:
+        connection.rollback()
+        print(f"Could not create unique index {NATURAL_KEY_INDEX} on ticwatch_data ({e}). "
+              f"Remove the duplicated {NATURAL_KEY_COLUMNS} rows so that it can be created. "
+              f"Until then duplicates are filtered with a slower WHERE NOT EXISTS insert.", file=sys.stderr)
+        return False
+
+
+def copy_ticwatch_rows(cursor, rows: list, method: str = "copy", natural_key_index: bool = True) -> list:
+    """
+    Escribe filas (tuplas en el orden de TICWATCH_COLUMNS) en ticwatch_data sin duplicar las
+    que ya existen. Las filas se cargan, con su posición en rows (columna ord), en una tabla
+    temporal, con COPY ... FROM STDIN o con INSERT ... VALUES de varias filas (execute_values)
+    con method="values", y pasan a ticwatch_data con un único INSERT ... SELECT: con ON CONFLICT
+    DO NOTHING si existe el índice único de la clave natural o, si no (natural_key_index=False),
+    con WHERE NOT EXISTS, que basta porque las muestras de un usuario las escribe un único Data
+    Ingestor. De las filas repetidas dentro del lote solo se escribe la primera. No hace
+    commit: la transacción es del llamador.
+
+    Returns:
+        Posiciones en rows de las filas insertadas, en orden; las demás eran duplicados. Se
+        obtienen de la columna ord de la tabla temporal (cruzada con las claves que retorna el
+        INSERT), de modo que las claves se comparan en PostgreSQL y no en Python, donde un
+        timestamp con zona horaria no es igual al que retorna la base de datos.
+    """
+    if method not in WRITE_METHODS:
+        raise ValueError(f"Unsupported write method '{method}'. Expected one of {WRITE_METHODS}.")
+    if not rows:
+        return []
+    columns = ", ".join(TICWATCH_COLUMNS)
+    keys = ", ".join(NATURAL_KEY_COLUMNS)
+    # Solo las columnas escritas (y la posición de cada fila) y sin restricciones; se vacía en cada commit
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS ticwatch_data_staging ON COMMIT DELETE ROWS AS "
+                   f"SELECT {columns}, 0 AS ord FROM ticwatch_data WITH NO DATA")
+    staged = [row + (ordinal,) for ordinal, row in enumerate(rows)]
+    if method == "copy":
+        cursor.copy_expert(f"COPY ticwatch_data_staging ({columns}, ord) FROM STDIN", copy_buffer(staged))
+    else:
+        execute_values(cursor, f"INSERT INTO ticwatch_data_staging ({columns}, ord) VALUES %s", staged, page_size=VALUES_PAGE_SIZE)
+    # Duplicados dentro del propio lote: se queda la primera aparición de cada clave
+    batch = f"SELECT DISTINCT ON ({keys}) {columns}, ord FROM ticwatch_data_staging ORDER BY {keys}, ord"
+    if natural_key_index:
+        insert = f"INSERT INTO ticwatch_data ({columns}) SELECT {columns} FROM batch ON CONFLICT DO NOTHING"
+    else:
+        # Sin índice único ON CONFLICT no descartaría nada: la clave se comprueba en la consulta
+        match = " AND ".join(f"t.{column} = b.{column}" for column in NATURAL_KEY_COLUMNS)
+        insert = (f"INSERT INTO ticwatch_data ({columns}) SELECT {', '.join('b.' + column for column in TICWATCH_COLUMNS)} "
+                  f"FROM batch b WHERE NOT EXISTS (SELECT 1 FROM ticwatch_data t WHERE {match})")
+    cursor.execute(f"WITH batch AS ({batch}), inserted AS ({insert} RETURNING {keys}) "
+                   f"SELECT b.ord FROM batch b JOIN inserted i USING ({keys}) ORDER BY b.ord")
+    return [ordinal for ordinal, in cursor.fetchall()]
+
+
+def inserted_samples(samples: list, inserted_ordinals: list) -> list:
+    """Las muestras en las posiciones inserted_ordinals (de copy_ticwatch_rows)."""
+    return [samples[ordinal] for ordinal in inserted_ordinals]
+
+
+class TicWatchBatchWriter:
+    """
+    Escritura por lotes en la tabla ticwatch_data de la base de datos central.
+
+    Cada llamada a write() guarda un lote completo en una única transacción (un COPY o un
+    INSERT de varias filas y un commit), en lugar de un INSERT y un commit por muestra. La
+    escritura es idempotente: las muestras repetidas se descartan con el índice único de la
+    clave natural (user_id, session_id, timestamp), que se crea al conectar por primera vez.
+    Si no se puede crear (la tabla ya tiene duplicados), se descartan comprobando la clave en
+    el INSERT, se vuelve a intentar crear cada index_retry_interval segundos y
+    has_natural_key_index queda en False (el Data Ingestor lo expone en /metrics).
+    La conexión se reutiliza entre lotes; si un lote falla se hace rollback, se descarta la
+    conexión (se abre otra en el siguiente lote) y se propaga la excepción para que el
+    llamador decida si reintentar.
+    """
+
+    def __init__(self, dsn: str = DATABASE_URL, method: str = "copy", connect: Callable = psycopg2.connect,
+                 index_retry_interval: float = NATURAL_KEY_INDEX_RETRY_SECONDS, clock: Callable[[], float] = time.monotonic):
+        if method not in WRITE_METHODS:
+            raise ValueError(f"Unsupported write method '{method}'. Expected one of {WRITE_METHODS}.")
+        self.dsn = dsn
+        self.method = method
+        self._connect = connect
+        self._connection = None
+        self.index_retry_interval = index_retry_interval
+        self._clock = clock
+        self.has_natural_key_index = False
+        self._index_checked_at = None
+        self.written_rows = 0
+        self.duplicate_rows = 0
+        self.written_batches = 0
+
+    def write(self, samples: list) -> list:
+        """
+        Guarda las muestras (dicts con las claves de TICWATCH_COLUMNS). Retorna las muestras
+        insertadas: las que ya estaban en la tabla no se vuelven a escribir.
+        """
+        rows = [ticwatch_row(sample) for sample in samples]
+        if not rows:
+            return []
+        if self._connection is None or self._connection.closed:
+            self._connection = self._connect(self.dsn)
+        try:
+            self._check_natural_key_index()
+            with self._connection.cursor() as cursor:
+                inserted_ordinals = copy_ticwatch_rows(cursor, rows, self.method, self.has_natural_key_index)
+            self._connection.commit()
+        except Exception:
+            self._discard_connection()
+            raise
+        inserted = inserted_samples(samples, inserted_ordinals)
+        self.written_rows += len(inserted)
+        self.duplicate_rows += len(rows) - len(inserted)
+        self.written_batches += 1
+        return inserted
+
+    def _check_natural_key_index(self):
+        if self.has_natural_key_index:
+            return
+        now = self._clock()
+        if self._index_checked_at is None or now - self._index_checked_at >= self.index_retry_interval:
+            self._index_checked_at = now
+            self.has_natural_key_index = ensure_natural_key_index(self._connection)
+
+    def close(self):
+        if self._connection is not None and not self._connection.closed:
+            self._connection.close()
+        self._connection = None
+
+    def _discard_connection(self):
+        connection, self._connection = self._connection, None
+        try:
+            connection.rollback()
+            connection.close()
+        except Exception as e:
+            print(f"Error closing database connection after a failed batch: {e}", file=sys.stderr)
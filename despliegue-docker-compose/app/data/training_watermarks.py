@@ -0,0 +1,75 @@
+from typing import Callable
+
+import psycopg2
+
+from app.config import DATABASE_URL
+
+# Marca de agua del último fine-tuning de cada usuario: el timestamp de la muestra más reciente
+# con la que el Fog Trainer entrenó su modelo. Se guarda en la base de datos central para que
+# el Fog, al reiniciarse, sepa qué muestras etiquetadas siguen sin usar.
+TRAINING_WATERMARKS_TABLE = "fog_training_watermarks"
+
+
+def create_training_watermarks_table(cursor):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {TRAINING_WATERMARKS_TABLE} ("
+        "user_id VARCHAR(255) PRIMARY KEY, "
+        "trained_until TIMESTAMP NOT NULL, "
+        "updated_at TIMESTAMP NOT NULL DEFAULT NOW())"
+    )
+
+
+def get_pending_labeled_summary(dsn: str = DATABASE_URL, connect: Callable = psycopg2.connect) -> list:
+    """
+    Resumen, por usuario, de las muestras etiquetadas posteriores a su marca de agua (todas las
+    de los usuarios que aún no tienen ninguna), con el mismo formato que las notificaciones del
+    Data Ingestor: new_labeled_samples, label_counts y max_timestamp, más trained_until.
+    """
+    connection = connect(dsn)
+    try:
+        with connection.cursor() as cursor:
+            create_training_watermarks_table(cursor)
+            cursor.execute(
+                f"SELECT d.user_id, d.estado_real, COUNT(*), MAX(d.timestamp), MAX(w.trained_until) "
+                f"FROM ticwatch_data d LEFT JOIN {TRAINING_WATERMARKS_TABLE} w ON w.user_id = d.user_id "
+                "WHERE d.estado_real IS NOT NULL AND (w.trained_until IS NULL OR d.timestamp > w.trained_until) "
+                "GROUP BY d.user_id, d.estado_real"
+            )
+            rows = cursor.fetchall()
+            # Los usuarios sin muestras nuevas también necesitan su marca de agua
+            cursor.execute(f"SELECT user_id, trained_until FROM {TRAINING_WATERMARKS_TABLE}")
+            watermarks = cursor.fetchall()
+        connection.commit()
+    finally:
+        connection.close()
+
+    summary = {user_id: {"user_id": user_id, "new_labeled_samples": 0, "label_counts": {},
+                         "max_timestamp": None, "trained_until": trained_until.isoformat()}
+               for user_id, trained_until in watermarks}
+    for user_id, label, count, max_timestamp, trained_until in rows:
+        entry = summary.setdefault(user_id, {"user_id": user_id, "new_labeled_samples": 0, "label_counts": {},
+                                             "max_timestamp": None, "trained_until": None})
+        entry["new_labeled_samples"] += count
+        entry["label_counts"][str(label)] = count
+        max_timestamp = max_timestamp.isoformat()
+        if entry["max_timestamp"] is None or max_timestamp > entry["max_timestamp"]:
+            entry["max_timestamp"] = max_timestamp
+    return list(summary.values())
+
+
+def set_training_watermark(user_id: str, trained_until: str, dsn: str = DATABASE_URL, connect: Callable = psycopg2.connect):
+    """Guarda la marca de agua del último fine-tuning del usuario (sin retroceder nunca)."""
+    connection = connect(dsn)
+    try:
+        with connection.cursor() as cursor:
+            create_training_watermarks_table(cursor)
+            cursor.execute(
+                f"INSERT INTO {TRAINING_WATERMARKS_TABLE} (user_id, trained_until) VALUES (%s, %s) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                f"trained_until = GREATEST({TRAINING_WATERMARKS_TABLE}.trained_until, EXCLUDED.trained_until), "
+                "updated_at = NOW()",
+                (user_id, trained_until),
+            )
+        connection.commit()
+    finally:
+        connection.close()
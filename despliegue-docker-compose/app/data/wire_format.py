@@ -0,0 +1,185 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+import numpy as np
+
+# Formato binario compacto (MessagePack) para las muestras del TicWatch, en la API del Nodo
+# Edge y en los mensajes de la cola de ingesta. Un lote se codifica por columnas:
+#
+#   {"v": 1, "n": <muestras>, "dtype": "<f4" | "<f8",
+#    "session_id": str | [str],          # un único valor si es igual en todo el lote
+#    "timestamp": bytes,                 # n float64 little-endian: segundos desde epoch (UTC)
+#    "utcoffset": int | [int | None],    # desfase de cada fecha en segundos (opcional; None = sin zona)
+#    "values": bytes,                    # n x len(VALUE_FIELDS) en dtype, por filas
+#    "tic_step": bytes,                  # n int32 little-endian
+#    "ticwatchconnected": bool | [bool],
+#    "user_id" / "predicted_state" / "estado_real": str | [str | None]   (opcionales)}
+#
+# También se acepta una muestra suelta o una lista de muestras como mapas MessagePack con las
+# mismas claves que el JSON. Las fechas sin zona horaria se interpretan como UTC y se decodifican
+# sin zona; las que la traen conservan su desfase, de modo que una muestra llega igual por JSON
+# que por MessagePack (y con la misma clave natural a la base de datos).
+
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPES = (MSGPACK_CONTENT_TYPE, "application/msgpack", "application/vnd.msgpack")
+WIRE_FORMAT_VERSION = 1
+# float32 es suficiente para los sensores (y es lo que usa el modelo); float64 no pierde precisión
+VALUE_DTYPES = ("<f4", "<f8")
+VALUE_FIELDS = [
+    'tic_accx', 'tic_accy', 'tic_accz',
+    'tic_acclx', 'tic_accly', 'tic_acclz',
+    'tic_girx', 'tic_giry', 'tic_girz',
+    'tic_hrppg',
+]
+OPTIONAL_TEXT_FIELDS = ("user_id", "predicted_state", "estado_real")
+
+
+def is_msgpack(content_type: str) -> bool:
+    """True si el Content-Type (o un elemento de Accept) corresponde a MessagePack."""
+    return bool(content_type) and content_type.split(";")[0].strip().lower() in MSGPACK_CONTENT_TYPES
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """True si la cabecera Accept pide MessagePack."""
+    return bool(accept) and any(is_msgpack(media_range) for media_range in accept.split(","))
+
+
+def _to_datetime(timestamp) -> datetime:
+    if isinstance(timestamp, str):
+        # fromisoformat no acepta el sufijo Z hasta Python 3.11
+        timestamp = datetime.fromisoformat(timestamp[:-1] + "+00:00" if timestamp.endswith("Z") else timestamp)
+    return timestamp
+
+
+def to_epoch(timestamp) -> float:
+    timestamp = _to_datetime(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def utc_offset(timestamp):
+    """Desfase de la fecha respecto a UTC en segundos, o None si no tiene zona horaria."""
+    offset = _to_datetime(timestamp).utcoffset()
+    return None if offset is None else int(offset.total_seconds())
+
+
+def from_epoch(seconds: float, offset=None) -> str:
+    """
+    Fecha ISO a partir de los segundos desde epoch: sin zona horaria (UTC), como la envían los
+    relojes en JSON, o con el desfase original si la fecha lo traía.
+    """
+    if offset is None:
+        return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None).isoformat()
+    return datetime.fromtimestamp(seconds, timezone(timedelta(seconds=offset))).isoformat()
+
+
+def _column(values: list):
+    # Las columnas con un único valor (p. ej. el session_id de un lote) se envían una sola vez
+    first = values[0] if values else None
+    return first if all(value == first for value in values) else values
+
+
+def _expand(payload: dict, field: str, n: int, default=None) -> list:
+    value = payload.get(field, default)
+    if isinstance(value, list):
+        if len(value) != n:
+            raise ValueError(f"Column '{field}' has {len(value)} values, expected {n}.")
+        return value
+    return [value] * n
+
+
+def encode_batch(rows: list, value_dtype: str = "<f4") -> bytes:
+    """Codifica una lista de muestras (dicts con las claves del JSON) en el formato por columnas."""
+    if value_dtype not in VALUE_DTYPES:
+        raise ValueError(f"Unsupported value dtype '{value_dtype}'. Expected one of {VALUE_DTYPES}.")
+    payload = {
+        "v": WIRE_FORMAT_VERSION,
+        "n": len(rows),
+        "dtype": value_dtype,
+        "session_id": _column([row["session_id"] for row in rows]),
+        "timestamp": np.array([to_epoch(row["timestamp"]) for row in rows], dtype="<f8").tobytes(),
+        "values": np.array([[row[field] for field in VALUE_FIELDS] for row in rows], dtype=value_dtype).tobytes(),
+        "tic_step": np.array([row["tic_step"] for row in rows], dtype="<i4").tobytes(),
+        "ticwatchconnected": _column([bool(row.get("ticwatchconnected", True)) for row in rows]),
+    }
+    offsets = [utc_offset(row["timestamp"]) for row in rows]
+    if any(offset is not None for offset in offsets):
+        payload["utcoffset"] = _column(offsets)
+    for field in OPTIONAL_TEXT_FIELDS:
+        column = [row.get(field) for row in rows]
+        if any(value is not None for value in column):
+            payload[field] = _column(column)
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def decode_batch(body: bytes) -> list:
+    """
+    Decodifica un cuerpo MessagePack (lote por columnas, muestra suelta o lista de muestras)
+    en una lista de dicts con las mismas claves y tipos que el JSON equivalente (fechas en ISO).
+    Lanza ValueError si el cuerpo no es válido.
+    """
+    try:
+        payload = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid MessagePack body ({type(e).__name__}).") from e
+
+    if isinstance(payload, list):
+        return payload
+    if not isinstance(payload, dict):
+        raise ValueError("A MessagePack body must be a sample, a list of samples or a columnar batch.")
+    if "v" not in payload:
+        return [payload]
+    if payload["v"] != WIRE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported wire format version {payload['v']}.")
+
+    n = payload.get("n")
+    dtype = payload.get("dtype", "<f4")
+    if not isinstance(n, int) or n < 0 or dtype not in VALUE_DTYPES:
+        raise ValueError("Columnar batch needs a non-negative 'n' and a supported 'dtype'.")
+    try:
+        timestamps = np.frombuffer(payload["timestamp"], dtype="<f8")
+        values = np.frombuffer(payload["values"], dtype=dtype)
+        steps = np.frombuffer(payload["tic_step"], dtype="<i4")
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid columnar batch: {e}") from e
+    if len(timestamps) != n or len(steps) != n or len(values) != n * len(VALUE_FIELDS):
+        raise ValueError(f"Columnar batch columns do not match n={n}.")
+    if not (np.isfinite(timestamps).all() and np.isfinite(values).all()):
+        raise ValueError("Columnar batch contains non-finite values.")
+
+    columns = {field: _expand(payload, field, n) for field in ("session_id",) + OPTIONAL_TEXT_FIELDS}
+    columns["ticwatchconnected"] = _expand(payload, "ticwatchconnected", n, default=True)
+    columns["utcoffset"] = _expand(payload, "utcoffset", n)
+    if not all(offset is None or isinstance(offset, int) for offset in columns["utcoffset"]):
+        raise ValueError("Column 'utcoffset' must hold integer seconds or None.")
+    if not all(isinstance(session_id, str) for session_id in columns["session_id"]):
+        raise ValueError("Every sample of a columnar batch needs a session_id.")
+
+    rows = []
+    for i, (timestamp, sample_values, step) in enumerate(zip(timestamps.tolist(), values.reshape(n, -1).tolist(), steps.tolist())):
+        row = {"session_id": columns["session_id"][i], "timestamp": from_epoch(timestamp, columns["utcoffset"][i])}
+        row.update(zip(VALUE_FIELDS, sample_values))
+        row["tic_step"] = step
+        row["ticwatchconnected"] = bool(columns["ticwatchconnected"][i])
+        for field in OPTIONAL_TEXT_FIELDS:
+            if payload.get(field) is not None:
+                row[field] = columns[field][i]
+        rows.append(row)
+    return rows
+
+
+def encode_message(rows: list, wire_format: str = "json") -> tuple:
+    """Codifica los mensajes de la cola de ingesta. Devuelve (cuerpo, content type)."""
+    if wire_format == "msgpack":
+        # float64 en la cola: el formato no debe cambiar los valores que llegan a la base de datos
+        return encode_batch(rows, value_dtype="<f8"), MSGPACK_CONTENT_TYPE
+    return json.dumps(rows).encode(), JSON_CONTENT_TYPE
+
+
+def decode_message(body: bytes, content_type: str = None) -> list:
+    """Decodifica un mensaje de la cola de ingesta (JSON o MessagePack) en una lista de muestras."""
+    decoded = decode_batch(body) if is_msgpack(content_type) else json.loads(body)
+    return decoded if isinstance(decoded, list) else [decoded]
@@ -0,0 +1,224 @@
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from app.config import FEATURE_COLUMNS, FEATURE_WINDOW_SIZES
+
+# Mismo tipo que los vectores de características de TicWatchPredictor
+FEATURE_DTYPE = np.float32
+
+# Magnitud instantánea de cada sensor de tres ejes
+MAGNITUDE_CHANNELS = {
+    'acc_mag': ('tic_accx', 'tic_accy', 'tic_accz'),
+    'accl_mag': ('tic_acclx', 'tic_accly', 'tic_acclz'),
+    'gir_mag': ('tic_girx', 'tic_giry', 'tic_girz'),
+}
+# Señales sobre las que se calculan las estadísticas de ventana
+WINDOW_CHANNELS = list(MAGNITUDE_CHANNELS) + ['tic_hrppg']
+WINDOW_STATS = ['mean', 'var', 'min', 'max']
+
+
+def window_feature_columns(window_sizes: list = FEATURE_WINDOW_SIZES) -> list:
+    """Nombres de las características derivadas, en el orden en que se calculan."""
+    columns = list(MAGNITUDE_CHANNELS)
+    for size in window_sizes:
+        for channel in WINDOW_CHANNELS:
+            columns.extend(f"{channel}_w{size}_{stat}" for stat in WINDOW_STATS)
+    return columns
+
+
+WINDOW_FEATURE_COLUMNS = window_feature_columns()
+# Vector completo: las columnas crudas primero, de modo que un modelo entrenado solo con
+# FEATURE_COLUMNS puede usar las primeras len(FEATURE_COLUMNS) posiciones del mismo vector
+ALL_FEATURE_COLUMNS = FEATURE_COLUMNS + WINDOW_FEATURE_COLUMNS
+
+
+class RollingWindow:
+    """
+    Media, varianza, mínimo y máximo de los últimos `size` valores en O(1) (amortizado)
+    por muestra: la media y la varianza se actualizan al entrar y salir cada valor
+    (algoritmo de Welford) y el mínimo y el máximo se mantienen con colas monótonas.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._position = 0
+        self._min = deque()  # (posición, valor) con valores crecientes
+        self._max = deque()  # (posición, valor) con valores decrecientes
+
+    def add(self, value: float):
+        if len(self.values) == self.size:
+            self._remove(self.values.popleft())
+        self.values.append(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((self._position, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((self._position, value))
+        # Descartar los extremos que ya han salido de la ventana
+        oldest = self._position - self.size + 1
+        if self._min[0][0] < oldest:
+            self._min.popleft()
+        if self._max[0][0] < oldest:
+            self._max.popleft()
+        self._position += 1
+
+    def _remove(self, value: float):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    def stats(self) -> tuple:
+        variance = max(self.m2 / self.count, 0.0) if self.count else 0.0
+        return self.mean, variance, self._min[0][1], self._max[0][1]
+
+
+class SessionWindowState:
+    """
+    Estado de ventanas deslizantes de una sesión. update() recibe una muestra (objeto con
+    los atributos de FEATURE_COLUMNS o diccionario) y devuelve su vector de características
+    completo, en el orden de ALL_FEATURE_COLUMNS. La memoria está acotada por el tamaño de
+    las ventanas.
+    """
+
+    def __init__(self, window_sizes: list = FEATURE_WINDOW_SIZES):
+        self.window_sizes = list(window_sizes)
+        self.windows = [[RollingWindow(size) for _ in WINDOW_CHANNELS] for size in self.window_sizes]
+        self.last_seen = 0.0
+
+    def update(self, sample) -> np.ndarray:
+        get = sample.get if isinstance(sample, dict) else (lambda column: getattr(sample, column))
+        raw = [get(column) for column in FEATURE_COLUMNS]
+        values = dict(zip(FEATURE_COLUMNS, raw))
+
+        magnitudes = [
+            math.sqrt(values[x] ** 2 + values[y] ** 2 + values[z] ** 2)
+            for x, y, z in MAGNITUDE_CHANNELS.values()
+        ]
+        channel_values = magnitudes + [values['tic_hrppg']]
+
+        features = raw + magnitudes
+        for windows in self.windows:
+            for window, value in zip(windows, channel_values):
+                window.add(value)
+                features.extend(window.stats())
+        return np.asarray(features, dtype=FEATURE_DTYPE)
+
+
+class SessionFeatureStore:
+    """
+    Estados de ventana de las sesiones activas del Nodo Edge. Se guardan como mucho
+    max_sessions (se descarta la usada hace más tiempo) y las sesiones sin muestras
+    durante idle_seconds se eliminan.
+    """
+
+    def __init__(self, max_sessions: int, idle_seconds: float, window_sizes: list = FEATURE_WINDOW_SIZES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.window_sizes = list(window_sizes)
+        self.clock = clock
+        self._sessions: "OrderedDict[str, SessionWindowState]" = OrderedDict()
+        self.evictions = 0
+
+    def update(self, session_key: str, sample) -> np.ndarray:
+        """Añade la muestra a la sesión y devuelve su vector de características (1, n)."""
+        now = self.clock()
+        state = self._sessions.get(session_key)
+        if state is None:
+            state = SessionWindowState(self.window_sizes)
+            self._sessions[session_key] = state
+        else:
+            self._sessions.move_to_end(session_key)
+        state.last_seen = now
+        features = state.update(sample)
+        self._evict(now)
+        return features.reshape(1, -1)
+
+    def update_many(self, keyed_samples: list) -> np.ndarray:
+        """Igual que update para una lista de (clave de sesión, muestra), en orden de llegada."""
+        if not keyed_samples:
+            return np.empty((0, len(ALL_FEATURE_COLUMNS)), dtype=FEATURE_DTYPE)
+        return np.vstack([self.update(session_key, sample) for session_key, sample in keyed_samples])
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "evictions": self.evictions}
+
+    def _evict(self, now: float):
+        # Las sesiones están ordenadas por último uso: basta con revisar las más antiguas
+        while self._sessions:
+            session_key, state = next(iter(self._sessions.items()))
+            idle = self.idle_seconds > 0 and now - state.last_seen > self.idle_seconds
+            if not idle and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_key]
+            self.evictions += 1
+
+
+def add_window_features(df: pd.DataFrame, window_sizes: list = FEATURE_WINDOW_SIZES) -> pd.DataFrame:
+    """
+    Versión offline para los entrenadores: calcula las características de ventana de un
+    DataFrame de muestras con el mismo código que el Nodo Edge. Las muestras se agrupan como en
+    el Edge, por (user_id, session_id) (o por la columna de las dos que exista), de modo que
+    dos usuarios con el mismo session_id no comparten ventanas, y se recorren en orden de
+    timestamp, como llegarían en tiempo real. Devuelve una copia con las columnas de WINDOW_FEATURE_COLUMNS.
+    """
+    df = df.copy()
+    if df.empty:
+        for column in window_feature_columns(window_sizes):
+            df[column] = pd.Series(dtype=FEATURE_DTYPE)
+        return df
+
+    group_columns = [column for column in ('user_id', 'session_id') if column in df.columns]
+    keys = list(zip(*(df[column].to_numpy() for column in group_columns))) if group_columns else np.zeros(len(df))
+    # Posiciones de las filas en orden temporal (estable: a igual timestamp, orden original)
+    order = np.argsort(df['timestamp'].to_numpy(), kind='stable') if 'timestamp' in df.columns else np.arange(len(df))
+    rows = df[FEATURE_COLUMNS].to_dict('records')
+
+    window_columns = window_feature_columns(window_sizes)
+    window_values = np.empty((len(df), len(window_columns)), dtype=FEATURE_DTYPE)
+    states = {}
+    for position in order:
+        state = states.get(keys[position])
+        if state is None:
+            state = states[keys[position]] = SessionWindowState(window_sizes)
+        window_values[position] = state.update(rows[position])[len(FEATURE_COLUMNS):]
+
+    for column, values in zip(window_columns, window_values.T):
+        df[column] = values
+    return df
+
+
+def labeled_window_training_data(stream: pd.DataFrame, window_sizes: list = FEATURE_WINDOW_SIZES) -> pd.DataFrame:
+    """
+    Muestras etiquetadas con sus características de ventana, para entrenar. Las ventanas se
+    calculan sobre todas las muestras de cada sesión (etiquetadas o no), como las ve el Nodo
+    Edge al predecir, y solo después se filtran las etiquetadas: calcularlas sobre las
+    etiquetadas sin más daría medias y varianzas distintas de las que se usan en producción.
+    """
+    df = add_window_features(stream, window_sizes)
+    if 'estado_real' not in df.columns:
+        return df.iloc[0:0]
+    return df[df['estado_real'].notna()].reset_index(drop=True)
@@ -0,0 +1,108 @@
+import pickle
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from app.config import FEATURE_COLUMNS, MODEL_VARIANT_BUDGETS
+from app.features.window_features import FEATURE_DTYPE
+from app.models.compiled_forest import CompiledForest
+from app.models.ticwatch_predictor import TicWatchPredictor
+
+# Por debajo de este número de muestras no se separa un conjunto de validación: las métricas
+# se calculan sobre los datos de entrenamiento (y lo indica el campo "holdout" de las métricas)
+MIN_SAMPLES_FOR_HOLDOUT = 50
+HOLDOUT_FRACTION = 0.2
+# Filas sobre las que se mide la latencia de predicción de una fila (p99)
+LATENCY_SAMPLE_ROWS = 200
+
+
+def fit_within_budget(X: np.ndarray, y: np.ndarray, budget: dict, n_estimators: int = None):
+    """
+    Entrena un RandomForestClassifier con los límites de profundidad y hojas del presupuesto y
+    reduce el número de árboles hasta que el artefacto serializado cabe en budget["max_bytes"]
+    (0 o None = sin límite). Con float32_thresholds el artefacto es un CompiledForest con los
+    umbrales en float32; si no, el propio modelo de scikit-learn.
+
+    Returns:
+        (artefacto, bytes serializados, número de árboles)
+    """
+    n_estimators = n_estimators or budget.get("n_estimators", 100)
+    max_bytes = budget.get("max_bytes") or 0
+    while True:
+        model = RandomForestClassifier(
+            n_estimators=n_estimators,
+            max_depth=budget.get("max_depth"),
+            max_leaf_nodes=budget.get("max_leaf_nodes"),
+            random_state=42,
+        )
+        model.fit(X, y)
+        artifact = CompiledForest.from_sklearn(model, threshold_dtype=np.float32) if budget.get("float32_thresholds") else model
+        artifact_bytes = pickle.dumps(artifact)
+        if not max_bytes or len(artifact_bytes) <= max_bytes or n_estimators == 1:
+            return artifact, artifact_bytes, n_estimators
+        # El tamaño crece de forma aproximadamente lineal con el número de árboles
+        n_estimators = max(1, min(n_estimators - 1, int(n_estimators * max_bytes / len(artifact_bytes))))
+
+
+def measure_latency_p99(artifact_bytes: bytes, X: np.ndarray) -> float:
+    """Latencia p99 (ms) de predecir una fila con el artefacto cargado como lo hace el Nodo Edge."""
+    predictor = TicWatchPredictor(model_bytes=artifact_bytes)
+    rows = X[:LATENCY_SAMPLE_ROWS]
+    latencies = []
+    for i in range(len(rows)):
+        started = time.perf_counter()
+        predictor.predict(rows[i:i + 1])
+        latencies.append(time.perf_counter() - started)
+    return round(float(np.percentile(latencies, 99)) * 1000, 3) if latencies else 0.0
+
+
+def train_variant(data: pd.DataFrame, y: pd.Series, tier: str, feature_columns: list = FEATURE_COLUMNS, budget: dict = None):
+    """
+    Entrena la variante del modelo para un nivel (edge, fog o cloud) según su presupuesto
+    (MODEL_VARIANT_BUDGETS). La precisión se mide sobre un conjunto de validación y el
+    artefacto final se entrena con todos los datos, con el mismo número de árboles (o menos si
+    con todos los datos no cabe en el presupuesto).
+
+    Returns:
+        (bytes del artefacto, métricas: precisión, tamaño, latencia p99 y parámetros usados)
+    """
+    budget = budget or MODEL_VARIANT_BUDGETS[tier]
+    X = data[feature_columns].to_numpy(dtype=FEATURE_DTYPE)
+    y = np.asarray(y)
+
+    holdout = len(X) >= MIN_SAMPLES_FOR_HOLDOUT
+    if holdout:
+        _, class_counts = np.unique(y, return_counts=True)
+        stratify = y if class_counts.min() >= 2 else None
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=HOLDOUT_FRACTION, random_state=42, stratify=stratify)
+    else:
+        X_train, X_test, y_train, y_test = X, X, y, y
+
+    artifact, _, n_estimators = fit_within_budget(X_train, y_train, budget)
+    accuracy = accuracy_score(y_test, artifact.predict(X_test))
+
+    if holdout:
+        artifact, artifact_bytes, n_estimators = fit_within_budget(X, y, budget, n_estimators)
+    else:
+        artifact_bytes = pickle.dumps(artifact)
+
+    metrics = {
+        "tier": tier,
+        "accuracy": round(float(accuracy), 4),
+        "size_bytes": len(artifact_bytes),
+        "max_bytes": budget.get("max_bytes") or None,
+        "latency_p99_ms": measure_latency_p99(artifact_bytes, X_test),
+        "n_estimators": n_estimators,
+        "max_depth": budget.get("max_depth"),
+        "max_leaf_nodes": budget.get("max_leaf_nodes"),
+        "float32_thresholds": bool(budget.get("float32_thresholds")),
+        "n_samples": len(X),
+        "holdout": holdout,
+        "trained_at": datetime.now().isoformat(),
+    }
+    return artifact_bytes, metrics
@@ -1,4 +1,5 @@
 import pickle
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
@@ -9,9 +10,13 @@ import os
 from app.config import FEATURE_COLUMNS
 # Asumo que app.schemas.ticwatch_schema.TicWatchData es una clase Pydantic
 from app.schemas.ticwatch_schema import TicWatchData
+# FEATURE_DTYPE: los árboles de scikit-learn convierten internamente las entradas a float32,
+# así que los vectores de características se construyen directamente en ese tipo.
+from app.features.window_features import ALL_FEATURE_COLUMNS, FEATURE_DTYPE, SessionWindowState
+from app.models.compiled_forest import CompiledForest
 
 class TicWatchPredictor:
-    def __init__(self, model_path: str = None, model_bytes: bytes = None):
+    def __init__(self, model_path: str = None, model_bytes: bytes = None, compiled_only: bool = False):
         """
         Inicializa el predictor de TicWatch con un modelo pre-entrenado si se proporciona
         como bytes o desde una ruta local (usado principalmente por el Cloud Trainer).
@@ -21,13 +26,22 @@ class TicWatchPredictor:
             model_path (str): Ruta al archivo del modelo pre-entrenado (principalmente para Cloud Trainer).
             model_bytes (bytes): Bytes del modelo pre-entrenado. Si se proporciona, se
                                  carga en lugar de usar model_path.
+            compiled_only (bool): Si el modelo se compila, descarta el de scikit-learn y se
+                                  queda solo con la versión compilada (el Nodo Edge solo
+                                  predice). El predictor ya no sirve para re-entrenar ni
+                                  para subir el modelo original.
         """
         self.model = None
+        # Versión compilada del modelo (arrays planos) que se usa para predecir, si se puede compilar
+        self.compiled = None
+        # Tamaño estimado del modelo en memoria (el de su serialización), usado por la caché del Edge
+        self.model_size_bytes = 0
 
         if model_bytes is not None:
             try:
                 # Cargar el modelo desde bytes (usado por Fog/Edge después de descargar de la API)
                 self.model = pickle.loads(model_bytes)
+                self.model_size_bytes = len(model_bytes)
                 print("TicWatchPredictor: Modelo cargado desde bytes.")
             except Exception as e:
                 print(f"Error al cargar el modelo desde bytes: {e}")
@@ -37,6 +51,7 @@ class TicWatchPredictor:
                 # Cargar el modelo desde una ruta (usado por Cloud Trainer para su almacenamiento local)
                 with open(model_path, 'rb') as f:
                     self.model = pickle.load(f)
+                self.model_size_bytes = os.path.getsize(model_path)
                 print(f"TicWatchPredictor: Modelo cargado desde la ruta: {model_path}")
             except Exception as e:
                 print(f"Error al cargar el modelo desde la ruta {model_path}: {e}")
@@ -46,53 +61,130 @@ class TicWatchPredictor:
             print("TicWatchPredictor: Inicializando con un nuevo RandomForestClassifier. No se cargó un modelo pre-entrenado.")
             self.model = RandomForestClassifier(random_state=42)
 
+        if self.model is not None:
+            try:
+                self._drop_feature_names()
+            except ValueError as e:
+                print(f"Error al validar las características del modelo: {e}")
+                self.model = None
+        self._compile()
+        if self.compiled is not None and compiled_only:
+            # La versión compilada tiene classes_ y n_features_in_, lo único que se usa del
+            # modelo al predecir: los árboles de scikit-learn se liberan
+            self.model = self.compiled
+            self.model_size_bytes = self.compiled.nbytes
+        elif self.compiled is not None:
+            # Los arrays compilados se mantienen en memoria junto al modelo
+            self.model_size_bytes += self.compiled.nbytes
+
     # Los métodos load_model y save_model han sido eliminados de esta clase.
     # La lógica de cargar/guardar archivos de modelo es responsabilidad de ModelRepository (en Cloud)
     # o de CloudAPIClient (en Fog/Edge, que maneja la descarga/subida de bytes).
     # TicWatchPredictor solo trabaja con el objeto del modelo en memoria o sus bytes.
 
-    def train_model(self, X: pd.DataFrame, y: pd.Series):
+    def train_model(self, X: pd.DataFrame, y: pd.Series, feature_columns: list = FEATURE_COLUMNS):
         """
         Entrena o re-entrena el modelo con los datos proporcionados.
         Para RandomForest, esto implica re-ajustar el modelo completamente con el nuevo dataset.
         Este método es usado tanto para el re-entrenamiento genérico (Cloud) como para el
         fine-tuning específico de usuario (Fog).
+        feature_columns es FEATURE_COLUMNS o, si X incluye las características de ventana
+        (app.features.window_features.add_window_features), ALL_FEATURE_COLUMNS.
         """
+        if feature_columns not in (FEATURE_COLUMNS, ALL_FEATURE_COLUMNS):
+            raise ValueError("feature_columns debe ser FEATURE_COLUMNS o ALL_FEATURE_COLUMNS.")
         # Asegurarse de que X contiene solo las columnas de características esperadas
-        # Esto es vital para que el modelo entrene con las mismas características que usa para predecir
-        X_processed = X[FEATURE_COLUMNS]
+        # Esto es vital para que el modelo entrene con las mismas características que usa para predecir.
+        # Se entrena con un array en el orden de feature_columns (el mismo que usa preprocess_data),
+        # de modo que el modelo no guarda nombres de columnas y puede predecir sobre arrays de NumPy.
+        X_processed = X[feature_columns].to_numpy(dtype=FEATURE_DTYPE)
 
-        if self.model is None:
-            # Si no hay un modelo cargado, crea uno nuevo.
+        if self.model is None or not hasattr(self.model, "fit"):
+            # Si no hay un modelo cargado (o es una variante compilada, que no se puede re-ajustar), crea uno nuevo.
             self.model = RandomForestClassifier(random_state=42)
             print("TicWatchPredictor: Creando un nuevo RandomForestClassifier para el entrenamiento.")
         else:
             print("TicWatchPredictor: Re-ajustando el RandomForestClassifier existente con nuevos datos.")
 
         self.model.fit(X_processed, y)
+        self._compile()
         print("TicWatchPredictor: Entrenamiento/fine-tuning del modelo completado.")
 
-    def preprocess_data(self, data: TicWatchData) -> pd.DataFrame:
+    def _compile(self):
+        """
+        Compila el modelo a arrays planos (CompiledForest) para predecir sin el coste fijo de
+        scikit-learn por llamada. Si el modelo no se puede compilar (no entrenado u otro tipo
+        de estimador) se sigue usando el modelo de scikit-learn. Las variantes que ya se
+        descargan compiladas (app.models.model_variants) se usan tal cual como self.model.
+        """
+        self.compiled = None
+        if self.model is None or not hasattr(self.model, "estimators_"):
+            return
+        try:
+            self.compiled = CompiledForest.from_sklearn(self.model)
+        except TypeError as e:
+            print(f"TicWatchPredictor: El modelo no se puede compilar, se usará scikit-learn: {e}")
+
+    @property
+    def _estimator(self):
+        """Modelo con el que se predice: el compilado si existe, o el de scikit-learn."""
+        return self.compiled if self.compiled is not None else self.model
+
+    @property
+    def uses_window_features(self) -> bool:
+        """True si el modelo se entrenó con las características de ventana (ALL_FEATURE_COLUMNS)."""
+        return getattr(self.model, "n_features_in_", len(FEATURE_COLUMNS)) == len(ALL_FEATURE_COLUMNS)
+
+    @property
+    def feature_columns(self) -> list:
+        return ALL_FEATURE_COLUMNS if self.uses_window_features else FEATURE_COLUMNS
+
+    def _drop_feature_names(self):
+        """
+        Los modelos entrenados con un DataFrame guardan los nombres de las columnas y sklearn
+        emite un aviso en cada predicción hecha con un array de NumPy. Si los nombres coinciden
+        con FEATURE_COLUMNS o ALL_FEATURE_COLUMNS (mismo orden que preprocess_data) se descartan.
+        """
+        feature_names = getattr(self.model, "feature_names_in_", None)
+        if feature_names is None:
+            return
+        if list(feature_names) not in (FEATURE_COLUMNS, ALL_FEATURE_COLUMNS):
+            raise ValueError(f"El modelo se entrenó con columnas distintas de FEATURE_COLUMNS: {list(feature_names)}")
+        del self.model.feature_names_in_
+
+    def preprocess_data(self, data: TicWatchData) -> np.ndarray:
+        """
+        Pre-procesa los datos crudos del TicWatch en un vector de características
+        (array contiguo de forma (1, n_features)) en el orden de FEATURE_COLUMNS.
+        Se lee directamente de los campos del objeto Pydantic, sin pasar por Pandas.
+        Si el modelo usa características de ventana y la muestra llega sin el historial de
+        su sesión, se calculan como una ventana de una sola muestra.
+        """
+        if self.uses_window_features:
+            return SessionWindowState().update(data).reshape(1, -1)
+        features = np.fromiter(
+            (getattr(data, column) for column in FEATURE_COLUMNS),
+            dtype=FEATURE_DTYPE,
+            count=len(FEATURE_COLUMNS),
+        )
+        return features.reshape(1, -1)
+
+    def _as_features(self, data) -> np.ndarray:
         """
-        Pre-procesa los datos crudos del TicWatch en un DataFrame de Pandas
-        con las características esperadas por el modelo.
+        Acepta una muestra Pydantic o un vector/matriz ya pre-procesado y devuelve un array 2-D.
+        Los vectores de SessionFeatureStore (ALL_FEATURE_COLUMNS) se recortan a las columnas
+        crudas si el modelo no usa características de ventana.
         """
-        # Convertir el objeto Pydantic a un diccionario y luego a DataFrame
-        data_dict = data.model_dump() # Usa .model_dump() para Pydantic v2
-        
-        # Crear un DataFrame con una sola fila
-        df = pd.DataFrame([data_dict])
-        
-        # Seleccionar solo las columnas de características en el orden correcto
-        # Asegurarse de que todas las columnas existan, si no, rellenar con 0 o NaN
-        # FEATURE_COLUMNS debe estar correctamente definido en app.config
-        processed_df = df[FEATURE_COLUMNS]
-        
-        return processed_df
+        if isinstance(data, np.ndarray):
+            features = data.reshape(1, -1) if data.ndim == 1 else data
+            n_features = len(self.feature_columns)
+            return features[:, :n_features] if features.shape[1] > n_features else features
+        return self.preprocess_data(data)
 
-    def predict(self, data: TicWatchData) -> str:
+    def predict(self, data) -> str:
         """
         Realiza una predicción sobre el estado de actividad del usuario.
+        Acepta una muestra TicWatchData o el vector devuelto por preprocess_data.
         Este método asume que el modelo ya ha sido cargado en la instancia del predictor.
         """
         if self.model is None:
@@ -101,12 +193,49 @@ class TicWatchPredictor:
             # No se intenta cargar el modelo genérico directamente aquí.
             raise ValueError("No hay un modelo cargado en el predictor para realizar predicciones.")
 
-        processed_data = self.preprocess_data(data)
-        prediction_label = self.model.predict(processed_data)[0]
-        # prediction_proba = self.model.predict_proba(processed_data)[0] # Opcional, si necesitas las probabilidades
+        processed_data = self._as_features(data)
+        prediction_label = self._estimator.predict(processed_data)[0]
 
         return prediction_label
 
+    def predict_proba(self, data) -> dict:
+        """
+        Devuelve la probabilidad de cada estado de actividad para una muestra
+        (TicWatchData o vector de preprocess_data), como diccionario {estado: probabilidad}.
+        """
+        if self.model is None:
+            raise ValueError("No hay un modelo cargado en el predictor para realizar predicciones.")
+
+        processed_data = self._as_features(data)
+        probabilities = self._estimator.predict_proba(processed_data)[0]
+        return dict(zip(self.model.classes_.tolist(), probabilities.tolist()))
+
+    def preprocess_many(self, samples: list) -> np.ndarray:
+        """
+        Pre-procesa una lista de muestras del TicWatch en una matriz de características
+        (una fila por muestra, en el mismo orden) con las columnas de FEATURE_COLUMNS.
+        """
+        if self.uses_window_features:
+            return np.vstack([SessionWindowState().update(sample) for sample in samples])
+        features = np.empty((len(samples), len(FEATURE_COLUMNS)), dtype=FEATURE_DTYPE)
+        for row, sample in enumerate(samples):
+            features[row] = [getattr(sample, column) for column in FEATURE_COLUMNS]
+        return features
+
+    def predict_many(self, samples) -> list:
+        """
+        Predice el estado de actividad de varias muestras (lista de TicWatchData o matriz de
+        características) con una sola llamada al modelo. Devuelve las etiquetas en el mismo
+        orden que las muestras.
+        """
+        if self.model is None:
+            raise ValueError("No hay un modelo cargado en el predictor para realizar predicciones.")
+        if len(samples) == 0:
+            return []
+
+        processed_data = self._as_features(samples) if isinstance(samples, np.ndarray) else self.preprocess_many(samples)
+        return self._estimator.predict(processed_data).tolist()
+
     def get_model_bytes(self) -> bytes:
         """
         Serializa el modelo entrenado a un objeto de bytes.
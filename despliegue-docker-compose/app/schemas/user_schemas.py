@@ -5,4 +5,10 @@ class ModelMappingUpdate(BaseModel):
     Esquema para la actualización del mapeo de modelo de usuario.
     """
     model_path: str
-    model_type: str
\ No newline at end of file
+    model_type: str
+
+class TrainingWatermarkUpdate(BaseModel):
+    """
+    Esquema para guardar la marca de agua del último fine-tuning de un usuario.
+    """
+    trained_until: str
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
 import pandas as pd
 from app.data.database import get_user_data, insert_ticwatch_data
+from app.data.session_streams import get_labeled_session_streams
+from app.data.training_watermarks import get_pending_labeled_summary
 import sys
 import traceback
 
@@ -29,4 +31,39 @@ async def get_labeled_user_data(user_id: str):
     except Exception as e:
         print(f"ERROR en get_labeled_user_data para user {user_id}: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
-        raise HTTPException(status_code=500, detail=f"Error fetching labeled data: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error fetching labeled data: {e}")
+
+
+@router.get("/user/{user_id}/sessions")
+async def get_user_session_streams(user_id: str):
+    """
+    Endpoint para que el Fog Trainer obtenga todas las muestras (etiquetadas o no) de las
+    sesiones de un usuario que tienen alguna etiquetada, para calcular las características de
+    ventana sobre la sesión completa, como el Nodo Edge.
+    """
+    try:
+        df = get_labeled_session_streams(user_id)
+        if pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+            df['timestamp'] = df['timestamp'].astype(str)
+        # NaN no es JSON válido: las muestras sin etiqueta van con None
+        df = df.astype(object).where(df.notna(), None)
+        print(f"Session streams recuperados para el usuario {user_id}: {len(df)} filas.", file=sys.stderr)
+        return {"data": df.to_dict(orient="records")}
+    except Exception as e:
+        print(f"ERROR en get_user_session_streams para user {user_id}: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        raise HTTPException(status_code=500, detail=f"Error fetching session streams: {e}")
+
+
+@router.get("/labeled/pending")
+async def get_pending_labeled_data():
+    """
+    Endpoint para que el Fog Trainer recupere, al arrancar, cuántas muestras etiquetadas de
+    cada usuario no se han usado todavía para el fine-tuning (las posteriores a su marca de agua).
+    """
+    try:
+        return {"users": get_pending_labeled_summary()}
+    except Exception as e:
+        print(f"ERROR en get_pending_labeled_data: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        raise HTTPException(status_code=500, detail=f"Error fetching pending labeled data: {e}")
@@ -1,43 +1,101 @@
+import json
 import os
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.responses import FileResponse
+from app.config import DEFAULT_MODEL_TIER
 from cloud_node.api.dependencies import get_model_repository
 from cloud_node.model_repository import ModelRepository # Tipo para la dependencia
 
 router = APIRouter()
 
-# Endpoint para descargar el modelo genérico
+def model_file_response(request: Request, model_path: str, filename: str, model_repository: ModelRepository, tier: str = DEFAULT_MODEL_TIER):
+    """
+    Sirve un fichero de modelo con su ETag (hash del contenido). Si el cliente ya tiene esa
+    versión (cabecera If-None-Match), responde 304 sin cuerpo en lugar de reenviar el modelo.
+    La cabecera X-Model-Tier indica qué variante se ha servido.
+    """
+    etag = model_repository.get_model_etag(model_path)
+    headers = {"ETag": etag, "X-Model-Tier": tier}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    # Media type es importante para que el cliente sepa qué tipo de archivo recibe
+    return FileResponse(path=model_path, media_type='application/octet-stream', filename=filename, headers=headers)
+
+def resolve_variant(get_path, tier: str = None):
+    """
+    Devuelve (ruta, tier) de la variante pedida. Si esa variante no existe, o es anterior al
+    modelo por defecto (se entrenó con un modelo ya reemplazado), se sirve el modelo por
+    defecto, de modo que un nivel sin variante propia sigue pudiendo predecir.
+    """
+    try:
+        variant_path = get_path(tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    default_path = get_path(None)
+    if tier and tier != DEFAULT_MODEL_TIER and os.path.exists(variant_path):
+        if not os.path.exists(default_path) or os.path.getmtime(variant_path) >= os.path.getmtime(default_path):
+            return variant_path, tier
+    return default_path, DEFAULT_MODEL_TIER
+
+# Endpoint para descargar el modelo genérico (o su variante para un nivel: ?tier=edge)
 @router.get("/generic")
-async def get_generic_model(model_repository: ModelRepository = Depends(get_model_repository)):
-    model_path = model_repository.get_generic_model_path()
+async def get_generic_model(request: Request, tier: str = None, model_repository: ModelRepository = Depends(get_model_repository)):
+    model_path, served_tier = resolve_variant(model_repository.get_generic_model_path, tier)
     if os.path.exists(model_path):
-        # Media type es importante para que el cliente sepa qué tipo de archivo recibe
-        return FileResponse(path=model_path, media_type='application/octet-stream', filename='generic_activity_model.pkl')
+        return model_file_response(request, model_path, os.path.basename(model_path), model_repository, served_tier)
     else:
         raise HTTPException(status_code=404, detail="Generic model not found")
 
-# Endpoint para subir un modelo de usuario
+# Endpoint con las métricas (precisión, tamaño, latencia p99) de cada variante del modelo genérico
+@router.get("/generic/variants")
+async def get_generic_model_variants(model_repository: ModelRepository = Depends(get_model_repository)):
+    return model_repository.get_variant_metrics("generic_activity_model", is_generic=True)
+
+# Endpoint para subir un modelo de usuario (o su variante para un nivel: ?tier=edge)
 @router.post("/user/{user_id}")
-async def upload_user_model(user_id: str, model_file: UploadFile = File(...), model_repository: ModelRepository = Depends(get_model_repository)):
+async def upload_user_model(user_id: str, tier: str = None, model_file: UploadFile = File(...), metrics: str = Form(None),
+                            model_repository: ModelRepository = Depends(get_model_repository)):
     # Generar la ruta para guardar el modelo de usuario
-    save_path = model_repository.get_user_model_path(user_id)
+    try:
+        save_path = model_repository.get_user_model_path(user_id, tier)
+        variant_metrics = json.loads(metrics) if metrics else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Se escribe en un fichero temporal y se renombra al terminar, para que las descargas
+    # concurrentes (y su ETag) nunca vean un modelo a medio escribir
+    tmp_path = f"{save_path}.tmp"
 
     try:
         # Escribir el archivo recibido
-        with open(save_path, "wb") as buffer:
+        with open(tmp_path, "wb") as buffer:
             # chunk_size para manejar archivos grandes eficientemente
             while contents := await model_file.read(1024 * 1024): # Lee en bloques de 1MB
                 buffer.write(contents)
+        os.replace(tmp_path, save_path)
+        if not tier or tier == DEFAULT_MODEL_TIER:
+            # Las variantes del modelo anterior ya no corresponden al nuevo
+            model_repository.discard_variants(save_path)
+        if variant_metrics is not None:
+            model_repository.save_variant_metrics(save_path, variant_metrics)
 
-        return {"message": f"User model for {user_id} uploaded successfully", "path": save_path}
+        return {"message": f"User model for {user_id} uploaded successfully", "path": save_path, "tier": tier or DEFAULT_MODEL_TIER}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save user model: {str(e)}")
 
-# Endpoint para descargar un modelo de usuario
+# Endpoint para descargar un modelo de usuario (o su variante para un nivel: ?tier=edge)
 @router.get("/user/{user_id}")
-async def get_user_model(user_id: str, model_repository: ModelRepository = Depends(get_model_repository)):
-    model_path = model_repository.get_user_model_path(user_id)
+async def get_user_model(user_id: str, request: Request, tier: str = None, model_repository: ModelRepository = Depends(get_model_repository)):
+    model_path, served_tier = resolve_variant(lambda variant: model_repository.get_user_model_path(user_id, variant), tier)
     if os.path.exists(model_path):
-        return FileResponse(path=model_path, media_type='application/octet-stream', filename=f'{user_id}_activity_model.pkl')
+        return model_file_response(request, model_path, os.path.basename(model_path), model_repository, served_tier)
     else:
-        raise HTTPException(status_code=404, detail=f"User model for {user_id} not found")
\ No newline at end of file
+        raise HTTPException(status_code=404, detail=f"User model for {user_id} not found")
+
+# Endpoint con las métricas de cada variante del modelo de un usuario
+@router.get("/user/{user_id}/variants")
+async def get_user_model_variants(user_id: str, model_repository: ModelRepository = Depends(get_model_repository)):
+    variants = model_repository.get_variant_metrics(user_id, is_generic=False)
+    if not variants:
+        raise HTTPException(status_code=404, detail=f"User model for {user_id} not found")
+    return variants
@@ -1,7 +1,9 @@
 # cloud_node/api/routes/users.py
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, BackgroundTasks
 from app.data.database import get_user_model_mapping, update_user_model_mapping
-from app.schemas.user_schemas import ModelMappingUpdate
+from app.data.model_events import publish_model_updated
+from app.data.training_watermarks import set_training_watermark
+from app.schemas.user_schemas import ModelMappingUpdate, TrainingWatermarkUpdate
 from app.config import GENERIC_MODEL_PATH
 
 router = APIRouter()
@@ -25,20 +27,23 @@ async def update_model_mapping(
     user_id: str,
     # CORRECCIÓN CLAVE: Usar un modelo Pydantic para el cuerpo de la petición
     # FastAPI parseará automáticamente el JSON del cuerpo en este objeto.
+    background_tasks: BackgroundTasks,
     update_data: ModelMappingUpdate = Body(...) # <-- CAMBIO AQUÍ
 ):
     """
     Endpoint para actualizar el mapeo del modelo de un usuario.
+    Tras actualizarlo, anuncia el cambio a los Nodos Edge para que recarguen el modelo.
     """
     try:
         # Acceder a los datos desde update_data
         update_user_model_mapping(user_id, update_data.model_path, update_data.model_type)
+        background_tasks.add_task(publish_model_updated, user_id, update_data.model_type)
         return {"message": f"Model mapping for user {user_id} updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating model mapping: {e}")
 
 @router.post("/{user_id}/set_generic_model")
-async def set_generic_model(user_id: str):
+async def set_generic_model(user_id: str, background_tasks: BackgroundTasks):
     """
     Endpoint para establecer el modelo del usuario como el modelo genérico.
     """
@@ -47,6 +52,19 @@ async def set_generic_model(user_id: str):
         generic_model_path = GENERIC_MODEL_PATH
         generic_model_type = "generic"
         update_user_model_mapping(user_id, generic_model_path, generic_model_type)
+        background_tasks.add_task(publish_model_updated, user_id, generic_model_type)
         return {"message": f"Model mapping for user {user_id} set to generic model successfully"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error setting generic model: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error setting generic model: {e}")
+
+@router.put("/{user_id}/training_watermark")
+async def update_training_watermark(user_id: str, update_data: TrainingWatermarkUpdate = Body(...)):
+    """
+    Endpoint para guardar la marca de agua del último fine-tuning de un usuario (el timestamp
+    de la muestra más reciente con la que se entrenó su modelo).
+    """
+    try:
+        set_training_watermark(user_id, update_data.trained_until)
+        return {"message": f"Training watermark for user {user_id} updated successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating training watermark: {e}")
@@ -1,6 +1,8 @@
+import hashlib
+import json
 import os
 import pickle
-from app.config import GENERIC_MODEL_PATH, USER_MODELS_DIR, MODELS_DIR
+from app.config import GENERIC_MODEL_PATH, USER_MODELS_DIR, MODELS_DIR, MODEL_TIERS, DEFAULT_MODEL_TIER
 
 class ModelRepository:
     def __init__(self):
@@ -10,25 +12,85 @@ class ModelRepository:
         # Asegurarse de que los directorios existen al inicializar
         os.makedirs(self.models_dir, exist_ok=True)
         os.makedirs(self.user_models_dir, exist_ok=True)
+        # Hash del contenido de cada modelo, indexado por ruta y validado con (inodo, mtime, tamaño)
+        self._digests = {}
         print(f"ModelRepository initialized. MODELS_DIR: {self.models_dir}")
 
-    def get_generic_model_path(self):
-        return self.generic_model_path
+    @staticmethod
+    def _variant_path(path: str, tier: str = None):
+        # La variante del tier por defecto (cloud) es el propio modelo: mantiene su ruta de siempre
+        if not tier or tier == DEFAULT_MODEL_TIER:
+            return path
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier '{tier}'. Expected one of {MODEL_TIERS}.")
+        root, ext = os.path.splitext(path)
+        return f"{root}.{tier}{ext}"
 
-    def get_user_model_path(self, user_id: str):
-        return os.path.join(self.user_models_dir, f'{user_id}_activity_model.pkl')
+    def get_generic_model_path(self, tier: str = None):
+        return self._variant_path(self.generic_model_path, tier)
 
-    def save_model(self, model, identifier: str, is_generic: bool = True):
-        path = self.get_generic_model_path() if is_generic else self.get_user_model_path(identifier)
+    def get_user_model_path(self, user_id: str, tier: str = None):
+        return self._variant_path(os.path.join(self.user_models_dir, f'{user_id}_activity_model.pkl'), tier)
+
+    def save_model(self, model, identifier: str, is_generic: bool = True, tier: str = None):
+        path = self.get_generic_model_path(tier) if is_generic else self.get_user_model_path(identifier, tier)
         try:
-            with open(path, 'wb') as f:
-                pickle.dump(model, f)
+            # Escribir en un fichero temporal y renombrarlo: quien descargue el modelo mientras
+            # se guarda recibe la versión anterior completa, nunca un fichero a medias.
+            # Las variantes ya serializadas (bytes) se escriben tal cual
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                if isinstance(model, bytes):
+                    f.write(model)
+                else:
+                    pickle.dump(model, f)
+            os.replace(tmp_path, path)
             print(f"Model successfully written to {path}")
+            if not tier or tier == DEFAULT_MODEL_TIER:
+                self.discard_variants(path)
             return path
         except Exception as e:
             print(f"Error writing model to {path}: {e}")
             raise
 
+    def discard_variants(self, model_path: str):
+        """
+        Borra las variantes (y sus métricas) de un modelo por defecto que se acaba de reemplazar:
+        se entrenaron con el modelo anterior y, mientras no se suban las nuevas, se sirve el
+        modelo por defecto a todos los niveles.
+        """
+        for tier in MODEL_TIERS:
+            if tier == DEFAULT_MODEL_TIER:
+                continue
+            variant_path = self._variant_path(model_path, tier)
+            for path in (variant_path, f"{variant_path}.metrics.json"):
+                try:
+                    os.remove(path)
+                    print(f"Removed stale model variant {path}")
+                except FileNotFoundError:
+                    pass
+
+    def save_variant_metrics(self, model_path: str, metrics: dict):
+        """Guarda las métricas de una variante (precisión, tamaño, latencia p99) junto al modelo."""
+        tmp_path = f"{model_path}.metrics.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, f"{model_path}.metrics.json")
+
+    def get_variant_metrics(self, identifier: str, is_generic: bool = True) -> dict:
+        """Devuelve las métricas registradas de cada variante existente, indexadas por tier."""
+        variants = {}
+        for tier in MODEL_TIERS:
+            path = self.get_generic_model_path(tier) if is_generic else self.get_user_model_path(identifier, tier)
+            if not os.path.exists(path):
+                continue
+            metrics = {"size_bytes": os.path.getsize(path)}
+            if os.path.exists(f"{path}.metrics.json"):
+                with open(f"{path}.metrics.json") as f:
+                    metrics = json.load(f)
+            variants[tier] = metrics
+        return variants
+
     def load_model(self, identifier: str, is_generic: bool = True):
         path = self.get_generic_model_path() if is_generic else self.get_user_model_path(identifier)
         if not os.path.exists(path):
@@ -41,4 +103,23 @@ class ModelRepository:
             return model
         except Exception as e:
             print(f"Error loading model from {path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def get_model_etag(self, path: str) -> str:
+        """
+        Devuelve el ETag (entre comillas) de un fichero de modelo: el SHA-256 de su contenido.
+        El hash se recalcula solo cuando cambian el fichero (los modelos se guardan con
+        os.replace, que crea un inodo nuevo), su fecha de modificación o su tamaño.
+        """
+        stat = os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()}"'
+        self._digests[path] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), etag)
+        return etag
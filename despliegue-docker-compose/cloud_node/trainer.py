@@ -6,8 +6,12 @@ import sys # Importar sys
 
 from app.models.ticwatch_predictor import TicWatchPredictor
 from app.data.database import get_all_training_data, create_tables, update_user_model_mapping
-from app.config import FEATURE_COLUMNS, GENERIC_MODEL_PATH
+from app.config import FEATURE_COLUMNS, GENERIC_MODEL_PATH, TRAIN_WITH_WINDOW_FEATURES, CLOUD_MODEL_VARIANT_TIERS
+from app.features.window_features import ALL_FEATURE_COLUMNS, labeled_window_training_data
+from app.data.session_streams import get_labeled_session_streams
+from app.models.model_variants import train_variant
 from cloud_node.model_repository import ModelRepository
+from app.data.model_events import publish_model_updated
 
 MIN_GLOBAL_SAMPLES_FOR_RETRAIN = 500
 
@@ -29,7 +33,19 @@ def retrain_generic_model():
         print(f"Número de muestras globales ({len(all_labeled_data)}) por debajo del umbral ({MIN_GLOBAL_SAMPLES_FOR_RETRAIN}). Saltando re-entrenamiento.", file=sys.stderr)
         return
 
-    X_global = all_labeled_data[FEATURE_COLUMNS]
+    # Las características de ventana se calculan con el mismo código que usa el Nodo Edge al predecir
+    feature_columns = FEATURE_COLUMNS
+    if TRAIN_WITH_WINDOW_FEATURES:
+        # Sobre las sesiones completas (también las muestras sin etiquetar, que el Edge también
+        # ve al predecir); después se entrena solo con las etiquetadas
+        try:
+            all_labeled_data = labeled_window_training_data(get_labeled_session_streams())
+        except Exception as e:
+            print(f"ERROR: Failed to get session streams for window features: {e}", file=sys.stderr)
+            return
+        feature_columns = ALL_FEATURE_COLUMNS
+
+    X_global = all_labeled_data[feature_columns]
     y_global = all_labeled_data['estado_real']
 
     print(f"Datos cargados para entrenamiento global: {len(X_global)} muestras.", file=sys.stderr)
@@ -37,11 +53,24 @@ def retrain_generic_model():
 
     predictor = TicWatchPredictor()
     try:
-        predictor.train_model(X_global, y_global)
+        predictor.train_model(X_global, y_global, feature_columns)
         print("Modelo genérico entrenado. Guardando...", file=sys.stderr)
         model_repo = ModelRepository()
         new_generic_model_path = model_repo.save_model(predictor.model, "generic_activity_model", is_generic=True)
         print(f"[{datetime.now()}] Cloud Trainer: Modelo genérico re-entrenado y guardado en: {new_generic_model_path}", file=sys.stderr)
+        # Variantes del modelo genérico para los niveles con menos recursos (Edge, Fog)
+        for tier in CLOUD_MODEL_VARIANT_TIERS:
+            try:
+                variant_bytes, metrics = train_variant(all_labeled_data, y_global, tier, feature_columns)
+                variant_path = model_repo.save_model(variant_bytes, "generic_activity_model", is_generic=True, tier=tier)
+                model_repo.save_variant_metrics(variant_path, metrics)
+                print(f"Cloud Trainer: Variante '{tier}' guardada en {variant_path}: {metrics}", file=sys.stderr)
+            except Exception as e:
+                # save_model ya borró la variante anterior: ese nivel recibe el modelo genérico
+                print(f"ERROR generando la variante '{tier}' del modelo genérico: {e}. "
+                      f"Se servirá el modelo por defecto.", file=sys.stderr)
+        # Anunciar el nuevo modelo genérico para que los Nodos Edge lo recarguen sin reiniciarse
+        publish_model_updated(None, "generic")
     except Exception as e:
         print(f"ERROR durante el entrenamiento o guardado del modelo genérico: {e}", file=sys.stderr)
         # No sys.exit(1) aquí, ya que queremos que el bucle continúe si es un problema temporal.
@@ -0,0 +1,531 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable
+
+import pika
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.config import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS
+from app.data.ingest_partitions import (INGEST_PARTITIONED_EXCHANGE, INGESTOR_MEMBERS_EXCHANGE, assign_partitions,
+                                       declare_partitions, partition_queue)
+from app.data.wire_format import decode_message
+from data_ingestor.dedup import RecentKeyFilter
+from data_ingestor.notifications import NotificationCoalescer
+
+# Métricas del Data Ingestor (ver INGESTOR_METRICS_PORT)
+QUEUE_DEPTH = Gauge("ingestor_queue_depth", "Mensajes esperando en la cola de ingesta (lag del consumidor).")
+END_TO_END_LAG = Histogram(
+    "ingestor_end_to_end_lag_seconds", "Tiempo desde que el Nodo Edge publica un lote hasta que está guardado en la base de datos.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+COMMIT_SECONDS = Histogram(
+    "ingestor_commit_duration_seconds", "Duración del guardado de un micro-lote en la base de datos.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+# result: stored, malformed (descartadas), failed (el guardado falló y se devuelven a la cola) o
+# dead_letter (no se pueden guardar ni por separado y se envían al exchange de mensajes muertos)
+SAMPLES = Counter("ingestor_samples", "Muestras procesadas por el Data Ingestor.", ["result"])
+# stage: filter (descartadas por la caché de claves recientes) o database (ON CONFLICT DO NOTHING)
+DUPLICATES = Counter("ingestor_duplicates", "Muestras duplicadas descartadas por el Data Ingestor.", ["stage"])
+NOTIFICATIONS = Counter("ingestor_fog_notifications", "Notificaciones de datos etiquetados nuevos publicadas para el Fog.")
+# 1 si ticwatch_data no tiene el índice único de la clave natural (los duplicados se filtran con WHERE NOT EXISTS)
+NATURAL_KEY_INDEX_MISSING = Gauge("ingestor_natural_key_index_missing", "Falta el índice único (user_id, session_id, timestamp) de ticwatch_data.")
+OWNED_PARTITIONS = Gauge("ingestor_owned_partitions", "Particiones de la cola de ingesta que consume esta réplica.")
+
+
+def default_connection_factory() -> pika.BlockingConnection:
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.BlockingConnection(
+        pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials, heartbeat=600)
+    )
+
+
+def prepare_samples(samples: list) -> list:
+    """
+    Valida las muestras de un lote: deben tener user_id y timestamp, que se convierte a
+    datetime. Las muestras no válidas se descartan (con un aviso en el log).
+    """
+    prepared = []
+    for sample in samples:
+        if not isinstance(sample, dict) or not sample.get('user_id') or not sample.get('timestamp'):
+            print(f"[{datetime.now()}] Data Ingestor: Skipping malformed message: {sample}", file=sys.stderr)
+            continue
+        timestamp = sample['timestamp']
+        if isinstance(timestamp, str):
+            try:
+                sample['timestamp'] = datetime.fromisoformat(timestamp)
+            except ValueError as e:
+                print(f"[{datetime.now()}] Data Ingestor: Error parsing timestamp '{timestamp}' for user {sample['user_id']}: {e}", file=sys.stderr)
+                continue
+        prepared.append(sample)
+    return prepared
+
+
+class IngestConsumer:
+    """
+    Consumidor continuo (basic_consume) de la cola de ingesta del Data Ingestor.
+
+    RabbitMQ entrega como mucho prefetch_count mensajes sin confirmar, lo que acota la memoria
+    aunque la cola acumule retraso. Los mensajes (lotes del Nodo Edge, en JSON o MessagePack
+    según su content type) se agrupan en micro-lotes de hasta max_batch_size muestras o
+    flush_interval segundos desde el primero, y cada micro-lote se guarda con
+    store_batch(muestras). Solo después de guardarlo se confirman sus mensajes (un único ack
+    múltiple) y se llama a notify(user_ids); si el guardado falla se reintenta con espera
+    creciente hasta max_store_attempts veces.
+
+    Si sigue fallando, el micro-lote se divide por la mitad (y cada mitad que falla, otra vez)
+    para aislar las muestras que no se pueden guardar (una restricción violada, un valor que
+    COPY rechaza): el resto se guarda y esas se publican en dead_letter_exchange, de modo que
+    una fila defectuosa no detiene la cola. Si no se puede guardar ninguna parte del lote (la
+    base de datos no está disponible), o no hay dead_letter_exchange, los mensajes vuelven a la cola.
+
+    Con notifications (NotificationCoalescer), las muestras etiquetadas guardadas se agrupan
+    por usuario y, al terminar la ventana de cada uno, se publica en notification_queue una
+    notificación con el resumen de lo que ha llegado (lo que queda pendiente se publica al parar).
+
+    La entrega es al menos una vez, así que un micro-lote puede traer muestras ya guardadas:
+    las que están en recent_keys (RecentKeyFilter) se descartan antes de guardar, y
+    store_batch descarta el resto y retorna las muestras que ha insertado de verdad (None si
+    las ha insertado todas). Solo esas cuentan como guardadas y llegan a notify y notifications.
+
+    Cada lag_interval segundos se consulta la profundidad de la cola (lag del consumidor), y
+    el retraso extremo a extremo se mide con la cabecera published_at que añade el Nodo Edge.
+    Todo se ejecuta en el hilo de run() (pika no es thread-safe); ante una desconexión se
+    reconecta con espera creciente y los mensajes sin confirmar se vuelven a entregar.
+    """
+
+    def __init__(self, queue_name: str, store_batch: Callable[[list], list], notify: Callable[[set], None] = None,
+                 recent_keys: RecentKeyFilter = None, notifications: NotificationCoalescer = None,
+                 notification_queue: str = None, dead_letter_exchange: str = None, dead_letter_queue: str = None,
+                 prefetch_count: int = 50, max_batch_size: int = 1000, flush_interval: float = 0.05,
+                 max_store_attempts: int = 5, retry_delay: float = 0.5, max_retry_delay: float = 30,
+                 lag_interval: float = 10, reconnect_delay: float = 5, max_reconnect_delay: float = 60,
+                 connection_factory: Callable[[], pika.BlockingConnection] = default_connection_factory,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.queue_name = queue_name
+        self.store_batch = store_batch
+        self.notify = notify
+        self.recent_keys = recent_keys
+        self.notifications = notifications
+        self.notification_queue = notification_queue
+        self.dead_letter_exchange = dead_letter_exchange
+        self.dead_letter_queue = dead_letter_queue
+        self.prefetch_count = prefetch_count
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_store_attempts = max_store_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lag_interval = lag_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connection_factory = connection_factory
+        self._sleep = sleep
+        self._stopping = threading.Event()
+        self._connection = None
+        self._channel = None
+        self._flush_timer = None
+        # Micro-lote en curso: muestras, etiqueta del último mensaje y published_at de cada mensaje
+        self._samples = []
+        self._last_tag = None
+        self._published_at = []
+        # Contadores para el log
+        self.stored_samples = 0
+        self.duplicate_samples = 0
+        self.committed_batches = 0
+        self.failed_batches = 0
+        self.dead_letter_samples = 0
+        self.published_notifications = 0
+        self.queue_depth = None
+        self.last_lag_seconds = None
+
+    def run(self):
+        """Consume hasta que se llama a stop(), reconectando si se pierde la conexión."""
+        delay = self.reconnect_delay
+        while not self._stopping.is_set():
+            try:
+                self._connection = self.connection_factory()
+                self._channel = self._connection.channel()
+                # global_qos: el límite es para todo el canal, aunque se consuma de varias colas
+                self._channel.basic_qos(prefetch_count=self.prefetch_count, global_qos=True)
+                self._subscribe()
+                self._connection.call_later(0, self._report_lag)
+                if self.notifications is not None:
+                    self._channel.queue_declare(queue=self.notification_queue, durable=True)
+                    self._connection.call_later(self._notification_check_interval(), self._on_notification_timer)
+                if self.dead_letter_exchange:
+                    self._channel.exchange_declare(exchange=self.dead_letter_exchange, exchange_type="fanout", durable=True)
+                    if self.dead_letter_queue:
+                        self._channel.queue_declare(queue=self.dead_letter_queue, durable=True)
+                        self._channel.queue_bind(exchange=self.dead_letter_exchange, queue=self.dead_letter_queue)
+                delay = self.reconnect_delay
+                self._channel.start_consuming()
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                print(f"[{datetime.now()}] Data Ingestor: Consumer disconnected: {e}. Reconnecting in {delay} seconds...", file=sys.stderr)
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+            finally:
+                # Lo que no se ha confirmado lo vuelve a entregar RabbitMQ
+                self._flush_timer = None
+                self._reset_batch()
+
+    def stop(self):
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None and connection.is_open:
+            connection.add_callback_threadsafe(self._stop_consuming)
+
+    def stats(self) -> dict:
+        return {
+            "stored_samples": self.stored_samples,
+            "duplicate_samples": self.duplicate_samples,
+            "committed_batches": self.committed_batches,
+            "failed_batches": self.failed_batches,
+            "dead_letter_samples": self.dead_letter_samples,
+            "published_notifications": self.published_notifications,
+            "queue_depth": self.queue_depth,
+            "last_lag_seconds": self.last_lag_seconds,
+        }
+
+    def _subscribe(self):
+        self._channel.queue_declare(queue=self.queue_name, durable=True)
+        self._channel.basic_consume(queue=self.queue_name, on_message_callback=self._on_message)
+        print(f"[{datetime.now()}] Data Ingestor: Consuming from '{self.queue_name}' (prefetch {self.prefetch_count}, "
+              f"micro-batches of up to {self.max_batch_size} samples).", file=sys.stderr)
+
+    def _queue_depth(self) -> int:
+        return self._channel.queue_declare(queue=self.queue_name, durable=True, passive=True).method.message_count
+
+    def _stop_consuming(self):
+        self._flush()
+        self._publish_notifications(force=True)
+        self._channel.stop_consuming()
+        self._connection.close()
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            samples = decode_message(body, properties.content_type)
+        except ValueError as e:
+            # Un mensaje que no se puede decodificar no se podrá procesar nunca: se descarta
+            SAMPLES.labels("malformed").inc()
+            print(f"[{datetime.now()}] Data Ingestor: Discarding undecodable message: {e}", file=sys.stderr)
+            if self._last_tag is None:
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+            else:
+                # El ack múltiple del micro-lote en curso lo confirmará junto con los demás
+                self._last_tag = method.delivery_tag
+            return
+
+        self._samples.extend(samples)
+        self._last_tag = method.delivery_tag
+        headers = properties.headers or {}
+        if headers.get("published_at") is not None:
+            self._published_at.append(float(headers["published_at"]))
+
+        if len(self._samples) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = self._connection.call_later(self.flush_interval, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_timer = None
+        self._flush()
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._connection.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        if self._last_tag is None:
+            return
+        samples, last_tag, published_at = self._samples, self._last_tag, self._published_at
+        self._reset_batch()
+
+        prepared = prepare_samples(samples)
+        SAMPLES.labels("malformed").inc(len(samples) - len(prepared))
+        if self.recent_keys is not None:
+            prepared, duplicates = self.recent_keys.filter(prepared)
+            self._count_duplicates("filter", duplicates)
+        inserted = self._store_with_retry(prepared) if prepared else []
+        rejected = []
+        if inserted is None and self.dead_letter_exchange:
+            inserted, rejected = self._store_isolating_failures(prepared)
+            if rejected and not self._dead_letter(rejected):
+                inserted = None
+        if inserted is None:
+            # Lo que sí se haya guardado se descartará como duplicado en la nueva entrega
+            self.failed_batches += 1
+            SAMPLES.labels("failed").inc(len(prepared))
+            self._channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+            return
+
+        self._channel.basic_ack(delivery_tag=last_tag, multiple=True)
+        if rejected:
+            rejected_ids = {id(sample) for sample, _ in rejected}
+            prepared = [sample for sample in prepared if id(sample) not in rejected_ids]
+            self.dead_letter_samples += len(rejected)
+            SAMPLES.labels("dead_letter").inc(len(rejected))
+        if self.recent_keys is not None:
+            self.recent_keys.add_all(prepared)
+        self._count_duplicates("database", len(prepared) - len(inserted))
+        committed_at = time.time()
+        for published in published_at:
+            END_TO_END_LAG.observe(max(0.0, committed_at - published))
+        if published_at:
+            self.last_lag_seconds = round(committed_at - min(published_at), 3)
+        self.stored_samples += len(inserted)
+        self.committed_batches += 1
+        SAMPLES.labels("stored").inc(len(inserted))
+
+        # Solo se avisa al Fog de las muestras nuevas: los duplicados ya se notificaron
+        if self.notifications is not None and inserted:
+            self.notifications.add(inserted)
+        if self.notify is not None and inserted:
+            try:
+                self.notify({sample['user_id'] for sample in inserted})
+            except Exception as e:
+                print(f"[{datetime.now()}] Data Ingestor: Error publishing notifications: {e}", file=sys.stderr)
+
+    def _count_duplicates(self, stage: str, duplicates: int):
+        if duplicates > 0:
+            self.duplicate_samples += duplicates
+            DUPLICATES.labels(stage).inc(duplicates)
+
+    def _store_with_retry(self, samples: list):
+        """Muestras insertadas por store_batch (todas si no retorna nada), o None si no se pudo guardar."""
+        delay = self.retry_delay
+        for attempt in range(1, self.max_store_attempts + 1):
+            try:
+                with COMMIT_SECONDS.time():
+                    inserted = self.store_batch(samples)
+                return samples if inserted is None else inserted
+            except Exception as e:
+                print(f"[{datetime.now()}] Data Ingestor: Error storing batch of {len(samples)} samples "
+                      f"(attempt {attempt}/{self.max_store_attempts}): {e}", file=sys.stderr)
+                if attempt < self.max_store_attempts:
+                    # Se bloquea el consumo mientras tanto: prefetch_count acota lo que queda en memoria
+                    self._sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+        return None
+
+    def _store_isolating_failures(self, samples: list):
+        """
+        Tras agotar los reintentos, guarda el lote por mitades para aislar las muestras que no
+        se pueden guardar. Retorna (insertadas, [(muestra, error)]), o (None, []) si no se ha
+        podido guardar ninguna parte (la causa no son las muestras sino la base de datos).
+        """
+        if len(samples) < 2:
+            return None, []
+        inserted, rejected, stored_parts = [], [], 0
+        middle = len(samples) // 2
+        pending = [samples[middle:], samples[:middle]]
+        while pending:
+            part = pending.pop()
+            try:
+                with COMMIT_SECONDS.time():
+                    result = self.store_batch(part)
+            except Exception as e:
+                if len(part) == 1:
+                    rejected.append((part[0], e))
+                else:
+                    middle = len(part) // 2
+                    pending.extend([part[middle:], part[:middle]])
+                continue
+            stored_parts += 1
+            inserted.extend(part if result is None else result)
+        if not stored_parts:
+            return None, []
+        print(f"[{datetime.now()}] Data Ingestor: Isolated {len(rejected)} of {len(samples)} samples that cannot be stored.", file=sys.stderr)
+        return inserted, rejected
+
+    def _dead_letter(self, rejected: list) -> bool:
+        """Publica en dead_letter_exchange las muestras que no se pueden guardar. Retorna si se publicaron."""
+        body = [{"sample": sample, "error": f"{type(error).__name__}: {error}"} for sample, error in rejected]
+        try:
+            self._channel.basic_publish(
+                exchange=self.dead_letter_exchange,
+                routing_key=self.queue_name,
+                body=json.dumps(body, default=str),
+                properties=pika.BasicProperties(content_type="application/json", delivery_mode=2),
+            )
+        except Exception as e:
+            print(f"[{datetime.now()}] Data Ingestor: Could not dead-letter {len(rejected)} samples: {e}", file=sys.stderr)
+            return False
+        for sample, error in rejected:
+            print(f"[{datetime.now()}] Data Ingestor: Dead-lettered sample of user {sample.get('user_id')} at "
+                  f"{sample.get('timestamp')} to '{self.dead_letter_exchange}': {error}", file=sys.stderr)
+        return True
+
+    def _notification_check_interval(self) -> float:
+        # Una ventana termina como mucho un segundo (o una ventana, si es más corta) tarde
+        return max(0.01, min(1.0, self.notifications.window_seconds))
+
+    def _on_notification_timer(self):
+        self._publish_notifications()
+        if not self._stopping.is_set():
+            self._connection.call_later(self._notification_check_interval(), self._on_notification_timer)
+
+    def _publish_notifications(self, force: bool = False):
+        if self.notifications is None:
+            return
+        for message in self.notifications.pop_due(force):
+            try:
+                self._channel.basic_publish(
+                    exchange='',
+                    routing_key=self.notification_queue,
+                    body=json.dumps(message),
+                    properties=pika.BasicProperties(content_type="application/json", delivery_mode=2),
+                )
+            except Exception as e:
+                print(f"[{datetime.now()}] Data Ingestor: Error publishing notification for user {message['user_id']}: {e}", file=sys.stderr)
+                continue
+            self.published_notifications += 1
+            NOTIFICATIONS.inc()
+            print(f"[{datetime.now()}] Data Ingestor: Notified '{self.notification_queue}' of {message['new_labeled_samples']} "
+                  f"new labeled samples for user {message['user_id']} up to {message['max_timestamp']}.", file=sys.stderr)
+
+    def _report_lag(self):
+        try:
+            self.queue_depth = self._queue_depth()
+            QUEUE_DEPTH.set(self.queue_depth)
+            print(f"[{datetime.now()}] Data Ingestor: {self.queue_depth} messages waiting in '{self.queue_name}', "
+                  f"{self.stored_samples} samples stored, {self.duplicate_samples} duplicates dropped, "
+                  f"last end-to-end lag {self.last_lag_seconds}s.", file=sys.stderr)
+        except Exception as e:
+            print(f"[{datetime.now()}] Data Ingestor: Could not read depth of '{self.queue_name}': {e}", file=sys.stderr)
+        if not self._stopping.is_set():
+            self._connection.call_later(self.lag_interval, self._report_lag)
+
+    def _reset_batch(self):
+        self._samples = []
+        self._last_tag = None
+        self._published_at = []
+
+
+class PartitionedIngestConsumer(IngestConsumer):
+    """
+    Consumidor del modo particionado de la cola de ingesta (ver app.data.ingest_partitions).
+
+    Cada réplica publica un heartbeat cada heartbeat_interval segundos en un exchange fanout y
+    mantiene la lista de réplicas vivas (las que no se oyen en member_timeout segundos se dan
+    por caídas; las que paran de forma ordenada avisan al salir). Con esa lista, cada réplica
+    calcula las particiones que le corresponden (assign_partitions) y solo consume de ellas:
+    cuando una réplica entra o sale, las demás sueltan o asumen particiones. Antes de soltar
+    una partición se guarda y confirma el micro-lote en curso, y como las colas son de
+    consumidor activo único, la nueva dueña no recibe mensajes hasta que la anterior se da de
+    baja, así que se mantiene el orden de las muestras de cada usuario.
+    """
+
+    def __init__(self, queue_name: str, store_batch: Callable[[list], list], partitions: int, member_id: str = None,
+                 heartbeat_interval: float = 2, member_timeout: float = 10, clock: Callable[[], float] = time.monotonic, **kwargs):
+        super().__init__(queue_name, store_batch, **kwargs)
+        self.partitions = partitions
+        self.member_id = member_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_interval = heartbeat_interval
+        self.member_timeout = member_timeout
+        self._clock = clock
+        self._members = {}  # réplica -> instante (clock) de su último heartbeat
+        self._consumer_tags = {}  # partición -> consumer tag
+        self._assigned = False
+        self.owned_partitions = set()
+        self.rebalances = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(member_id=self.member_id, members=len(self._members) + 1,
+                     owned_partitions=sorted(self.owned_partitions), rebalances=self.rebalances)
+        return stats
+
+    def _subscribe(self):
+        declare_partitions(self._channel, self.queue_name, self.partitions)
+        self._channel.exchange_declare(exchange=INGESTOR_MEMBERS_EXCHANGE, exchange_type="fanout", durable=True)
+        members_queue = self._channel.queue_declare(queue="", exclusive=True).method.queue
+        self._channel.queue_bind(exchange=INGESTOR_MEMBERS_EXCHANGE, queue=members_queue)
+        self._channel.basic_consume(queue=members_queue, on_message_callback=self._on_member_message, auto_ack=True)
+        # Tras una reconexión se parte de cero: los consumidores anteriores ya no existen
+        self._members = {}
+        self._consumer_tags = {}
+        self._assigned = False
+        self.owned_partitions = set()
+        self._heartbeat()
+        # Antes del primer reparto se espera a oír a las demás réplicas
+        self._connection.call_later(self.heartbeat_interval * 2, self._rebalance)
+        print(f"[{datetime.now()}] Data Ingestor: Member {self.member_id} joined partitioned ingestion "
+              f"({self.partitions} partitions on '{INGEST_PARTITIONED_EXCHANGE}').", file=sys.stderr)
+
+    def _queue_depth(self) -> int:
+        return sum(
+            self._channel.queue_declare(queue=partition_queue(self.queue_name, partition), durable=True, passive=True).method.message_count
+            for partition in self.owned_partitions
+        )
+
+    def _stop_consuming(self):
+        try:
+            self._publish_membership("leave")
+        except Exception as e:
+            print(f"[{datetime.now()}] Data Ingestor: Could not announce leave of {self.member_id}: {e}", file=sys.stderr)
+        super()._stop_consuming()
+
+    def _publish_membership(self, event: str):
+        self._channel.basic_publish(
+            exchange=INGESTOR_MEMBERS_EXCHANGE,
+            routing_key="",
+            body=json.dumps({"member": self.member_id, "event": event}),
+            properties=pika.BasicProperties(content_type="application/json"),
+        )
+
+    def _heartbeat(self):
+        if self._stopping.is_set():
+            return
+        self._publish_membership("alive")
+        now = self._clock()
+        expired = [member for member, last_seen in self._members.items() if now - last_seen > self.member_timeout]
+        for member in expired:
+            del self._members[member]
+            print(f"[{datetime.now()}] Data Ingestor: Member {member} timed out.", file=sys.stderr)
+        if expired and self._assigned:
+            self._rebalance()
+        self._connection.call_later(self.heartbeat_interval, self._heartbeat)
+
+    def _on_member_message(self, channel, method, properties, body):
+        try:
+            message = json.loads(body)
+            member, event = message["member"], message.get("event", "alive")
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[{datetime.now()}] Data Ingestor: Discarding malformed membership message: {e}", file=sys.stderr)
+            return
+        if member == self.member_id:
+            return
+        if event == "leave":
+            changed = self._members.pop(member, None) is not None
+        else:
+            changed = member not in self._members
+            self._members[member] = self._clock()
+        if changed and self._assigned:
+            self._rebalance()
+
+    def _rebalance(self):
+        self._assigned = True
+        owned = assign_partitions(self.member_id, list(self._members), self.partitions)
+        if owned == self.owned_partitions:
+            return
+        lost, gained = self.owned_partitions - owned, owned - self.owned_partitions
+        if lost:
+            # Lo recibido de las particiones que se sueltan se guarda y confirma antes de darse de baja
+            self._flush()
+            for partition in lost:
+                self._channel.basic_cancel(self._consumer_tags.pop(partition))
+        for partition in sorted(gained):
+            self._consumer_tags[partition] = self._channel.basic_consume(
+                queue=partition_queue(self.queue_name, partition), on_message_callback=self._on_message)
+        self.owned_partitions = owned
+        self.rebalances += 1
+        OWNED_PARTITIONS.set(len(owned))
+        print(f"[{datetime.now()}] Data Ingestor: Member {self.member_id} owns {len(owned)}/{self.partitions} partitions "
+              f"({len(self._members) + 1} members). Released {sorted(lost)}, acquired {sorted(gained)}.", file=sys.stderr)
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+from app.data.ticwatch_writer import natural_key
+
+
+class RecentKeyFilter:
+    """
+    Claves naturales (user_id, session_id, timestamp) de las últimas max_keys muestras que el
+    Data Ingestor ha guardado, para descartar sin llegar a la base de datos las que vuelven a
+    llegar por un reenvío (del broker tras un nack o una reconexión, o del diario del Edge).
+
+    Solo se añaden claves después de guardar el lote: una muestra cuyo guardado falló no debe
+    descartarse cuando se vuelva a entregar. Es una caché: lo que no está en ella lo descarta
+    igualmente el índice único de ticwatch_data.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._keys = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def filter(self, samples: list) -> tuple:
+        """
+        Separa las muestras nuevas de las ya guardadas o repetidas dentro del propio lote.
+
+        Returns:
+            (muestras nuevas, número de duplicados descartados)
+        """
+        unique, seen = [], set()
+        for sample in samples:
+            key = natural_key(sample)
+            if key in self._keys or key in seen:
+                continue
+            seen.add(key)
+            unique.append(sample)
+        return unique, len(samples) - len(unique)
+
+    def add_all(self, samples: list):
+        for sample in samples:
+            key = natural_key(sample)
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
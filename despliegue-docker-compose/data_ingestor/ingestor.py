@@ -1,67 +1,67 @@
-import os
+import signal
 import sys
-import time
-import json
 from datetime import datetime
 
+from prometheus_client import start_http_server
+
 # Importar funciones de la aplicación
-from app.data.message_queue import consume_messages, publish_notification_message, EDGE_INGEST_QUEUE, INGEST_FOG_NOTIFICATION_QUEUE
-from app.data.database import insert_ticwatch_data # Para insertar en la DB central
+from app.config import (INGESTOR_PREFETCH_COUNT, INGESTOR_MAX_BATCH_SIZE, INGESTOR_FLUSH_INTERVAL_SECONDS,
+                        INGESTOR_LAG_REPORT_INTERVAL_SECONDS, INGESTOR_METRICS_PORT, INGESTOR_WRITE_METHOD,
+                        INGEST_PARTITIONS, INGESTOR_HEARTBEAT_INTERVAL_SECONDS, INGESTOR_MEMBER_TIMEOUT_SECONDS,
+                        INGESTOR_DEDUP_CACHE_SIZE, INGESTOR_NOTIFICATION_WINDOW_SECONDS,
+                        INGESTOR_DEAD_LETTER_EXCHANGE, INGESTOR_DEAD_LETTER_QUEUE)
+from app.data.message_queue import EDGE_INGEST_QUEUE, INGEST_FOG_NOTIFICATION_QUEUE
+from app.data.ticwatch_writer import TicWatchBatchWriter # Para insertar en la DB central
+from data_ingestor.consumer import IngestConsumer, PartitionedIngestConsumer, NATURAL_KEY_INDEX_MISSING
+from data_ingestor.dedup import RecentKeyFilter
+from data_ingestor.notifications import NotificationCoalescer
 
 
-def run_data_ingestor_loop(interval_seconds: int = 5):
+def run_data_ingestor():
     """
     Bucle principal del Data Ingestor.
-    Consume mensajes de la cola de ingesta, los inserta en la DB,
-    y luego publica una notificación al Fog.
+    Consume de forma continua la cola de ingesta, inserta cada micro-lote en la DB y avisa al
+    Fog, agrupadas por usuario, de las muestras etiquetadas nuevas.
     """
-    print(f"[{datetime.now()}] Data Ingestor: Starting main loop. Checking for new messages every {interval_seconds} seconds.", file=sys.stderr)
-
-    while True:
-        print(f"[{datetime.now()}] Data Ingestor: Attempting to consume messages from '{EDGE_INGEST_QUEUE}'...", file=sys.stderr)
-        
-        # Consumir mensajes de la cola de ingesta
-        # La función consume_messages ya maneja la conexión y el ACK.
-        messages = consume_messages(EDGE_INGEST_QUEUE)
-
-        if not messages:
-            print(f"[{datetime.now()}] Data Ingestor: No new messages in '{EDGE_INGEST_QUEUE}'. Waiting...", file=sys.stderr)
-        else:
-            print(f"[{datetime.now()}] Data Ingestor: Consumed {len(messages)} messages from '{EDGE_INGEST_QUEUE}'. Processing...", file=sys.stderr)
-            
-            # Procesar cada mensaje: insertar en DB y notificar al Fog
-            processed_user_ids = set() # Para notificar a cada usuario solo una vez por ciclo
-            for message in messages:
-                user_id = message.get('user_id')
-                timestamp = message.get('timestamp')
-                
-                if not user_id or not timestamp:
-                    print(f"[{datetime.now()}] Data Ingestor: Skipping malformed message: {message}", file=sys.stderr)
-                    continue
-
-                print(f"[{datetime.now()}] Data Ingestor: Inserting data for user {user_id} at {timestamp} into DB...", file=sys.stderr)
-                
-                # Insertar el dato en la base de datos central
-                # insert_ticwatch_data ya maneja sus propios reintentos y logs de error.
-                try:
-                    message['timestamp'] = datetime.fromisoformat(timestamp)  # Asegurar que el timestamp es un objeto datetime
-                except ValueError as e:
-                    print(f"[{datetime.now()}] Data Ingestor: Error parsing timestamp '{timestamp}' for user {user_id}: {e}", file=sys.stderr)
-                    continue
-                print(f"[{datetime.now()}] Data Ingestor: Message content: {message}", file=sys.stderr)
-                insert_ticwatch_data(message)
-                
-                # Añadir el user_id al conjunto de procesados para notificar al Fog
-                processed_user_ids.add(user_id)
-            
-            # Publicar una notificación para cada usuario cuyos datos fueron insertados
-            for user_id in processed_user_ids:
-                print(f"[{datetime.now()}] Data Ingestor: Publishing notification for user {user_id} to '{INGEST_FOG_NOTIFICATION_QUEUE}'...", file=sys.stderr)
-                publish_notification_message(user_id) # Notificar al Fog
-
-        # Esperar antes de la siguiente iteración
-        time.sleep(interval_seconds)
+    # Cada micro-lote se guarda con un único COPY y un commit; el consumidor confirma después.
+    # Los reenvíos se descartan en la caché de claves recientes o, si no, en la base de datos
+    batch_writer = TicWatchBatchWriter(method=INGESTOR_WRITE_METHOD)
+    NATURAL_KEY_INDEX_MISSING.set_function(lambda: 0 if batch_writer.has_natural_key_index else 1)
+    consumer_options = dict(
+        store_batch=batch_writer.write,
+        # Una notificación por usuario y ventana, y solo si han llegado muestras etiquetadas
+        notifications=NotificationCoalescer(INGESTOR_NOTIFICATION_WINDOW_SECONDS),
+        notification_queue=INGEST_FOG_NOTIFICATION_QUEUE,
+        # Las muestras que no se pueden guardar ni por separado no detienen la cola
+        dead_letter_exchange=INGESTOR_DEAD_LETTER_EXCHANGE,
+        dead_letter_queue=INGESTOR_DEAD_LETTER_QUEUE,
+        recent_keys=RecentKeyFilter(INGESTOR_DEDUP_CACHE_SIZE) if INGESTOR_DEDUP_CACHE_SIZE else None,
+        prefetch_count=INGESTOR_PREFETCH_COUNT,
+        max_batch_size=INGESTOR_MAX_BATCH_SIZE,
+        flush_interval=INGESTOR_FLUSH_INTERVAL_SECONDS,
+        lag_interval=INGESTOR_LAG_REPORT_INTERVAL_SECONDS,
+    )
+    if INGEST_PARTITIONS:
+        # Modo particionado: cada réplica consume solo las particiones que le corresponden
+        consumer = PartitionedIngestConsumer(
+            EDGE_INGEST_QUEUE,
+            partitions=INGEST_PARTITIONS,
+            heartbeat_interval=INGESTOR_HEARTBEAT_INTERVAL_SECONDS,
+            member_timeout=INGESTOR_MEMBER_TIMEOUT_SECONDS,
+            **consumer_options,
+        )
+    else:
+        consumer = IngestConsumer(EDGE_INGEST_QUEUE, **consumer_options)
+    # Al parar el contenedor se guarda el micro-lote en curso antes de cerrar la conexión
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+    if INGESTOR_METRICS_PORT:
+        start_http_server(INGESTOR_METRICS_PORT)
+        print(f"[{datetime.now()}] Data Ingestor: Metrics available on port {INGESTOR_METRICS_PORT}.", file=sys.stderr)
+    try:
+        consumer.run()
+    finally:
+        batch_writer.close()
 
 if __name__ == "__main__":
     print("Data Ingestor Service: Starting...", file=sys.stderr)
-    run_data_ingestor_loop(interval_seconds=5) # Intervalo de chequeo más frecuente para ingesta
\ No newline at end of file
+    run_data_ingestor()
@@ -0,0 +1,70 @@
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable
+
+
+def _comparable(timestamp):
+    # Un lote puede mezclar timestamps con y sin zona horaria (que no se pueden comparar): los
+    # que la tienen se pasan a UTC sin zona, como los guarda la columna timestamp de ticwatch_data
+    if isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+class NotificationCoalescer:
+    """
+    Agrupa por usuario las muestras etiquetadas (estado_real no nulo) que guarda el Data
+    Ingestor para avisar al Fog con una única notificación por usuario cada window_seconds,
+    en lugar de una notificación por micro-lote.
+
+    Cada notificación lleva el número de muestras etiquetadas nuevas, el histograma de
+    etiquetas y la marca de agua (el timestamp más reciente), de modo que el Fog puede decidir
+    si le merece la pena descargar los datos del usuario sin hacer ninguna petición. Las
+    muestras sin etiquetar no sirven para el fine-tuning y no generan notificaciones.
+    """
+
+    def __init__(self, window_seconds: float = 30, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._pending = {}  # user_id -> resumen de las muestras pendientes de notificar
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, samples: list):
+        for sample in samples:
+            label = sample.get('estado_real')
+            if label is None:
+                continue
+            pending = self._pending.get(sample['user_id'])
+            if pending is None:
+                pending = self._pending[sample['user_id']] = {
+                    "since": self._clock(), "new_labeled_samples": 0, "label_counts": Counter(), "max_timestamp": None,
+                }
+            pending["new_labeled_samples"] += 1
+            pending["label_counts"][str(label)] += 1
+            timestamp = sample.get('timestamp')
+            if timestamp is not None and (pending["max_timestamp"] is None
+                                          or _comparable(timestamp) > _comparable(pending["max_timestamp"])):
+                pending["max_timestamp"] = timestamp
+
+    def pop_due(self, force: bool = False) -> list:
+        """
+        Notificaciones de los usuarios cuya ventana ha terminado (o de todos con force=True),
+        que dejan de estar pendientes.
+        """
+        now = self._clock()
+        due = [user_id for user_id, pending in self._pending.items()
+               if force or now - pending["since"] >= self.window_seconds]
+        return [self._message(user_id, self._pending.pop(user_id)) for user_id in due]
+
+    def _message(self, user_id: str, pending: dict) -> dict:
+        max_timestamp = pending["max_timestamp"]
+        return {
+            "user_id": user_id,
+            "new_labeled_samples": pending["new_labeled_samples"],
+            "label_counts": dict(pending["label_counts"]),
+            "max_timestamp": max_timestamp.isoformat() if isinstance(max_timestamp, datetime) else max_timestamp,
+            "timestamp": datetime.now().isoformat(),
+        }
@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -21,6 +21,11 @@ db = client[DATABASE_NAME]
 # Exportar la colección TicWatch
 ticwatch_collection = db["TicWatch"]
 
+# Cliente asíncrono para las rutas del Edge: las inserciones no bloquean el event loop.
+# No abre conexiones hasta la primera operación, dentro del event loop del servidor.
+async_client = AsyncMongoClient(MONGO_URI)
+async_ticwatch_collection = async_client[DATABASE_NAME]["TicWatch"]
+
 def probar_bd():
     try:
         # Probar la conexión listando las colecciones
@@ -0,0 +1,27 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.data.database import get_user_model_mapping
+from app.config import EDGE_DB_POOL_SIZE
+
+
+class AsyncModelMappingAccessor:
+    """
+    Acceso asíncrono a los mapeos de modelo de los usuarios (PostgreSQL).
+    Las consultas son síncronas, así que se ejecutan en un pool de hilos acotado y dedicado:
+    no bloquean el event loop del Edge y el número de conexiones simultáneas a la DB
+    queda limitado por el tamaño del pool.
+    """
+    def __init__(self, lookup=get_user_model_mapping, max_workers: int = EDGE_DB_POOL_SIZE):
+        self._lookup = lookup
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="edge-db")
+
+    async def __call__(self, user_id: str):
+        return await self.get_user_model_mapping(user_id)
+
+    async def get_user_model_mapping(self, user_id: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._lookup, user_id)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+import msgpack
 from app.schemas.ticwatch_schema import TicWatchData, TicWatchDataOrigin
 from app.models.ticwatch_predictor import TicWatchPredictor
-from app.data.database import get_user_model_mapping
 from datetime import datetime
+from functools import lru_cache
+from typing import List
+from app.data.wire_format import MSGPACK_CONTENT_TYPE, accepts_msgpack, decode_batch, is_msgpack
 # from bson import ObjectId
-from edge_node.db.database import ticwatch_collection
 
-import asyncio
 import sys
+import time
+from edge_node.services.metrics import STAGE_SECONDS, REQUEST_SECONDS, ERRORS
 # Importar variables y funciones globales desde server.py
-from edge_node.server import user_predictors, cloud_api_client, publish_data_message_async
+from edge_node.server import model_registry, admission_controller, recovery_writer, session_features, recent_users, publish_data_message_async, publish_data_batch_async
 
 router = APIRouter()
 
@@ -19,178 +25,309 @@ router = APIRouter()
 #         doc["_id"] = str(doc["_id"])
 #     return doc
 
-@router.post("/{user_id}") # La ruta base es /predict_activity, definida en server.py
-async def predict_activity(user_id: str, data: TicWatchData):
+async def get_user_predictor(user_id: str) -> TicWatchPredictor:
+    """
+    Devuelve el predictor del usuario a través del registro de modelos del Edge
+    (personalizado si existe, o la instancia compartida del genérico).
+    Si el modelo no está en memoria, la carga pasa por el control de admisión, que la
+    descarta (503) antes que las predicciones con modelos ya cargados si el nodo está saturado.
+    El usuario se registra como reciente para precargar su modelo en el próximo arranque.
+    """
+    recent_users.touch(user_id)
+    if model_registry.is_warm(user_id):
+        predictor = await model_registry.get_predictor(user_id)
+    else:
+        async with admission_controller.cold_load():
+            predictor = await model_registry.get_predictor(user_id)
+
+    if predictor is None or predictor.model is None:
+        raise HTTPException(status_code=500, detail="Model could not be loaded for prediction.")
+
+    return predictor
+
+async def admitted_request(request: Request):
+    """
+    Dependencia de las rutas de predicción: reserva un hueco en el control de admisión y
+    mide la duración de la petición admitida (edge_request_duration_seconds).
+    """
+    async with admission_controller.admit():
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            REQUEST_SECONDS.labels(request.scope["route"].path).observe(time.perf_counter() - started)
+
+def request_body_schema(model, batch: bool = False) -> dict:
+    """
+    openapi_extra de las rutas que leen el cuerpo según su Content-Type (JSON o MessagePack,
+    ver app.data.wire_format), ya que FastAPI solo documenta por sí mismo los cuerpos JSON.
+    """
+    schema = model.model_json_schema()
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": schema} if batch else schema},
+        MSGPACK_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+
+@lru_cache(maxsize=None)
+def sample_adapter(model, batch: bool) -> TypeAdapter:
+    return TypeAdapter(List[model] if batch else model)
+
+async def read_samples(request: Request, model, batch: bool = False):
+    """
+    Lee y valida la muestra (o el lote, con batch=True) del cuerpo de la petición: JSON, que
+    Pydantic valida directamente desde los bytes, o MessagePack (una muestra, una lista o el
+    formato por columnas de app.data.wire_format). Los errores de validación se responden con
+    422 como los de FastAPI; un cuerpo MessagePack mal formado, con 400.
+    """
+    body = await request.body()
+    adapter = sample_adapter(model, batch)
+    try:
+        if not is_msgpack(request.headers.get("content-type")):
+            return adapter.validate_json(body)
+        rows = decode_batch(body)
+        if not batch:
+            if len(rows) != 1:
+                raise HTTPException(status_code=400, detail=f"Expected a single sample, received {len(rows)}.")
+            rows = rows[0]
+        return adapter.validate_python(rows)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def negotiated_response(request: Request, content: dict):
+    """Responde en MessagePack si la cabecera Accept lo pide, o en JSON en caso contrario."""
+    if accepts_msgpack(request.headers.get("accept")):
+        return Response(msgpack.packb(jsonable_encoder(content)), media_type=MSGPACK_CONTENT_TYPE)
+    return content
+
+def session_key(user_id: str, session_id: str) -> str:
+    """Clave del estado de ventanas deslizantes de una sesión en session_features."""
+    return f"{user_id}:{session_id}"
+
+def build_recovery_document(data: TicWatchDataOrigin) -> dict:
+    """Construye el documento que se guarda en la colección TicWatch de MongoDB."""
+    return {
+        "session_id": data.session_id,
+        "timeStamp": data.timestamp.isoformat(),  # ← usa timestamp unificado
+        "tic_accx": data.tic_accx,
+        "tic_accy": data.tic_accy,
+        "tic_accz": data.tic_accz,
+        "tic_acclx": data.tic_acclx,
+        "tic_accly": data.tic_accly,
+        "tic_acclz": data.tic_acclz,
+        "tic_girx": data.tic_girx,
+        "tic_giry": data.tic_giry,
+        "tic_girz": data.tic_girz,
+        "tic_hrppg": data.tic_hrppg,
+        "tic_step": data.tic_step
+    }
+
+def build_queue_message(data, user_id: str, predicted_state: str) -> dict:
+    """Construye el mensaje de datos que se publica en la cola de ingesta."""
+    data_to_queue = data.model_dump()
+    data_to_queue['user_id'] = user_id
+    data_to_queue['predicted_state'] = predicted_state
+    data_to_queue['timestamp'] = data.timestamp.isoformat()
+    if "timeStamp" in data_to_queue:
+        del data_to_queue["timeStamp"]
+    return data_to_queue
+
+@router.post("/{user_id}", dependencies=[Depends(admitted_request)], openapi_extra=request_body_schema(TicWatchData)) # La ruta base es /predict_activity, definida en server.py
+async def predict_activity(user_id: str, request: Request):
     """
     Recibe datos del TicWatch para un usuario específico, predice la actividad
     y envía los datos para almacenamiento centralizado.
+    El cuerpo y la respuesta pueden ser JSON o MessagePack (Content-Type / Accept).
     """
+    data = await read_samples(request, TicWatchData)
     print(f"Received data for user: {user_id} at timestamp: {data.timestamp}", file=sys.stderr)
 
     # --- 1. Cargar o obtener el modelo del usuario ---
-    predictor = user_predictors.get(user_id)
-    model_type = None
-
-    if predictor is None:
-        user_mapping = get_user_model_mapping(user_id)
-        
-        model_bytes = None
-        if user_mapping and user_mapping['model_path']:
-            model_type = user_mapping['model_type']
-            try:
-                if model_type == "personalized":
-                    print(f"Loading personalized model for user {user_id} from Cloud API...", file=sys.stderr)
-                    model_bytes = cloud_api_client.download_model(user_id=user_id)
-                else:
-                    print(f"Unknown or generic model_type: {model_type} for user {user_id}. Falling back to generic.", file=sys.stderr)
-                    model_bytes = cloud_api_client.download_model(user_id=None)
-                    model_type = "generic"
-
-                if model_bytes:
-                    predictor = TicWatchPredictor(model_bytes=model_bytes)
-                    user_predictors[user_id] = predictor
-                    print(f"Loaded {model_type} model for user {user_id} from Cloud API.", file=sys.stderr)
-                else:
-                    raise HTTPException(status_code=500, detail=f"{model_type.capitalize()} model not found. Cannot process data for user {user_id}.")
-            except Exception as e:
-                print(f"Error loading custom model for user {user_id}: {e}. Falling back to generic.", file=sys.stderr)
-                model_bytes = cloud_api_client.download_model(user_id=None)
-                model_type = "generic"
-                if model_bytes:
-                    predictor = TicWatchPredictor(model_bytes=model_bytes)
-                    user_predictors[user_id] = predictor
-                    print(f"Loaded generic model after custom model fallback for user {user_id}.", file=sys.stderr)
-                else:
-                    raise HTTPException(status_code=500, detail=f"Generic model not found. Cannot process data for user {user_id}.")
-        else:
-            print(f"New user {user_id} or no mapping found. Downloading generic model.", file=sys.stderr)
-            model_bytes = cloud_api_client.download_model(user_id=None)
-            model_type = "generic"
-            if model_bytes:
-                predictor = TicWatchPredictor(model_bytes=model_bytes)
-                user_predictors[user_id] = predictor
-                print(f"Loaded generic model for new user {user_id}.", file=sys.stderr)
-            else:
-                raise HTTPException(status_code=500, detail=f"Generic model not found. Cannot process data for user {user_id}.")
-    
-    if predictor is None or predictor.model is None:
-        raise HTTPException(status_code=500, detail="Model could not be loaded for prediction.")
+    predictor = await get_user_predictor(user_id)
 
     # --- 2. Realizar la predicción ---
     try:
-        predicted_state = predictor.predict(data)
+        # Actualizar las ventanas de la sesión (O(1)) y predecir con el vector resultante
+        with STAGE_SECONDS.labels("preprocess").time():
+            features = session_features.update(session_key(user_id, data.session_id), data)
+        with STAGE_SECONDS.labels("predict").time():
+            predicted_state = predictor.predict(features)
         print(f"Prediction for user {user_id} at {data.timestamp}: {predicted_state}", file=sys.stderr)
     except Exception as e:
+        ERRORS.labels("predict").inc()
         print(f"Error during prediction for user {user_id}: {e}", file=sys.stderr)
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
     # --- 3. Enviar datos a la cola de mensajes (para almacenamiento y re-entrenamiento) ---
-    data_to_queue = data.model_dump()
-    data_to_queue['user_id'] = user_id
-    data_to_queue['predicted_state'] = predicted_state
-    data_to_queue['timestamp'] = data.timestamp.isoformat()
-    
-    asyncio.create_task(publish_data_message_async(data_to_queue))
+    data_to_queue = build_queue_message(data, user_id, predicted_state)
+
+    await publish_data_message_async(data_to_queue)
+
+    return negotiated_response(request, {"user_id": user_id, "predicted_activity": predicted_state, "timestamp": data.timestamp})
 
-    return {"user_id": user_id, "predicted_activity": predicted_state, "timestamp": data.timestamp}
+@router.post("/{user_id}/batch", dependencies=[Depends(admitted_request)], openapi_extra=request_body_schema(TicWatchData, batch=True)) # La ruta base es /predict_activity, definida en server.py
+async def predict_activity_batch(user_id: str, request: Request):
+    """
+    Recibe un lote de muestras del TicWatch de un mismo usuario, predice la actividad
+    de todas ellas con una única llamada al modelo y publica el lote en la cola
+    como un solo mensaje. Las predicciones se devuelven en el orden de las muestras.
+    El lote puede llegar en JSON o en MessagePack (por columnas, el formato más compacto).
+    """
+    samples = await read_samples(request, TicWatchData, batch=True)
+    if not samples:
+        raise HTTPException(status_code=400, detail="The batch must contain at least one sample.")
+
+    print(f"Received batch of {len(samples)} samples for user: {user_id}", file=sys.stderr)
+
+    predictor = await get_user_predictor(user_id)
 
-@router.post("/api/datarecovery/data", status_code=status.HTTP_200_OK) 
-async def predict_activity(data: TicWatchDataOrigin):
+    try:
+        with STAGE_SECONDS.labels("preprocess").time():
+            features = session_features.update_many([(session_key(user_id, sample.session_id), sample) for sample in samples])
+        with STAGE_SECONDS.labels("predict").time():
+            predicted_states = predictor.predict_many(features)
+        print(f"Batch prediction for user {user_id}: {len(predicted_states)} samples", file=sys.stderr)
+    except Exception as e:
+        ERRORS.labels("predict").inc()
+        print(f"Error during batch prediction for user {user_id}: {e}", file=sys.stderr)
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+
+    messages = [
+        build_queue_message(sample, user_id, predicted_state)
+        for sample, predicted_state in zip(samples, predicted_states)
+    ]
+    await publish_data_batch_async(messages)
+
+    return negotiated_response(request, {
+        "user_id": user_id,
+        "predictions": [
+            {"predicted_activity": predicted_state, "timestamp": sample.timestamp}
+            for sample, predicted_state in zip(samples, predicted_states)
+        ]
+    })
+
+@router.post("/api/datarecovery/data", status_code=status.HTTP_200_OK, dependencies=[Depends(admitted_request)],
+             openapi_extra=request_body_schema(TicWatchDataOrigin))
+async def predict_activity(request: Request):
     """
     Recibe datos del TicWatch para un usuario específico, predice la actividad
     y envía los datos para almacenamiento centralizado.
+    El cuerpo y la respuesta pueden ser JSON o MessagePack (Content-Type / Accept).
     """
+    data = await read_samples(request, TicWatchDataOrigin)
     user_id = data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID is required in the data payload.")
-    
+
     if not data.ticwatchconnected:
         raise HTTPException(status_code=400, detail="TicWatch is not connected. Cannot process data.")
 
     print(f"Received data for user: {user_id} at timestamp: {data.timestamp}", file=sys.stderr)
 
     # Insertar información en la colección TicWatch
-    data_dict = {
-        "session_id": data.session_id,
-        "timeStamp": data.timestamp.isoformat(),  # ← usa timestamp unificado
-        "tic_accx": data.tic_accx,
-        "tic_accy": data.tic_accy,
-        "tic_accz": data.tic_accz,
-        "tic_acclx": data.tic_acclx,
-        "tic_accly": data.tic_accly,
-        "tic_acclz": data.tic_acclz,
-        "tic_girx": data.tic_girx,
-        "tic_giry": data.tic_giry,
-        "tic_girz": data.tic_girz,
-        "tic_hrppg": data.tic_hrppg,
-        "tic_step": data.tic_step
-    }
+    data_dict = build_recovery_document(data)
 
     try:
-        ticwatch_collection.insert_one(data_dict)
-        print(f"Data inserted into TicWatch collection for user {user_id}.", file=sys.stderr)
+        # Escritura diferida: el documento se guarda en el siguiente lote (insert_many)
+        await recovery_writer.write(data_dict)
+        print(f"Data queued for TicWatch collection for user {user_id}.", file=sys.stderr)
     except Exception as e:
         print(f"Error inserting data into TicWatch collection for user {user_id}: {e}", file=sys.stderr)
         raise HTTPException(status_code=500, detail="Failed to insert data into database.")
 
     # --- Cargar modelo ---
-    predictor = user_predictors.get(user_id)
-    model_type = None
-
-    if predictor is None:
-        user_mapping = get_user_model_mapping(user_id)
-        model_bytes = None
-
-        if user_mapping and user_mapping['model_path']:
-            model_type = user_mapping['model_type']
-            try:
-                model_bytes = cloud_api_client.download_model(user_id=user_id if model_type == "personalized" else None)
-                model_type = model_type if model_bytes else "generic"
-            except Exception as e:
-                print(f"Error loading model for user {user_id}: {e}. Falling back to generic.", file=sys.stderr)
-                model_bytes = cloud_api_client.download_model(user_id=None)
-                model_type = "generic"
-
-            if model_bytes:
-                predictor = TicWatchPredictor(model_bytes=model_bytes)
-                user_predictors[user_id] = predictor
-                print(f"Loaded {model_type} model for user {user_id}.", file=sys.stderr)
-            else:
-                raise HTTPException(status_code=500, detail=f"{model_type.capitalize()} model not found.")
-        else:
-            model_bytes = cloud_api_client.download_model(user_id=None)
-            model_type = "generic"
-            if model_bytes:
-                predictor = TicWatchPredictor(model_bytes=model_bytes)
-                user_predictors[user_id] = predictor
-                print(f"Loaded generic model for new user {user_id}.", file=sys.stderr)
-            else:
-                raise HTTPException(status_code=500, detail="Generic model not found.")
-
-    if predictor is None or predictor.model is None:
-        raise HTTPException(status_code=500, detail="Model could not be loaded for prediction.")
+    predictor = await get_user_predictor(user_id)
 
     # --- Predicción ---
     try:
-        predicted_state = predictor.predict(data)
+        # Actualizar las ventanas de la sesión (O(1)) y predecir con el vector resultante
+        with STAGE_SECONDS.labels("preprocess").time():
+            features = session_features.update(session_key(user_id, data.session_id), data)
+        with STAGE_SECONDS.labels("predict").time():
+            predicted_state = predictor.predict(features)
         print(f"Prediction for user {user_id} at {data.timestamp}: {predicted_state}", file=sys.stderr)
     except Exception as e:
+        ERRORS.labels("predict").inc()
         print(f"Error during prediction for user {user_id}: {e}", file=sys.stderr)
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
     # --- Enviar a cola ---
-    data_to_queue = data.model_dump()
-    data_to_queue['user_id'] = user_id
-    data_to_queue['predicted_state'] = predicted_state
-    data_to_queue['timestamp'] = data.timestamp.isoformat()
-    if "timeStamp" in data_to_queue:
-        del data_to_queue["timeStamp"]
+    data_to_queue = build_queue_message(data, user_id, predicted_state)
     print("Data to queue:", data_to_queue, file=sys.stderr)
 
-    asyncio.create_task(publish_data_message_async(data_to_queue))
+    await publish_data_message_async(data_to_queue)
 
-    return {
+    return negotiated_response(request, {
         "user_id": user_id,
         "predicted_activity": predicted_state,
         "timestamp": data.timestamp
-    }
+    })
+
+@router.post("/api/datarecovery/data/batch", status_code=status.HTTP_200_OK, dependencies=[Depends(admitted_request)],
+             openapi_extra=request_body_schema(TicWatchDataOrigin, batch=True))
+async def predict_activity_recovery_batch(request: Request):
+    """
+    Variante por lotes de /api/datarecovery/data. Encola todas las muestras para MongoDB
+    de una vez, agrupa las muestras por usuario para predecir cada grupo con
+    una única llamada al modelo y publica todo el lote en la cola como un solo mensaje.
+    Las predicciones se devuelven en el orden de las muestras recibidas.
+    El lote puede llegar en JSON o en MessagePack (por columnas, el formato más compacto).
+    """
+    samples = await read_samples(request, TicWatchDataOrigin, batch=True)
+    if not samples:
+        raise HTTPException(status_code=400, detail="The batch must contain at least one sample.")
+
+    for sample in samples:
+        if not sample.user_id:
+            raise HTTPException(status_code=400, detail="User ID is required in every sample of the batch.")
+        if not sample.ticwatchconnected:
+            raise HTTPException(status_code=400, detail=f"TicWatch is not connected for user {sample.user_id}. Cannot process data.")
+
+    print(f"Received recovery batch of {len(samples)} samples", file=sys.stderr)
+
+    try:
+        await recovery_writer.write_many([build_recovery_document(sample) for sample in samples])
+        print(f"Recovery batch of {len(samples)} samples queued for TicWatch collection.", file=sys.stderr)
+    except Exception as e:
+        print(f"Error inserting recovery batch into TicWatch collection: {e}", file=sys.stderr)
+        raise HTTPException(status_code=500, detail="Failed to insert data into database.")
+
+    # Agrupar las posiciones de las muestras por usuario para conservar el orden original
+    positions_by_user = {}
+    for position, sample in enumerate(samples):
+        positions_by_user.setdefault(sample.user_id, []).append(position)
+
+    # Las ventanas de cada sesión se actualizan en el orden de llegada de las muestras
+    with STAGE_SECONDS.labels("preprocess").time():
+        features = session_features.update_many([(session_key(sample.user_id, sample.session_id), sample) for sample in samples])
+
+    predicted_states = [None] * len(samples)
+    for user_id, positions in positions_by_user.items():
+        predictor = await get_user_predictor(user_id)
+        try:
+            with STAGE_SECONDS.labels("predict").time():
+                user_states = predictor.predict_many(features[positions])
+        except Exception as e:
+            ERRORS.labels("predict").inc()
+            print(f"Error during batch prediction for user {user_id}: {e}", file=sys.stderr)
+            raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+        for position, predicted_state in zip(positions, user_states):
+            predicted_states[position] = predicted_state
+
+    messages = [
+        build_queue_message(sample, sample.user_id, predicted_state)
+        for sample, predicted_state in zip(samples, predicted_states)
+    ]
+    await publish_data_batch_async(messages)
+
+    return negotiated_response(request, {
+        "predictions": [
+            {
+                "user_id": sample.user_id,
+                "predicted_activity": predicted_state,
+                "timestamp": sample.timestamp
+            }
+            for sample, predicted_state in zip(samples, predicted_states)
+        ]
+    })
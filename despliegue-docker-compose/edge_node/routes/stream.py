@@ -0,0 +1,164 @@
+import json
+import sys
+import time
+
+import msgpack
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+
+from app.data.wire_format import decode_batch
+
+from app.schemas.ticwatch_schema import TicWatchData
+from edge_node.routes.activity import build_queue_message, session_key
+from edge_node.services.admission import AdmissionRejected
+from edge_node.services.metrics import REQUEST_SECONDS, STAGE_SECONDS, ERRORS
+from edge_node.server import model_registry, admission_controller, session_features, recent_users, publish_data_message_async, publish_data_batch_async
+
+router = APIRouter()
+
+STREAM_ROUTE = "/ws/{user_id}/{session_id}"
+
+
+class StreamSession:
+    """
+    Estado de una sesión de streaming: el predictor del usuario se resuelve al abrir la
+    sesión y solo se vuelve a resolver si el registro de modelos ha hecho un intercambio
+    en caliente desde entonces.
+    """
+
+    def __init__(self, user_id: str, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.predictor = None
+        self.registry_version = None
+        self.samples = 0
+
+    async def get_predictor(self):
+        if self.predictor is None or self.registry_version != model_registry.version:
+            self.registry_version = model_registry.version
+            self.predictor = await model_registry.get_predictor(self.user_id)
+        return self.predictor
+
+    def parse_frame(self, raw) -> list:
+        """
+        Valida un frame: una lectura (objeto JSON) o varias (lista). Los frames binarios son
+        MessagePack (app.data.wire_format), también en el formato por columnas. El session_id
+        y el user_id se toman de la ruta, y si el frame los incluye deben coincidir. Lanza
+        ValueError si no es válido.
+        """
+        if isinstance(raw, bytes):
+            readings = decode_batch(raw)
+        else:
+            frame = json.loads(raw)
+            readings = frame if isinstance(frame, list) else [frame]
+        if not readings or not all(isinstance(reading, dict) for reading in readings):
+            raise ValueError("A frame must be a reading object or a non-empty list of readings.")
+        samples = []
+        for reading in readings:
+            if reading.setdefault("session_id", self.session_id) != self.session_id:
+                raise ValueError(f"Reading for session {reading['session_id']} sent on session {self.session_id}.")
+            if reading.get("user_id", self.user_id) != self.user_id:
+                raise ValueError(f"Reading for user {reading['user_id']} sent on a session of user {self.user_id}.")
+            samples.append(TicWatchData.model_validate(reading))
+        return samples
+
+
+@router.websocket(STREAM_ROUTE)
+async def stream_session(websocket: WebSocket, user_id: str, session_id: str):
+    """
+    Canal de streaming para sesiones largas de un reloj: una conexión WebSocket por sesión.
+    Cada frame recibido (una lectura o una lista de lecturas) se valida, se predice con el
+    modelo del usuario y se responde con las predicciones en el mismo orden. Los frames
+    inválidos, y los que llegan con el nodo saturado, se responden con un error sin cerrar
+    la sesión.
+    """
+    await websocket.accept()
+    session = StreamSession(user_id, session_id)
+    recent_users.touch(user_id)
+
+    try:
+        if model_registry.is_warm(user_id):
+            predictor = await session.get_predictor()
+        else:
+            # Las cargas en frío se descartan primero cuando el nodo está saturado
+            async with admission_controller.cold_load():
+                predictor = await session.get_predictor()
+    except AdmissionRejected as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=e.reason)
+        return
+    if predictor is None or predictor.model is None:
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="Model could not be loaded for prediction.")
+        return
+    print(f"Streaming session {session_id} opened for user {user_id}", file=sys.stderr)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+            raw = message.get("bytes")
+            binary = raw is not None
+            if not binary:
+                raw = message.get("text")
+
+            async def reply(content: dict):
+                # Se responde en el mismo formato que el frame recibido
+                if binary:
+                    await websocket.send_bytes(msgpack.packb(jsonable_encoder(content)))
+                else:
+                    await websocket.send_json(jsonable_encoder(content))
+
+            try:
+                samples = session.parse_frame(raw)
+            except ValidationError as e:
+                await reply({"error": "Invalid reading", "detail": e.errors(include_url=False, include_context=False, include_input=False)})
+                continue
+            except ValueError as e:
+                await reply({"error": "Invalid frame", "detail": str(e)})
+                continue
+
+            try:
+                # Cada frame pasa por el control de admisión, como una petición de las rutas HTTP
+                async with admission_controller.admit():
+                    started = time.perf_counter()
+                    try:
+                        try:
+                            predictor = await session.get_predictor()
+                            with STAGE_SECONDS.labels("preprocess").time():
+                                features = session_features.update_many([(session_key(user_id, session_id), sample) for sample in samples])
+                            with STAGE_SECONDS.labels("predict").time():
+                                predicted_states = predictor.predict_many(features)
+                        except Exception as e:
+                            ERRORS.labels("predict").inc()
+                            print(f"Error during streaming prediction for user {user_id}: {e}", file=sys.stderr)
+                            await reply({"error": "Prediction failed", "detail": str(e)})
+                            continue
+
+                        messages = [
+                            build_queue_message(sample, user_id, predicted_state)
+                            for sample, predicted_state in zip(samples, predicted_states)
+                        ]
+                        if len(messages) == 1:
+                            await publish_data_message_async(messages[0])
+                        else:
+                            await publish_data_batch_async(messages)
+                    finally:
+                        REQUEST_SECONDS.labels(STREAM_ROUTE).observe(time.perf_counter() - started)
+            except AdmissionRejected as e:
+                # Con el nodo saturado el frame se descarta sin cerrar la sesión: el cliente lo
+                # reenvía pasado retry_after
+                await reply({"error": "Overloaded", "status_code": e.status_code, "retry_after": e.retry_after, "detail": e.reason})
+                continue
+            session.samples += len(samples)
+
+            await reply({
+                "user_id": user_id,
+                "session_id": session_id,
+                "predictions": [
+                    {"predicted_activity": predicted_state, "timestamp": sample.timestamp.isoformat()}
+                    for sample, predicted_state in zip(samples, predicted_states)
+                ],
+            })
+    except WebSocketDisconnect:
+        print(f"Streaming session {session_id} closed for user {user_id} after {session.samples} samples", file=sys.stderr)
@@ -1,6 +1,32 @@
-from fastapi import FastAPI
-from app.data.message_queue import publish_data_message
-from fog_node.cloud_api_client import CloudAPIClient
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, generate_latest
+from app.data.message_queue import EDGE_INGEST_QUEUE
+from fog_node.cloud_api_client import AsyncCloudAPIClient
+from edge_node.db.model_mappings import AsyncModelMappingAccessor
+from edge_node.db.database import async_client as mongo_async_client, async_ticwatch_collection
+from app.data.model_events import ModelUpdateListener
+from edge_node.services.model_cache import ModelCache
+from edge_node.services.model_registry import ModelRegistry
+from edge_node.services.journal import MessageJournal
+from edge_node.services.publisher import BatchingPublisher
+from edge_node.services.mongo_writer import WriteBehindWriter
+from app.features.window_features import SessionFeatureStore
+from edge_node.services.admission import AdmissionController, AdmissionRejected
+from edge_node.services.warmup import RecentUsers, ModelWarmer
+from app.config import EDGE_MODEL_CACHE_MAX_BYTES, EDGE_MODEL_CACHE_POLICY, EDGE_MODEL_CACHE_TTL_SECONDS
+from app.config import (EDGE_PUBLISH_BATCH_SIZE, EDGE_PUBLISH_FLUSH_INTERVAL_SECONDS,
+                        EDGE_PUBLISH_MAX_PENDING, EDGE_PUBLISH_ENQUEUE_TIMEOUT_SECONDS, EDGE_QUEUE_WIRE_FORMAT,
+                        EDGE_JOURNAL_DIR, EDGE_JOURNAL_SEGMENT_BYTES, EDGE_JOURNAL_MAX_BYTES, EDGE_JOURNAL_FSYNC,
+                        EDGE_JOURNAL_FSYNC_INTERVAL_SECONDS, EDGE_JOURNAL_REPLAY_BATCH_SIZE, EDGE_JOURNAL_REPLAY_RATE,
+                        INGEST_PARTITIONS)
+from app.config import (EDGE_RECOVERY_WRITE_BATCH_SIZE, EDGE_RECOVERY_WRITE_FLUSH_INTERVAL_SECONDS,
+                        EDGE_RECOVERY_WRITE_MAX_PENDING, EDGE_RECOVERY_WRITE_DURABILITY)
+from app.config import EDGE_FEATURE_MAX_SESSIONS, EDGE_FEATURE_SESSION_IDLE_SECONDS
+from app.config import (EDGE_MAX_CONCURRENT_REQUESTS, EDGE_MAX_QUEUED_REQUESTS,
+                        EDGE_LATENCY_SLO_SECONDS, EDGE_MAX_COLD_LOADS)
+from app.config import (EDGE_RECENT_USERS_PATH, EDGE_RECENT_USERS_MAX, EDGE_RECENT_USERS_SAVE_INTERVAL_SECONDS,
+                        EDGE_WARMUP_MAX_USERS, EDGE_WARMUP_CONCURRENCY, EDGE_WARMUP_TIMEOUT_SECONDS)
 import os
 from datetime import datetime
 import asyncio
@@ -10,25 +36,134 @@ import sys
 # Instancia de FastAPI
 app = FastAPI(title="Edge Node Activity Predictor")
 
-# Diccionario para almacenar los modelos de usuario cargados en memoria
-user_predictors: dict[str, any] = {}
+# Caché acotada en memoria para los modelos de usuario cargados (sustituye al diccionario sin límite)
+model_cache = ModelCache(
+    max_bytes=EDGE_MODEL_CACHE_MAX_BYTES,
+    policy=EDGE_MODEL_CACHE_POLICY,
+    ttl_seconds=EDGE_MODEL_CACHE_TTL_SECONDS,
+)
 
-# Instancia del cliente de la Cloud API para descargar modelos
-cloud_api_client = CloudAPIClient()
+# Instancia del cliente asíncrono (con pool de conexiones) de la Cloud API para descargar modelos
+cloud_api_client = AsyncCloudAPIClient()
+
+# Acceso asíncrono a los mapeos de modelo de los usuarios en PostgreSQL
+model_mappings = AsyncModelMappingAccessor()
+
+# Registro que resuelve el modelo de cada usuario y comparte las instancias por artefacto
+model_registry = ModelRegistry(model_cache, cloud_api_client, mapping_lookup=model_mappings)
+
+# Control de admisión: limita la concurrencia de las rutas de predicción y descarta carga
+# (primero las cargas de modelo en frío) cuando el nodo está saturado
+admission_controller = AdmissionController(
+    max_concurrent=EDGE_MAX_CONCURRENT_REQUESTS,
+    max_queue=EDGE_MAX_QUEUED_REQUESTS,
+    latency_slo=EDGE_LATENCY_SLO_SECONDS,
+    max_cold_loads=EDGE_MAX_COLD_LOADS,
+)
+
+# Usuarios atendidos recientemente (persistidos en disco) y calentamiento de sus modelos al arrancar
+recent_users = RecentUsers(EDGE_RECENT_USERS_PATH, max_users=EDGE_RECENT_USERS_MAX)
+model_warmer = ModelWarmer(
+    model_registry,
+    recent_users,
+    max_users=EDGE_WARMUP_MAX_USERS,
+    concurrency=EDGE_WARMUP_CONCURRENCY,
+    timeout=EDGE_WARMUP_TIMEOUT_SECONDS,
+)
+
+# Estado de ventanas deslizantes por sesión (características incrementales para los modelos que las usan)
+session_features = SessionFeatureStore(
+    max_sessions=EDGE_FEATURE_MAX_SESSIONS,
+    idle_seconds=EDGE_FEATURE_SESSION_IDLE_SECONDS,
+)
+
+# Diario local donde se guardan los lotes mientras RabbitMQ no está disponible
+data_journal = MessageJournal(
+    EDGE_JOURNAL_DIR,
+    segment_max_bytes=EDGE_JOURNAL_SEGMENT_BYTES,
+    max_bytes=EDGE_JOURNAL_MAX_BYTES,
+    fsync=EDGE_JOURNAL_FSYNC,
+    fsync_interval=EDGE_JOURNAL_FSYNC_INTERVAL_SECONDS,
+) if EDGE_JOURNAL_DIR else None
+
+# Publicador persistente que agrupa en lotes los mensajes de la cola de ingesta
+data_publisher = BatchingPublisher(
+    EDGE_INGEST_QUEUE,
+    max_batch_size=EDGE_PUBLISH_BATCH_SIZE,
+    flush_interval=EDGE_PUBLISH_FLUSH_INTERVAL_SECONDS,
+    max_pending=EDGE_PUBLISH_MAX_PENDING,
+    enqueue_timeout=EDGE_PUBLISH_ENQUEUE_TIMEOUT_SECONDS,
+    wire_format=EDGE_QUEUE_WIRE_FORMAT,
+    partitions=INGEST_PARTITIONS,
+    journal=data_journal,
+    replay_batch_size=EDGE_JOURNAL_REPLAY_BATCH_SIZE,
+    replay_rate=EDGE_JOURNAL_REPLAY_RATE,
+)
+
+# Escritura diferida por lotes de los datos recibidos en /api/datarecovery/data
+recovery_writer = WriteBehindWriter(
+    async_ticwatch_collection,
+    max_batch_size=EDGE_RECOVERY_WRITE_BATCH_SIZE,
+    flush_interval=EDGE_RECOVERY_WRITE_FLUSH_INTERVAL_SECONDS,
+    max_pending=EDGE_RECOVERY_WRITE_MAX_PENDING,
+    durability=EDGE_RECOVERY_WRITE_DURABILITY,
+)
+
+# Estado del nodo en Prometheus: estos gauges se leen de los objetos anteriores en cada scrape de /metrics
+Gauge("edge_ready", "1 cuando el nodo ha terminado el calentamiento de modelos.").set_function(lambda: model_warmer.ready)
+Gauge("edge_saturated", "1 mientras el control de admisión considera el nodo saturado.").set_function(admission_controller.saturated)
+Gauge("edge_in_flight_requests", "Peticiones de predicción en ejecución.").set_function(lambda: admission_controller.in_flight)
+Gauge("edge_queued_requests", "Peticiones de predicción esperando turno.").set_function(lambda: admission_controller.queued)
+Gauge("edge_model_cache_bytes", "Bytes ocupados por los modelos en memoria.").set_function(lambda: model_cache.current_bytes)
+Gauge("edge_model_cache_entries", "Modelos en memoria.").set_function(lambda: len(model_cache))
+Gauge("edge_publisher_pending_messages", "Mensajes pendientes de publicar en RabbitMQ.").set_function(data_publisher.pending)
+Gauge("edge_journal_pending_bytes", "Bytes del diario local pendientes de reenviar a RabbitMQ.").set_function(data_publisher.journal_pending_bytes)
+Gauge("edge_recovery_writer_pending_documents", "Documentos pendientes de escribir en MongoDB.").set_function(recovery_writer.pending)
+Gauge("edge_active_sessions", "Sesiones con estado de ventanas deslizantes en memoria.").set_function(lambda: len(session_features))
 
 # Variable para identificar este nodo Edge específico
 NODE_ID = os.environ.get("EDGE_NODE_ID", "edge_node")
 
 # --- Funciones Asíncronas de Segundo Plano ---
 async def publish_data_message_async(message: dict):
-    """Función asíncrona para publicar un mensaje en la cola."""
-    try:
-        # Publicar el mensaje de datos en la cola de ingesta
-        publish_data_message(message)
-        print(f"Background task: Message published for user {message.get('user_id')}", file=sys.stderr)
-    except Exception as e:
-        print(f"Background task: Error publishing message for user {message.get('user_id')}: {e}", file=sys.stderr)
+    """
+    Encola un mensaje en el publicador por lotes. Normalmente retorna de inmediato; si el
+    buffer está lleno espera a que se libere espacio (backpressure sobre la petición).
+    """
+    if not await data_publisher.publish(message):
+        print(f"Error publishing message for user {message.get('user_id')}: publisher buffer unavailable", file=sys.stderr)
 
+async def publish_data_batch_async(messages: list):
+    """Encola un lote de mensajes; el publicador los envía junto a los de otras peticiones."""
+    if not await data_publisher.publish_many(messages):
+        print(f"Error publishing batch of {len(messages)} messages: publisher buffer unavailable", file=sys.stderr)
+
+
+def on_model_update_event(event: dict):
+    """
+    Se ejecuta en el hilo del consumidor de eventos de modelo. Programa la actualización
+    en el event loop del servidor, donde se descarga e intercambia el modelo en segundo plano.
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        model_registry.handle_model_update(event.get("user_id"), event.get("model_type")),
+        event_loop,
+    )
+    future.add_done_callback(_log_model_update_failure)
+
+def _log_model_update_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error applying model update event: {future.exception()}", file=sys.stderr)
+
+# Consumidor de los eventos de modelo actualizado publicados por la Cloud API y el Cloud Trainer
+model_update_listener = ModelUpdateListener(on_event=on_model_update_event)
+event_loop = None
+background_tasks = []
+
+async def persist_recent_users_loop():
+    """Guarda periódicamente la lista de usuarios recientes (solo si ha cambiado)."""
+    while True:
+        await asyncio.sleep(EDGE_RECENT_USERS_SAVE_INTERVAL_SECONDS)
+        await asyncio.to_thread(recent_users.save)
 
 # --- Inicialización del Nodo Edge ---
 async def initialize_edge_node():
@@ -36,24 +171,45 @@ async def initialize_edge_node():
     Función de inicialización que se ejecuta al iniciar el servidor FastAPI.
     """
     print(f"Initializing Edge Node: {NODE_ID}", file=sys.stderr)
-    # Opcional: Precargar el modelo genérico al inicio del Edge para reducir latencia en nuevos usuarios
-    try:
-        generic_model_bytes = cloud_api_client.download_model(user_id=None)
-        if generic_model_bytes:
-            # TicWatchPredictor se importa aquí para evitar dependencia circular al inicio
-            from app.models.ticwatch_predictor import TicWatchPredictor
-            user_predictors['generic_fallback'] = TicWatchPredictor(model_bytes=generic_model_bytes)
-            print("Generic model preloaded for Edge Node.", file=sys.stderr)
-        else:
-            print("Warning: Could not preload generic model for Edge Node.", file=sys.stderr)
-    except Exception as e:
-        print(f"Error preloading generic model: {e}", file=sys.stderr)
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    data_publisher.start()
+    recovery_writer.start()
+    model_update_listener.start()
+    # Precargar en segundo plano el modelo genérico (la instancia compartida por los usuarios sin
+    # modelo personalizado) y los de los usuarios recientes. /health responde 503 hasta que termina
+    await asyncio.to_thread(recent_users.load)
+    background_tasks.append(asyncio.create_task(model_warmer.run()))
+    background_tasks.append(asyncio.create_task(persist_recent_users_loop()))
+
+async def shutdown_edge_node():
+    """Libera los clientes de E/S compartidos al apagar el servidor."""
+    model_update_listener.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await asyncio.to_thread(recent_users.save)
+    # Publicar lo que quede en el buffer antes de cerrar la conexión con RabbitMQ
+    await data_publisher.stop()
+    # Escribir los documentos pendientes antes de cerrar el cliente de MongoDB
+    await recovery_writer.stop()
+    await cloud_api_client.aclose()
+    await mongo_async_client.close()
+    model_mappings.close()
 
 app.add_event_handler("startup", initialize_edge_node)
+app.add_event_handler("shutdown", shutdown_edge_node)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Respuesta rápida (429/503) con Retry-After para las peticiones descartadas por sobrecarga."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.reason},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 # --- Registro de Rutas ---
 # Importar el router de rutas
 from edge_node.routes.activity import router as activity_router
+from edge_node.routes.stream import router as stream_router
 
 @app.get("/")
 def read_root():
@@ -61,10 +217,25 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    # "saturated" permite al Manager dejar de asignar usuarios a este nodo mientras dure la sobrecarga.
+    # Mientras se calientan los modelos responde 503, para que no reciba tráfico estando en frío
+    ready = model_warmer.ready
+    content = {"status": "ok" if ready else "warming", "ready": ready, "saturated": admission_controller.saturated(),
+               "warmup": model_warmer.stats(),
+               "admission": admission_controller.stats(), "model_cache": model_cache.stats(), "model_loads": model_registry.loads.stats(),
+               "publisher": data_publisher.stats(), "recovery_writer": recovery_writer.stats(),
+               "session_features": session_features.stats()}
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
+@app.get("/metrics")
+def metrics():
+    """Métricas del nodo en el formato de texto de Prometheus (latencias por etapa, contadores y estado)."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Incluir el router en la aplicación principal de FastAPI
 # app.include_router(activity_router, prefix="/predict_activity", tags=["Activity Prediction"])
 app.include_router(activity_router, tags=["Activity Prediction"])
+# Canal WebSocket para sesiones de streaming (una conexión por sesión del reloj)
+app.include_router(stream_router, tags=["Activity Streaming"])
 
 
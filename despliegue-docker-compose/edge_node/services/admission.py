@@ -0,0 +1,146 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable
+
+
+class AdmissionRejected(Exception):
+    """Petición rechazada por el control de admisión. status_code es 429 o 503."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Control de admisión de las rutas de predicción del Nodo Edge.
+
+    Como mucho max_concurrent peticiones se ejecutan a la vez; las siguientes esperan en una
+    cola de max_queue posiciones durante, como mucho, el SLO de latencia (latency_slo). Si la
+    cola está llena se responde 429 y si la espera agota el SLO, 503: en ambos casos de
+    inmediato y con un Retry-After estimado, en lugar de acumular trabajo en el event loop.
+
+    Las cargas de modelo en frío (usuarios cuyo modelo no está en memoria) son lo primero que
+    se descarta: se rechazan con 503 en cuanto el nodo está saturado (hay peticiones en cola
+    o la latencia media supera el SLO) o si ya hay max_cold_loads en curso. Las predicciones
+    con el modelo ya cargado solo se rechazan cuando no caben en la cola.
+    """
+
+    def __init__(self, max_concurrent: int = 64, max_queue: int = 256, latency_slo: float = 0.5,
+                 max_cold_loads: int = 8, ewma_alpha: float = 0.2, latency_window: float = 10,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.latency_slo = latency_slo
+        self.max_cold_loads = max_cold_loads
+        self.ewma_alpha = ewma_alpha
+        self.latency_window = latency_window
+        self.clock = clock
+        self.in_flight = 0
+        self.queued = 0
+        self.cold_loads = 0
+        # Media móvil exponencial de la latencia de las peticiones admitidas (segundos). Deja de
+        # contar si no termina ninguna petición en latency_window segundos, para que un pico
+        # pasado no deje el nodo marcado como saturado indefinidamente
+        self.latency_ewma = 0.0
+        self._last_completed = None
+        self._waiters = deque()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "slo_timeout": 0, "cold_load": 0}
+
+    def recent_latency(self) -> float:
+        if self._last_completed is None or self.clock() - self._last_completed > self.latency_window:
+            return 0.0
+        return self.latency_ewma
+
+    def saturated(self) -> bool:
+        return self.queued > 0 or self.recent_latency() > self.latency_slo
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere capacidad (como mínimo 1)."""
+        backlog = (self.queued + self.in_flight) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(backlog * max(self.recent_latency(), self.latency_slo)))
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserva un hueco de ejecución para la petición o lanza AdmissionRejected."""
+        await self._acquire()
+        started = self.clock()
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            finished = self.clock()
+            self.latency_ewma = self.recent_latency() + self.ewma_alpha * (finished - started - self.recent_latency())
+            self._last_completed = finished
+            self._release()
+
+    @asynccontextmanager
+    async def cold_load(self):
+        """
+        Envuelve la carga de un modelo que no está en memoria. Se rechaza antes que cualquier
+        predicción con el modelo ya cargado: si el nodo está saturado o hay demasiadas en curso.
+        """
+        if self.saturated() or self.cold_loads >= self.max_cold_loads:
+            self.rejected["cold_load"] += 1
+            raise AdmissionRejected(503, "Node saturated. Cold model loads are temporarily shed.", self.retry_after())
+        self.cold_loads += 1
+        try:
+            yield
+        finally:
+            self.cold_loads -= 1
+
+    def stats(self) -> dict:
+        return {
+            "saturated": self.saturated(),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "cold_loads": self.cold_loads,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "latency_slo_ms": round(self.latency_slo * 1000, 3),
+            "latency_ewma_ms": round(self.recent_latency() * 1000, 3),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+    async def _acquire(self):
+        if self.in_flight < self.max_concurrent and self.queued == 0:
+            self.in_flight += 1
+            return
+        if self.queued >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected(429, "Too many pending requests on this node.", self.retry_after())
+
+        # Esperar turno (FIFO). _release pasa el hueco directamente al primero de la cola
+        turn = asyncio.get_running_loop().create_future()
+        self._waiters.append(turn)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(turn), timeout=self.latency_slo)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if turn.done() and not turn.cancelled():
+                # El hueco llegó justo al agotarse el plazo: se cede al siguiente
+                self._release()
+            else:
+                turn.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected["slo_timeout"] += 1
+            raise AdmissionRejected(503, "Request could not be scheduled within the latency SLO.", self.retry_after())
+        finally:
+            self.queued -= 1
+
+    def _release(self):
+        # Pasar el hueco al primer waiter que siga esperando; si no hay ninguno, liberarlo
+        while self._waiters:
+            turn = self._waiters.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return
+        self.in_flight -= 1
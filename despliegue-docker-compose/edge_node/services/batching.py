@@ -0,0 +1,47 @@
+import asyncio
+import time
+from typing import Callable
+
+
+async def next_batch(queue: asyncio.Queue, max_batch_size: int, flush_interval: float,
+                     is_stopping: Callable[[], bool]) -> list:
+    """
+    Espera el primer elemento de la cola y agrupa los que lleguen hasta completar el lote
+    (max_batch_size) o agotar flush_interval. Al parar (is_stopping()), devuelve lo que quede
+    en la cola sin esperar; una lista vacía indica que ya no queda nada.
+    """
+    batch = []
+    while not batch:
+        if is_stopping() and queue.empty():
+            return batch
+        try:
+            # Se despierta periódicamente para comprobar si hay que parar
+            batch.append(await asyncio.wait_for(queue.get(), timeout=max(flush_interval, 0.1)))
+        except asyncio.TimeoutError:
+            continue
+
+    deadline = time.monotonic() + flush_interval
+    while len(batch) < max_batch_size:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or is_stopping():
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+async def enqueue(queue: asyncio.Queue, item, timeout: float):
+    """
+    Encola un elemento, esperando como mucho timeout segundos a que haya sitio (lanza
+    asyncio.TimeoutError si no lo hay). Con sitio en la cola se encola sin esperar: en Python
+    3.9 asyncio.wait_for crea una tarea por llamada, y solo se usa si la cola está llena.
+    """
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        await asyncio.wait_for(queue.put(item), timeout=timeout)
@@ -0,0 +1,261 @@
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+import msgpack
+
+# Cabecera de cada registro: longitud del contenido y CRC32, en little-endian
+RECORD_HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".seg"
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class MessageJournal:
+    """
+    Diario local (append-only) de los mensajes que el Nodo Edge no ha podido publicar en RabbitMQ.
+
+    Los lotes se escriben como registros (cabecera con longitud y CRC32 + lista de mensajes en
+    MessagePack) en ficheros de segmento numerados de como mucho segment_max_bytes. Un cursor
+    persistido (segmento y posición) indica hasta dónde se ha reenviado ya, y los segmentos se
+    borran en cuanto se han reenviado por completo. El diario entero ocupa como mucho max_bytes:
+    por encima, append() rechaza los lotes nuevos.
+
+    fsync controla la durabilidad frente a un apagado del nodo: "always" sincroniza cada
+    registro, "interval" como mucho cada fsync_interval segundos y "never" lo deja al sistema
+    operativo. Con "interval", append() solo sincroniza si ha pasado el intervalo desde la
+    última vez, así que quien use el diario debe llamar a sync() cada fsync_interval segundos
+    (BatchingPublisher lo hace) para que ningún registro quede sin sincronizar más de ese tiempo
+    aunque no lleguen más lotes. Un registro incompleto o corrupto (p. ej. escrito durante una caída) da por
+    terminado su segmento.
+
+    No es thread-safe: todas las llamadas deben hacerse desde un mismo hilo.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024, max_bytes: int = 512 * 1024 * 1024,
+                 fsync: str = "interval", fsync_interval: float = 1.0, clock=time.monotonic):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unsupported fsync policy '{fsync}'. Expected one of {FSYNC_POLICIES}.")
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._clock = clock
+        self._cursor_path = os.path.join(directory, "cursor.json")
+        self._segments = []  # números de segmento existentes, en orden
+        self._sizes = {}
+        # Total de bytes en disco; se lee también desde otros hilos (gauges de /metrics)
+        self._total_bytes = 0
+        self._cursor = (None, 0)  # (segmento, posición) del siguiente registro por reenviar
+        self._active = None  # fichero del segmento en escritura
+        self._active_seq = None
+        self._last_sync = 0.0
+        self._unsynced = False
+        self._opened = False
+        self.journaled_messages = 0
+        self.dropped_messages = 0
+        self.corrupt_records = 0
+
+    def open(self):
+        """Recupera los segmentos y el cursor de una ejecución anterior."""
+        if self._opened:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                seq = int(name[:-len(SEGMENT_SUFFIX)])
+                self._segments.append(seq)
+                self._sizes[seq] = os.path.getsize(self._segment_path(seq))
+                self._total_bytes += self._sizes[seq]
+        self._segments.sort()
+        try:
+            with open(self._cursor_path) as f:
+                cursor = json.load(f)
+            if cursor["segment"] in self._sizes:
+                self._cursor = (cursor["segment"], min(cursor["offset"], self._sizes[cursor["segment"]]))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not read journal cursor from {self._cursor_path}: {e}. Replaying from the oldest segment.", file=sys.stderr)
+        self._opened = True
+        if self._segments:
+            print(f"Journal opened with {len(self._segments)} segments ({self.pending_bytes()} bytes pending replay).", file=sys.stderr)
+
+    def append(self, messages: list) -> bool:
+        """Añade un lote al diario. Retorna False si no cabe en max_bytes o no se puede escribir."""
+        if not self._opened:
+            self.open()
+        payload = msgpack.packb(messages, use_bin_type=True)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if self.total_bytes() + len(record) > self.max_bytes:
+            self.dropped_messages += len(messages)
+            print(f"Journal full ({self.max_bytes} bytes). Dropping batch of {len(messages)} messages.", file=sys.stderr)
+            return False
+        try:
+            if self._active is None or self._sizes[self._active_seq] + len(record) > self.segment_max_bytes:
+                self._rotate()
+            self._active.write(record)
+            self._active.flush()
+            self._sizes[self._active_seq] += len(record)
+            self._total_bytes += len(record)
+            self._unsynced = True
+            if self.fsync == "always" or (self.fsync == "interval" and self._clock() - self._last_sync >= self.fsync_interval):
+                self._sync()
+        except OSError as e:
+            self.dropped_messages += len(messages)
+            print(f"Error writing to journal in {self.directory}: {e}", file=sys.stderr)
+            return False
+        self.journaled_messages += len(messages)
+        return True
+
+    def sync(self):
+        """Sincroniza con el disco los registros escritos desde la última sincronización."""
+        if self.fsync == "never" or not self._unsynced or self._active is None:
+            return
+        try:
+            self._sync()
+        except OSError as e:
+            print(f"Error syncing journal segment {self._active_seq}: {e}", file=sys.stderr)
+
+    def read_batch(self, max_messages: int) -> tuple:
+        """
+        Lee registros desde el cursor hasta juntar max_messages mensajes (al menos un registro).
+
+        Returns:
+            (mensajes, posición tras el último registro leído), para pasarla a commit()
+            una vez reenviados. Sin nada pendiente retorna ([], None).
+        """
+        messages = []
+        seq, offset = self._start()
+        while seq is not None and (not messages or len(messages) < max_messages):
+            with open(self._segment_path(seq), "rb") as f:
+                f.seek(offset)
+                end = self._sizes[seq]
+                while offset < end and (not messages or len(messages) < max_messages):
+                    record = self._read_record(f, end - offset)
+                    if record is None:
+                        self.corrupt_records += 1
+                        print(f"Corrupt or truncated record in journal segment {seq} at offset {offset}. Skipping the rest of the segment.", file=sys.stderr)
+                        offset = end
+                        break
+                    messages.extend(record)
+                    offset = f.tell()
+            if offset >= self._sizes[seq] and seq != self._segments[-1]:
+                seq, offset = self._segments[self._segments.index(seq) + 1], 0
+            else:
+                break
+        return messages, ((seq, offset) if seq is not None else None)
+
+    def commit(self, position: tuple):
+        """Avanza el cursor hasta position y borra los segmentos ya reenviados."""
+        if position is None:
+            return
+        seq, offset = position
+        for old_seq in [s for s in self._segments if s < seq]:
+            self._remove_segment(old_seq)
+        if seq == self._active_seq and offset >= self._sizes[seq]:
+            # El segmento en escritura está reenviado por completo: se empieza uno nuevo
+            self._close_active()
+            self._remove_segment(seq)
+            self._cursor = (None, 0)
+        elif seq != self._active_seq and offset >= self._sizes.get(seq, 0):
+            self._remove_segment(seq)
+            self._cursor = (None, 0)
+        else:
+            self._cursor = (seq, offset)
+        self._save_cursor()
+
+    def has_pending(self) -> bool:
+        return self.pending_bytes() > 0
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def pending_bytes(self) -> int:
+        seq, offset = self._cursor
+        return self._total_bytes - (offset if seq in self._sizes else 0)
+
+    def close(self):
+        self._close_active()
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "pending_bytes": self.pending_bytes(),
+            "journaled_messages": self.journaled_messages,
+            "dropped_messages": self.dropped_messages,
+            "corrupt_records": self.corrupt_records,
+        }
+
+    def _start(self) -> tuple:
+        seq, offset = self._cursor
+        if seq in self._sizes:
+            return seq, offset
+        return (self._segments[0], 0) if self._segments else (None, 0)
+
+    @staticmethod
+    def _read_record(f, available: int):
+        if available < RECORD_HEADER.size:
+            return None
+        length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        if length > available - RECORD_HEADER.size:
+            return None
+        payload = f.read(length)
+        if zlib.crc32(payload) != crc:
+            return None
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except Exception:
+            return None
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _rotate(self):
+        # Los segmentos de una ejecución anterior no se reabren: se escribe siempre en uno nuevo
+        self._close_active()
+        seq = self._segments[-1] + 1 if self._segments else 1
+        self._active = open(self._segment_path(seq), "ab")
+        self._active_seq = seq
+        self._segments.append(seq)
+        self._sizes[seq] = 0
+
+    def _sync(self):
+        os.fsync(self._active.fileno())
+        self._last_sync = self._clock()
+        self._unsynced = False
+
+    def _close_active(self):
+        if self._active is None:
+            return
+        try:
+            self._active.flush()
+            if self.fsync != "never":
+                os.fsync(self._active.fileno())
+            self._active.close()
+        except OSError as e:
+            print(f"Error closing journal segment {self._active_seq}: {e}", file=sys.stderr)
+        self._active = None
+        self._active_seq = None
+        self._unsynced = False
+
+    def _remove_segment(self, seq: int):
+        self._segments.remove(seq)
+        self._total_bytes -= self._sizes.pop(seq, 0)
+        try:
+            os.remove(self._segment_path(seq))
+        except OSError as e:
+            print(f"Error removing journal segment {seq}: {e}", file=sys.stderr)
+
+    def _save_cursor(self):
+        seq, offset = self._cursor
+        tmp_path = f"{self._cursor_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"segment": seq, "offset": offset}, f)
+            os.replace(tmp_path, self._cursor_path)
+        except OSError as e:
+            print(f"Error saving journal cursor: {e}", file=sys.stderr)
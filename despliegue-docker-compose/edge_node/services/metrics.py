@@ -0,0 +1,44 @@
+from prometheus_client import Counter, Histogram
+
+# Métricas Prometheus del Nodo Edge, expuestas en /metrics (ver edge_node/server.py).
+# Las etapas se miden en segundos, con cubos desde 0,5 ms (predicción con el modelo ya en
+# memoria) hasta 10 s (descarga de un modelo grande en una carga en frío)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Etapas: model_lookup (resolver el predictor del usuario, con o sin carga), model_download y
+# model_unpickle (las dos partes de una carga en frío), preprocess (ventanas deslizantes),
+# predict, mongo_insert (insert_many de un lote) y queue_publish (envío de un lote a RabbitMQ)
+STAGE_SECONDS = Histogram(
+    "edge_stage_duration_seconds", "Duración de cada etapa del procesamiento en el Nodo Edge.",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+
+REQUEST_SECONDS = Histogram(
+    "edge_request_duration_seconds", "Duración de las peticiones de predicción admitidas, por ruta.",
+    ["route"], buckets=LATENCY_BUCKETS,
+)
+
+# result: hit (el modelo del usuario ya estaba en memoria) o miss (hay que resolverlo o cargarlo)
+MODEL_CACHE_LOOKUPS = Counter(
+    "edge_model_cache_lookups", "Consultas del modelo de un usuario en la caché de modelos.", ["result"],
+)
+
+# Cargas de modelo (en frío, de un artefacto o refrescos) que se unieron a una ya en curso
+# en lugar de repetir la descarga (ver edge_node/services/single_flight.py)
+MODEL_LOADS_COALESCED = Counter(
+    "edge_model_loads_coalesced", "Cargas de modelo que esperaron a una carga ya en curso en lugar de repetirla.",
+)
+
+# stage: la etapa en la que se produjo el error (mismos nombres que STAGE_SECONDS)
+ERRORS = Counter("edge_errors", "Errores del Nodo Edge por etapa.", ["stage"])
+
+# reason: no_mapping, not_personalized, download_failed o load_error
+GENERIC_FALLBACKS = Counter(
+    "edge_generic_fallbacks", "Usuarios servidos con el modelo genérico en lugar de uno personalizado.", ["reason"],
+)
+
+# event: journaled (guardado en el diario local al no poder publicarse), replayed (reenviado
+# desde el diario) o dropped (descartado por falta de espacio en el diario)
+JOURNAL_MESSAGES = Counter(
+    "edge_journal_messages", "Mensajes de la cola de ingesta que pasan por el diario local del Nodo Edge.", ["event"],
+)
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Políticas de expulsión soportadas por la caché de modelos
+EVICTION_POLICIES = ("lru", "lfu")
+
+
+class _CacheEntry:
+    __slots__ = ("value", "size_bytes", "pinned", "hits", "last_access")
+
+    def __init__(self, value: Any, size_bytes: int, pinned: bool, now: float):
+        self.value = value
+        self.size_bytes = size_bytes
+        self.pinned = pinned
+        self.hits = 0
+        self.last_access = now
+
+
+class ModelCache:
+    """
+    Caché de modelos en memoria limitada por un presupuesto de bytes.
+
+    Cada entrada guarda el tamaño estimado del modelo (calculado al cargarlo). Cuando
+    una inserción supera el presupuesto se expulsan entradas según la política elegida:
+    'lru' (la usada hace más tiempo) o 'lfu' (la menos usada; en empate, la más antigua).
+    Opcionalmente, las entradas que llevan más de ttl_seconds sin usarse se consideran
+    caducadas. Las entradas fijadas (pinned) cuentan para el presupuesto pero nunca se expulsan.
+    """
+
+    def __init__(self, max_bytes: int, policy: str = "lru", ttl_seconds: Optional[float] = None, clock=time.monotonic):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Política de expulsión desconocida: {policy}. Opciones: {EVICTION_POLICIES}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl_seconds = ttl_seconds if ttl_seconds else None
+        self._clock = clock
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Optional[Any]:
+        """Devuelve el modelo asociado a la clave, o None si no está (o ha caducado)."""
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.hits += 1
+            entry.last_access = now
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: str, value: Any, size_bytes: int, pinned: bool = False) -> bool:
+        """
+        Inserta (o reemplaza) un modelo en la caché, expulsando otros si es necesario.
+        Devuelve False si el modelo no cabe en el presupuesto ni expulsando todo lo expulsable;
+        en ese caso no se guarda (y la entrada anterior de la clave, si la había, se mantiene) y
+        el llamante puede usarlo solo para la petición en curso.
+        """
+        with self._lock:
+            now = self._clock()
+            # La entrada que se reemplaza no cuenta: si el nuevo modelo no cabe, se conserva
+            pinned_bytes = sum(entry.size_bytes for entry_key, entry in self._entries.items()
+                               if entry.pinned and entry_key != key)
+            if not pinned and pinned_bytes + size_bytes > self.max_bytes:
+                return False
+            if key in self._entries:
+                self._remove(key)
+
+            self._expire(now)
+            while self.current_bytes + size_bytes > self.max_bytes:
+                victim = self._select_victim()
+                if victim is None:
+                    break
+                self._remove(victim)
+                self.evictions += 1
+
+            self._entries[key] = _CacheEntry(value, size_bytes, pinned, now)
+            self.current_bytes += size_bytes
+            return True
+
+    def pop(self, key: str) -> Optional[Any]:
+        """Elimina una entrada de la caché y devuelve su modelo (o None si no existía)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._remove(key)
+            return entry.value
+
+    def stats(self) -> dict:
+        """Contadores y ocupación de la caché, para diagnóstico y métricas."""
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    # --- Métodos internos (se llaman con el lock adquirido) ---
+    def _is_expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl_seconds is not None and not entry.pinned and now - entry.last_access > self.ttl_seconds
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if self._is_expired(entry, now)]
+        for key in expired:
+            self._remove(key)
+            self.expirations += 1
+
+    def _select_victim(self) -> Optional[str]:
+        candidates = [(key, entry) for key, entry in self._entries.items() if not entry.pinned]
+        if not candidates:
+            return None
+        if self.policy == "lru":
+            # El OrderedDict mantiene el orden de uso: la primera entrada es la menos reciente
+            return candidates[0][0]
+        return min(candidates, key=lambda item: (item[1].hits, item[1].last_access))[0]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size_bytes
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import sys
+from typing import Optional
+
+from app.models.ticwatch_predictor import TicWatchPredictor
+from edge_node.services.model_cache import ModelCache
+from edge_node.services.single_flight import SingleFlight
+from edge_node.services.metrics import STAGE_SECONDS, MODEL_CACHE_LOOKUPS, MODEL_LOADS_COALESCED, ERRORS, GENERIC_FALLBACKS
+
+# Clave del artefacto del modelo genérico en la caché (compartido por todos los usuarios sin modelo propio)
+GENERIC_MODEL_KEY = "generic"
+
+
+def artifact_key_for(model_bytes: bytes) -> str:
+    """Identidad de un artefacto de modelo: el hash de su contenido."""
+    return f"sha256:{hashlib.sha256(model_bytes).hexdigest()}"
+
+
+class ModelRegistry:
+    """
+    Resuelve el predictor de cada usuario del Nodo Edge.
+
+    Los predictores se guardan en la caché por identidad de artefacto (GENERIC_MODEL_KEY para
+    el genérico y el hash del contenido para los personalizados), y cada usuario solo guarda
+    la clave del artefacto que usa. Así, todos los usuarios mapeados al modelo genérico
+    comparten una única instancia, y un modelo ya cargado no se vuelve a deserializar.
+
+    Las cargas en frío se coalescen: las peticiones concurrentes de un mismo usuario (y las
+    cargas concurrentes de un mismo artefacto) esperan a una única carga en curso. La consulta
+    del mapeo (mapping_lookup) y la descarga (cloud_api_client) son asíncronas, y la
+    deserialización del modelo se ejecuta en un hilo para no bloquear el event loop.
+    """
+
+    def __init__(self, model_cache: ModelCache, cloud_api_client, mapping_lookup):
+        self.model_cache = model_cache
+        self.cloud_api_client = cloud_api_client
+        self.mapping_lookup = mapping_lookup
+        self.loads = SingleFlight(on_coalesced=MODEL_LOADS_COALESCED.inc)
+        # user_id -> clave del artefacto que usa ese usuario
+        self.user_artifacts: dict[str, str] = {}
+        # Hash del contenido del genérico, para reconocerlo si llega como modelo "personalizado"
+        self.generic_content_key: Optional[str] = None
+        # Se incrementa con cada intercambio en caliente, para que quien guarde un predictor
+        # (p. ej. una sesión de streaming) sepa cuándo debe volver a resolverlo
+        self.version = 0
+        # user_id -> número de eventos de modelo actualizado recibidos para ese usuario. Una
+        # carga o un refresco que empezó con una generación anterior no asigna su resultado
+        self.user_generations: dict[str, int] = {}
+        # Usuarios cuyo modelo se está resolviendo (carga en frío en curso)
+        self._resolving = set()
+
+    async def get_predictor(self, user_id: str) -> Optional[TicWatchPredictor]:
+        """
+        Devuelve el predictor del usuario, cargándolo desde la Cloud API si su artefacto no
+        está en la caché. Usa el modelo personalizado si el mapeo del usuario lo indica y, en
+        cualquier otro caso (usuario nuevo, mapeo desconocido o error al descargar), el genérico.
+        Devuelve None si no se ha podido cargar ningún modelo.
+        """
+        with STAGE_SECONDS.labels("model_lookup").time():
+            artifact_key = self.user_artifacts.get(user_id)
+            if artifact_key is not None:
+                predictor = self.model_cache.get(artifact_key)
+                if predictor is not None:
+                    MODEL_CACHE_LOOKUPS.labels("hit").inc()
+                    return predictor
+
+            MODEL_CACHE_LOOKUPS.labels("miss").inc()
+            return await self.loads.run(f"user:{user_id}", lambda: self._resolve_user(user_id))
+
+    def is_warm(self, user_id: str) -> bool:
+        """True si el modelo del usuario ya está en memoria (get_predictor no tendrá que cargarlo)."""
+        artifact_key = self.user_artifacts.get(user_id)
+        return artifact_key is not None and artifact_key in self.model_cache
+
+    async def get_generic_predictor(self) -> Optional[TicWatchPredictor]:
+        """Devuelve la instancia compartida del modelo genérico, descargándola si hace falta."""
+        predictor = self.model_cache.get(GENERIC_MODEL_KEY)
+        if predictor is not None:
+            return predictor
+
+        return await self.loads.run(GENERIC_MODEL_KEY, self._load_generic)
+
+    async def handle_model_update(self, user_id: Optional[str], model_type: str):
+        """
+        Aplica un evento de modelo actualizado: descarga el nuevo modelo en segundo plano y
+        lo intercambia de forma atómica (una sola asignación) cuando ya está cargado. Mientras
+        tanto, las predicciones siguen usando el modelo anterior sin bloquearse.
+        Los usuarios que este nodo aún no ha atendido se ignoran: cargarán el modelo al llegar.
+        Si el modelo del usuario se está cargando en frío, la carga vuelve a resolverlo al
+        terminar en lugar de asignar un modelo que puede ser el anterior.
+        """
+        if user_id is None:
+            await self.loads.run("refresh:generic", self._refresh_generic)
+            return
+        if user_id not in self.user_artifacts and user_id not in self._resolving:
+            return
+        generation = self.user_generations.get(user_id, 0) + 1
+        self.user_generations[user_id] = generation
+        if user_id in self.user_artifacts:
+            await self.loads.run(f"refresh:{user_id}:{generation}", lambda: self._refresh_user(user_id, model_type, generation))
+
+    async def _refresh_generic(self):
+        if self.model_cache.get(GENERIC_MODEL_KEY) is None:
+            return
+        # _load_generic reemplaza la entrada fijada del genérico; los usuarios que apuntan
+        # a GENERIC_MODEL_KEY pasan a usar la nueva instancia en su siguiente petición
+        if await self._load_generic() is not None:
+            self.version += 1
+            print("Generic model hot-swapped after model update event.", file=sys.stderr)
+
+    async def _refresh_user(self, user_id: str, model_type: str, generation: int):
+        if model_type != "personalized":
+            new_key = GENERIC_MODEL_KEY if await self.get_generic_predictor() is not None else None
+        else:
+            model_bytes = await self._download(user_id)
+            if not model_bytes:
+                print(f"Updated model for user {user_id} could not be downloaded. Keeping the current one.", file=sys.stderr)
+                return
+            new_key, predictor = await self._get_or_load_artifact(model_bytes)
+            if predictor is None:
+                return
+
+        if self.user_generations.get(user_id) != generation:
+            # Ha llegado otro evento mientras se descargaba: lo aplica su propio refresco
+            return
+        previous_key = self.user_artifacts.get(user_id)
+        if new_key is None or new_key == previous_key:
+            return
+        self.user_artifacts[user_id] = new_key
+        self.version += 1
+        print(f"Model for user {user_id} hot-swapped to {new_key}.", file=sys.stderr)
+        # Liberar el artefacto anterior si ningún otro usuario lo usa
+        if previous_key and previous_key != GENERIC_MODEL_KEY and previous_key not in self.user_artifacts.values():
+            self.model_cache.pop(previous_key)
+
+    async def _resolve_user(self, user_id: str) -> Optional[TicWatchPredictor]:
+        self._resolving.add(user_id)
+        try:
+            while True:
+                generation = self.user_generations.get(user_id, 0)
+                artifact_key, predictor = await self._select_user_model(user_id)
+                if self.user_generations.get(user_id, 0) == generation:
+                    break
+                # Un evento de modelo actualizado llegó durante la carga: se vuelve a resolver
+                print(f"Model for user {user_id} was updated while loading. Resolving it again.", file=sys.stderr)
+            if predictor is not None:
+                self.user_artifacts[user_id] = artifact_key
+            return predictor
+        finally:
+            self._resolving.discard(user_id)
+
+    async def _select_user_model(self, user_id: str):
+        """(clave del artefacto, predictor) del modelo que corresponde al usuario según su mapeo."""
+        user_mapping = await self.mapping_lookup(user_id)
+        if user_mapping and user_mapping['model_path'] and user_mapping['model_type'] == "personalized":
+            try:
+                print(f"Loading personalized model for user {user_id} from Cloud API...", file=sys.stderr)
+                model_bytes = await self._download(user_id)
+                if model_bytes:
+                    artifact_key, predictor = await self._get_or_load_artifact(model_bytes)
+                    if predictor is not None:
+                        print(f"Loaded personalized model for user {user_id} ({artifact_key}).", file=sys.stderr)
+                        return artifact_key, predictor
+                GENERIC_FALLBACKS.labels("download_failed" if not model_bytes else "load_error").inc()
+                print(f"Personalized model not available for user {user_id}. Falling back to generic.", file=sys.stderr)
+            except Exception as e:
+                GENERIC_FALLBACKS.labels("load_error").inc()
+                print(f"Error loading custom model for user {user_id}: {e}. Falling back to generic.", file=sys.stderr)
+        elif user_mapping and user_mapping['model_path']:
+            GENERIC_FALLBACKS.labels("not_personalized").inc()
+            print(f"Unknown or generic model_type: {user_mapping['model_type']} for user {user_id}. Using generic.", file=sys.stderr)
+        else:
+            GENERIC_FALLBACKS.labels("no_mapping").inc()
+            print(f"New user {user_id} or no mapping found. Using generic model.", file=sys.stderr)
+
+        return GENERIC_MODEL_KEY, await self.get_generic_predictor()
+
+    async def _load_generic(self) -> Optional[TicWatchPredictor]:
+        print("Downloading generic model from Cloud API...", file=sys.stderr)
+        model_bytes = await self._download(None)
+        if not model_bytes:
+            print("Generic model not found in Cloud API.", file=sys.stderr)
+            return None
+
+        predictor = await self._unpickle(model_bytes)
+        if predictor is None:
+            return None
+        self.generic_content_key = artifact_key_for(model_bytes)
+        # El genérico se fija en la caché: lo comparten todos los usuarios y nunca se expulsa
+        self.model_cache.put(GENERIC_MODEL_KEY, predictor, size_bytes=predictor.model_size_bytes, pinned=True)
+        return predictor
+
+    async def _get_or_load_artifact(self, model_bytes: bytes):
+        """
+        Devuelve (clave, predictor) para unos bytes de modelo, reutilizando la instancia en caché
+        si ya hay una con el mismo contenido y deserializando el modelo solo en caso contrario.
+        """
+        artifact_key = artifact_key_for(model_bytes)
+        if artifact_key == self.generic_content_key:
+            return GENERIC_MODEL_KEY, await self.get_generic_predictor()
+
+        predictor = self.model_cache.get(artifact_key)
+        if predictor is None:
+            predictor = await self.loads.run(artifact_key, lambda: self._load_artifact(artifact_key, model_bytes))
+        return artifact_key, predictor
+
+    async def _load_artifact(self, artifact_key: str, model_bytes: bytes) -> Optional[TicWatchPredictor]:
+        predictor = await self._unpickle(model_bytes)
+        if predictor is None:
+            return None
+        if not self.model_cache.put(artifact_key, predictor, size_bytes=predictor.model_size_bytes):
+            print(f"Model {artifact_key} ({predictor.model_size_bytes} bytes) exceeds the model cache budget. Serving it without caching.", file=sys.stderr)
+        return predictor
+
+    async def _download(self, user_id: Optional[str]) -> Optional[bytes]:
+        """Descarga el modelo del usuario (o el genérico, con user_id None) de la Cloud API."""
+        with STAGE_SECONDS.labels("model_download").time():
+            model_bytes = await self.cloud_api_client.download_model(user_id=user_id)
+        if not model_bytes:
+            ERRORS.labels("model_download").inc()
+        return model_bytes
+
+    async def _unpickle(self, model_bytes: bytes) -> Optional[TicWatchPredictor]:
+        """
+        Deserializa un modelo en un hilo. Devuelve None si no se ha podido cargar. En memoria
+        solo queda la versión compilada (si se puede compilar): el Nodo Edge no re-entrena.
+        """
+        with STAGE_SECONDS.labels("model_unpickle").time():
+            predictor = await asyncio.to_thread(TicWatchPredictor, model_bytes=model_bytes, compiled_only=True)
+        if predictor.model is None:
+            ERRORS.labels("model_unpickle").inc()
+            return None
+        return predictor
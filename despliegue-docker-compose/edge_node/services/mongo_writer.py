@@ -0,0 +1,183 @@
+import asyncio
+import sys
+import time
+from typing import Optional
+
+from pymongo.errors import BulkWriteError
+
+from edge_node.services.batching import enqueue, next_batch
+from edge_node.services.metrics import STAGE_SECONDS, ERRORS
+
+# Modos de durabilidad: "buffered" confirma la petición en cuanto el documento entra en el
+# buffer; "flushed" espera a que el lote que lo contiene se haya escrito en MongoDB
+DURABILITY_MODES = ("buffered", "flushed")
+# Código de error de MongoDB para una clave duplicada (E11000)
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindWriter:
+    """
+    Buffer de escritura diferida para una colección de MongoDB.
+
+    Los documentos se encolan en memoria (como mucho max_pending) y una tarea en segundo
+    plano los escribe con insert_many(ordered=False) cuando se juntan max_batch_size o pasan
+    flush_interval segundos desde el primero. Con ordered=False un documento inválido no
+    impide escribir el resto del lote.
+
+    Si falla la conexión, el lote se reintenta (hasta max_retries veces, con espera creciente);
+    los documentos que MongoDB rechaza individualmente no se reintentan. Las claves duplicadas
+    en un reintento cuentan como escritas: son documentos que el intento fallido ya guardó
+    antes de perder la conexión. En modo "flushed"
+    quien escribe recibe el error; en modo "buffered" solo se registra y se contabiliza.
+    """
+
+    def __init__(self, collection, max_batch_size: int = 500, flush_interval: float = 0.1,
+                 max_pending: int = 50000, durability: str = "buffered", enqueue_timeout: float = 5,
+                 shutdown_timeout: float = 10, max_retries: int = 5, retry_delay: float = 0.5):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{durability}'. Expected one of {DURABILITY_MODES}.")
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Métricas expuestas en /health
+        self.flushes = 0
+        self.written_documents = 0
+        self.failed_documents = 0
+        self.rejected_documents = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def start(self):
+        """Arranca la tarea de escritura. Se llama desde el event loop del servidor."""
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, document: dict):
+        """Escribe un documento. Ver write_many."""
+        await self.write_many([document])
+
+    async def write_many(self, documents: list):
+        """
+        Encola los documentos. En modo "flushed" no retorna hasta que están escritos en MongoDB.
+        Lanza RuntimeError si el buffer sigue lleno tras enqueue_timeout segundos, y en modo
+        "flushed" la excepción de la escritura si algún documento no se ha podido guardar.
+        """
+        if self._queue is None or self._stopping:
+            self.rejected_documents += len(documents)
+            raise RuntimeError("Write-behind writer is not running.")
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for position, document in enumerate(documents):
+            future = loop.create_future() if self.durability == "flushed" else None
+            try:
+                await enqueue(self._queue, (document, future), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_documents += len(documents) - position
+                raise RuntimeError(f"Write-behind buffer full ({self.max_pending} documents).")
+            if future is not None:
+                futures.append(future)
+
+        if futures:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+    async def stop(self):
+        """Escribe los documentos pendientes (como mucho shutdown_timeout segundos)."""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            print(f"Write-behind shutdown timed out. {self._queue.qsize()} pending documents were not written.", file=sys.stderr)
+        self._task = None
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "queue_depth": self.pending(),
+            "flushes": self.flushes,
+            "written_documents": self.written_documents,
+            "failed_documents": self.failed_documents,
+            "rejected_documents": self.rejected_documents,
+            "flush_latency_ms": {
+                "last": round(self.last_flush_latency * 1000, 3),
+                "avg": round(self._total_flush_latency / self.flushes * 1000, 3) if self.flushes else 0.0,
+                "max": round(self.max_flush_latency * 1000, 3),
+            },
+        }
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                return
+            await self._flush(batch)
+
+    async def _next_batch(self) -> list:
+        return await next_batch(self._queue, self.max_batch_size, self.flush_interval, lambda: self._stopping)
+
+    async def _flush(self, batch: list):
+        documents = [document for document, _ in batch]
+        started = time.perf_counter()
+        errors = {}
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+                break
+            except BulkWriteError as e:
+                # Errores de documentos concretos (p. ej. claves duplicadas): el resto ya se ha escrito
+                for write_error in e.details.get("writeErrors", []):
+                    if attempt > 0 and write_error.get("code") == DUPLICATE_KEY_ERROR:
+                        # insert_many asigna el _id a los documentos: en un reintento, una clave
+                        # duplicada es un documento que el intento fallido ya llegó a escribir
+                        continue
+                    errors[write_error["index"]] = BulkWriteError({"writeErrors": [write_error]})
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    errors = {position: e for position in range(len(documents))}
+                    break
+                print(f"Error writing batch of {len(documents)} documents to MongoDB: {e}. Retrying in {delay} seconds...", file=sys.stderr)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        latency = time.perf_counter() - started
+        STAGE_SECONDS.labels("mongo_insert").observe(latency)
+        if errors:
+            ERRORS.labels("mongo_insert").inc()
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self._total_flush_latency += latency
+        self.written_documents += len(documents) - len(errors)
+        self.failed_documents += len(errors)
+        if errors:
+            print(f"{len(errors)} of {len(documents)} documents could not be written to MongoDB.", file=sys.stderr)
+
+        for position, (_, future) in enumerate(batch):
+            if future is None or future.done():
+                continue
+            if position in errors:
+                future.set_exception(errors[position])
+            else:
+                future.set_result(None)
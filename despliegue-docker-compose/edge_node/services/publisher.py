@@ -0,0 +1,354 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import pika
+
+from app.config import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS
+from app.data.ingest_partitions import INGEST_PARTITIONED_EXCHANGE, declare_partitions, group_by_partition
+from app.data.wire_format import encode_message
+from edge_node.services.journal import MessageJournal
+from edge_node.services.batching import enqueue, next_batch
+from edge_node.services.metrics import STAGE_SECONDS, ERRORS, JOURNAL_MESSAGES
+
+
+def default_connection_factory() -> pika.BlockingConnection:
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.BlockingConnection(
+        pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials, heartbeat=600)
+    )
+
+
+class UnconfirmedMessagesError(Exception):
+    """
+    Fallo al publicar un lote. unconfirmed son los mensajes que el broker no ha confirmado: en
+    modo particionado, los de las particiones que faltaban cuando falló la publicación.
+    """
+
+    def __init__(self, unconfirmed: list, cause: Exception):
+        super().__init__(str(cause))
+        self.unconfirmed = unconfirmed
+
+
+class BatchingPublisher:
+    """
+    Publicador persistente de la cola de ingesta del Nodo Edge.
+
+    Las peticiones encolan sus mensajes en un buffer en memoria acotado (max_pending) y una
+    tarea en segundo plano los agrupa y publica cuando se juntan max_batch_size mensajes o
+    pasan flush_interval segundos desde el primero, como un único mensaje (una lista) que el
+    Data Ingestor expande. Así el número de publicaciones en RabbitMQ depende del tamaño de
+    los lotes y no del número de peticiones. Cada lote se codifica en wire_format: "json" (una
+    lista) o "msgpack" (el formato por columnas de app.data.wire_format). Con partitions > 0
+    cada lote se reparte por usuario entre las colas de las particiones (un mensaje por
+    partición, ver app.data.ingest_partitions).
+
+    La conexión y el canal se mantienen abiertos entre lotes y solo se usan desde un hilo
+    dedicado (pika no es thread-safe). El canal trabaja en modo confirmación: un lote solo se
+    da por enviado cuando el broker lo confirma, y si falla se reintenta con espera creciente
+    sin descartarlo. Mientras tanto el buffer se llena y publish() espera (backpressure) hasta
+    enqueue_timeout segundos antes de rechazar el mensaje.
+
+    Con un journal (MessageJournal), los lotes que no se pueden publicar no se reintentan en
+    línea: se escriben en el diario local y el publicador sigue con los siguientes. Tras un
+    fallo no se vuelve a intentar conectar hasta que pasa la espera (creciente), y mientras
+    tanto los lotes van directamente al diario, de modo que las peticiones no esperan al
+    broker. Una segunda tarea reenvía el diario en lotes de replay_batch_size mensajes (como
+    mucho replay_rate mensajes por segundo, 0 = sin límite) cuando el broker vuelve a estar
+    disponible. Los mensajes que no caben en el buffer también van al diario. Si en modo
+    particionado solo se confirman algunas particiones de un lote, solo se reintentan (o se
+    guardan en el diario) los mensajes de las demás. Con la política
+    de fsync "interval", otra tarea sincroniza el diario cada fsync_interval segundos.
+
+    Al parar, se publican los mensajes pendientes antes de cerrar la conexión (o se guardan
+    en el diario si el broker no está disponible).
+    """
+
+    def __init__(self, queue_name: str, max_batch_size: int = 100, flush_interval: float = 0.05,
+                 max_pending: int = 10000, enqueue_timeout: float = 5, shutdown_timeout: float = 10,
+                 retry_delay: float = 0.5, max_retry_delay: float = 30, wire_format: str = "json", partitions: int = 0,
+                 journal: Optional[MessageJournal] = None, replay_batch_size: int = 1000, replay_rate: float = 0,
+                 replay_poll_interval: float = 1.0,
+                 connection_factory: Callable[[], pika.BlockingConnection] = default_connection_factory):
+        self.queue_name = queue_name
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.wire_format = wire_format
+        self.partitions = partitions
+        self.journal = journal
+        self.replay_batch_size = replay_batch_size
+        self.replay_rate = replay_rate
+        self.replay_poll_interval = replay_poll_interval
+        self.connection_factory = connection_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # El diario se usa siempre desde su propio hilo, que no se bloquea esperando al broker
+        self._journal_executor: Optional[ThreadPoolExecutor] = None
+        # Tras un fallo no se intenta publicar hasta este instante (time.monotonic)
+        self._broker_retry_at = 0.0
+        self._current_retry_delay = retry_delay
+        self._connection = None
+        self._channel = None
+        self._stopping = False
+        # Contadores expuestos en /health
+        self.published_messages = 0
+        self.published_batches = 0
+        self.failed_attempts = 0
+        self.rejected_messages = 0
+        self.journaled_messages = 0
+        self.replayed_messages = 0
+
+    def start(self):
+        """Arranca la tarea de envío. Se llama desde el event loop del servidor."""
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rabbitmq-publisher")
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        if self.journal is not None:
+            # Lo que quedó en el diario de una ejecución anterior se reenvía al arrancar
+            self.journal.open()
+            self._journal_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="edge-journal")
+            self._replay_task = asyncio.create_task(self._replay_journal())
+            if self.journal.fsync == "interval":
+                self._sync_task = asyncio.create_task(self._sync_journal())
+
+    async def publish(self, message) -> bool:
+        """
+        Encola un mensaje para publicarlo en el siguiente lote. Si el buffer está lleno espera
+        a que se libere espacio; retorna False si no lo consigue en enqueue_timeout segundos
+        (y no hay diario donde guardarlo) o si el publicador se está parando.
+        """
+        if self._queue is None or self._stopping:
+            self.rejected_messages += 1
+            return False
+        try:
+            await enqueue(self._queue, message, self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if self.journal is not None:
+                return await self._append_to_journal([message])
+            self.rejected_messages += 1
+            print(f"Publisher buffer full ({self.max_pending} messages). Message for user {message.get('user_id')} rejected.", file=sys.stderr)
+            return False
+
+    async def publish_many(self, messages: list) -> bool:
+        """Encola varios mensajes; retorna False si alguno no se pudo encolar."""
+        accepted = True
+        for message in messages:
+            accepted = await self.publish(message) and accepted
+        return accepted
+
+    async def stop(self):
+        """Publica los mensajes pendientes (como mucho shutdown_timeout segundos) y cierra la conexión."""
+        if self._task is None:
+            return
+        self._stopping = True
+        for task in (self._replay_task, self._sync_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._replay_task = self._sync_task = None
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            if self.journal is not None:
+                await self._append_to_journal(self._drain_queue())
+            else:
+                print(f"Publisher shutdown timed out. {self._queue.qsize()} pending messages were not published.", file=sys.stderr)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_connection)
+        self._executor.shutdown(wait=False)
+        if self._journal_executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._journal_executor, self.journal.close)
+            self._journal_executor.shutdown(wait=False)
+            self._journal_executor = None
+        self._task = None
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "published_messages": self.published_messages,
+            "published_batches": self.published_batches,
+            "failed_attempts": self.failed_attempts,
+            "rejected_messages": self.rejected_messages,
+            "journaled_messages": self.journaled_messages,
+            "replayed_messages": self.replayed_messages,
+            "journal": self.journal.stats() if self.journal is not None else None,
+        }
+
+    def journal_pending_bytes(self) -> int:
+        return self.journal.pending_bytes() if self.journal is not None else 0
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                return
+            if self.journal is None:
+                await self._publish_with_retry(batch)
+            else:
+                await self._publish_or_journal(batch)
+
+    async def _next_batch(self) -> list:
+        return await next_batch(self._queue, self.max_batch_size, self.flush_interval, lambda: self._stopping)
+
+    async def _publish(self, batch: list):
+        try:
+            with STAGE_SECONDS.labels("queue_publish").time():
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._publish_batch, batch)
+        except UnconfirmedMessagesError as e:
+            self.published_messages += len(batch) - len(e.unconfirmed)
+            raise
+        self.published_messages += len(batch)
+        self.published_batches += 1
+
+    async def _publish_with_retry(self, batch: list):
+        loop = asyncio.get_running_loop()
+        delay = self.retry_delay
+        while True:
+            try:
+                await self._publish(batch)
+                return
+            except Exception as e:
+                if isinstance(e, UnconfirmedMessagesError):
+                    # Las particiones ya confirmadas no se vuelven a enviar
+                    batch = e.unconfirmed
+                self.failed_attempts += 1
+                ERRORS.labels("queue_publish").inc()
+                print(f"Error publishing batch of {len(batch)} messages: {e}. Retrying in {delay} seconds...", file=sys.stderr)
+                await loop.run_in_executor(self._executor, self._close_connection)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _broker_available(self) -> bool:
+        return time.monotonic() >= self._broker_retry_at
+
+    async def _try_publish(self, batch: list) -> list:
+        """
+        Publica un lote una sola vez. Retorna los mensajes que no se han podido publicar ([] si
+        se ha publicado entero); si falla, aplaza el siguiente intento con espera creciente.
+        """
+        try:
+            await self._publish(batch)
+            self._current_retry_delay = self.retry_delay
+            return []
+        except Exception as e:
+            unconfirmed = e.unconfirmed if isinstance(e, UnconfirmedMessagesError) else batch
+            self.failed_attempts += 1
+            ERRORS.labels("queue_publish").inc()
+            print(f"Error publishing batch of {len(batch)} messages: {e}. Journaling and retrying the broker in {self._current_retry_delay} seconds.", file=sys.stderr)
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._close_connection)
+            self._broker_retry_at = time.monotonic() + self._current_retry_delay
+            self._current_retry_delay = min(self._current_retry_delay * 2, self.max_retry_delay)
+            return unconfirmed
+
+    async def _publish_or_journal(self, batch: list):
+        if self._broker_available():
+            batch = await self._try_publish(batch)
+        await self._append_to_journal(batch)
+
+    async def _append_to_journal(self, batch: list) -> bool:
+        if not batch:
+            return True
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(self._journal_executor, self.journal.append, batch):
+            self.journaled_messages += len(batch)
+            JOURNAL_MESSAGES.labels("journaled").inc(len(batch))
+            return True
+        self.rejected_messages += len(batch)
+        JOURNAL_MESSAGES.labels("dropped").inc(len(batch))
+        return False
+
+    async def _replay_journal(self):
+        """Reenvía el diario a RabbitMQ mientras el broker esté disponible."""
+        loop = asyncio.get_running_loop()
+        # Mensajes de un lote leído que quedaron sin confirmar (y posición de ese lote): se
+        # reintentan solo ellos antes de avanzar el cursor
+        remainder = None
+        while True:
+            if not self.journal.has_pending() or not self._broker_available():
+                await asyncio.sleep(self.replay_poll_interval)
+                continue
+            if remainder is not None:
+                messages, position = remainder
+            else:
+                try:
+                    messages, position = await loop.run_in_executor(self._journal_executor, self.journal.read_batch, self.replay_batch_size)
+                except OSError as e:
+                    print(f"Error reading journal: {e}", file=sys.stderr)
+                    await asyncio.sleep(self.replay_poll_interval)
+                    continue
+            unconfirmed = await self._try_publish(messages) if messages else []
+            self.replayed_messages += len(messages) - len(unconfirmed)
+            JOURNAL_MESSAGES.labels("replayed").inc(len(messages) - len(unconfirmed))
+            if unconfirmed:
+                remainder = (unconfirmed, position)
+                continue
+            remainder = None
+            await loop.run_in_executor(self._journal_executor, self.journal.commit, position)
+            if self.replay_rate > 0:
+                await asyncio.sleep(len(messages) / self.replay_rate)
+
+    async def _sync_journal(self):
+        """Sincroniza el diario periódicamente, aunque no lleguen más lotes tras un corte."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.journal.fsync_interval)
+            await loop.run_in_executor(self._journal_executor, self.journal.sync)
+
+    def _drain_queue(self) -> list:
+        messages = []
+        while not self._queue.empty():
+            messages.append(self._queue.get_nowait())
+        return messages
+
+    def _publish_batch(self, batch: list):
+        # Se ejecuta en el hilo del publicador
+        if self._channel is None or not self._channel.is_open:
+            self._connection = self.connection_factory()
+            self._channel = self._connection.channel()
+            if self.partitions:
+                declare_partitions(self._channel, self.queue_name, self.partitions)
+            else:
+                self._channel.queue_declare(queue=self.queue_name, durable=True)
+            self._channel.confirm_delivery()
+        if self.partitions:
+            targets = [(INGEST_PARTITIONED_EXCHANGE, str(partition), messages)
+                       for partition, messages in group_by_partition(batch, self.partitions).items()]
+        else:
+            targets = [('', self.queue_name, batch)]
+        for index, (exchange, routing_key, messages) in enumerate(targets):
+            body, content_type = encode_message(messages, self.wire_format)
+            try:
+                # Con confirm_delivery, basic_publish espera el ack del broker y lanza una excepción si lo rechaza
+                self._channel.basic_publish(
+                    exchange=exchange,
+                    routing_key=routing_key,
+                    body=body,
+                    # published_at permite al Data Ingestor medir el retraso hasta la base de datos
+                    properties=pika.BasicProperties(content_type=content_type, delivery_mode=2, headers={"published_at": time.time()}),
+                )
+            except Exception as e:
+                # Las particiones anteriores ya están confirmadas: solo quedan estas y las siguientes
+                raise UnconfirmedMessagesError([message for _, _, rest in targets[index:] for message in rest], e) from e
+
+    def _close_connection(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        try:
+            if connection is not None and connection.is_open:
+                connection.close()
+        except Exception as e:
+            print(f"Error closing publisher connection: {e}", file=sys.stderr)
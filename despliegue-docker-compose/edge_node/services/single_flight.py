@@ -0,0 +1,52 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class SingleFlight:
+    """
+    Coalesce operaciones asíncronas concurrentes sobre la misma clave.
+
+    La primera llamada para una clave lanza la operación en una tarea propia; las llamadas
+    que llegan mientras sigue en curso esperan esa misma tarea y reciben su resultado o su
+    error, en lugar de repetir el trabajo. La tarea no se cancela aunque se cancele quien
+    la inició, de modo que el resto de peticiones en espera siguen obteniendo el resultado.
+    on_coalesced, si se indica, se llama cada vez que una llamada se une a una ya en curso
+    (p. ej. para contarlas en una métrica de Prometheus).
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[], None]] = None):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.on_coalesced = on_coalesced
+        # Operaciones ejecutadas realmente y peticiones que se unieron a una ya en curso
+        self.executions = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, operation: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            if self.on_coalesced is not None:
+                self.on_coalesced()
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(operation())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished, key=key: self._finish(key, finished))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marcar la excepción como recuperada aunque todos los que esperaban se hayan cancelado
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.features.window_features import FEATURE_DTYPE
+
+
+class RecentUsers:
+    """
+    Usuarios atendidos recientemente por este Nodo Edge, del más antiguo al más reciente.
+
+    Se guarda como mucho max_users y la lista se persiste en un fichero JSON (escritura
+    atómica) para que, tras un reinicio, el calentamiento sepa qué modelos precargar.
+    """
+
+    def __init__(self, path: str, max_users: int = 500, clock=time.time):
+        self.path = path
+        self.max_users = max_users
+        self._clock = clock
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def touch(self, user_id: str):
+        """Registra actividad del usuario (lo mueve al final de la lista)."""
+        with self._lock:
+            self._users[user_id] = self._clock()
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            self._dirty = True
+
+    def most_recent(self, count: int) -> list:
+        """Los count usuarios más recientes, empezando por el último en tener actividad."""
+        with self._lock:
+            return list(reversed(self._users))[:count]
+
+    def load(self):
+        """Carga la lista persistida. Un fichero ausente o corrupto equivale a una lista vacía."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f).get("users", [])
+        except (OSError, ValueError) as e:
+            print(f"Could not read recent users from {self.path}: {e}", file=sys.stderr)
+            return
+        with self._lock:
+            for user_id, last_seen in sorted(entries, key=lambda entry: entry[1])[-self.max_users:]:
+                self._users[user_id] = last_seen
+        print(f"Loaded {len(entries)} recent users from {self.path}", file=sys.stderr)
+
+    def save(self):
+        """Persiste la lista si ha cambiado desde la última vez."""
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {"users": [[user_id, last_seen] for user_id, last_seen in self._users.items()]}
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            print(f"Could not persist recent users to {self.path}: {e}", file=sys.stderr)
+
+
+class ModelWarmer:
+    """
+    Calentamiento del Nodo Edge al arrancar.
+
+    Carga el modelo genérico y los de los max_users usuarios más recientes (como mucho
+    concurrency cargas a la vez) y hace una predicción de prueba con cada uno, de modo que la
+    primera petición real no pague la descarga, la deserialización ni el coste de la primera
+    predicción. Se deja de precargar en cuanto la caché de modelos empieza a expulsar entradas
+    (las siguientes cargas solo desplazarían modelos de usuarios más recientes) y, pase lo que
+    pase, el nodo pasa a "ready" como mucho tras timeout segundos.
+    """
+
+    def __init__(self, model_registry, recent_users: RecentUsers, max_users: int = 50,
+                 concurrency: int = 4, timeout: float = 60, clock=time.monotonic):
+        self.model_registry = model_registry
+        self.recent_users = recent_users
+        self.max_users = max_users
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._clock = clock
+        self.state = "pending"
+        self.generic_loaded = False
+        self.warmed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.timed_out = False
+        self.duration = None
+        self._evictions_at_start = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def run(self):
+        self.state = "warming"
+        started = self._clock()
+        try:
+            await asyncio.wait_for(self._warm_all(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            print(f"Warm-up did not finish within {self.timeout}s. Marking node as ready anyway.", file=sys.stderr)
+        except Exception as e:
+            print(f"Error during warm-up: {e}", file=sys.stderr)
+        finally:
+            self.duration = self._clock() - started
+            self.state = "ready"
+        print(f"Warm-up complete in {self.duration:.2f}s: {self.warmed} user models warmed, "
+              f"{self.failed} failed, {self.skipped} skipped.", file=sys.stderr)
+
+    async def _warm_all(self):
+        generic = await self.model_registry.get_generic_predictor()
+        if generic is not None:
+            await asyncio.to_thread(self._dummy_predict, generic)
+            self.generic_loaded = True
+            print("Generic model preloaded for Edge Node.", file=sys.stderr)
+        else:
+            print("Warning: Could not preload generic model for Edge Node.", file=sys.stderr)
+
+        self._evictions_at_start = self.model_registry.model_cache.evictions
+        semaphore = asyncio.Semaphore(self.concurrency)
+        users = self.recent_users.most_recent(self.max_users)
+        await asyncio.gather(*(self._warm_user(user_id, semaphore) for user_id in users))
+
+    async def _warm_user(self, user_id: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if self.model_registry.model_cache.evictions > self._evictions_at_start:
+                self.skipped += 1
+                return
+            try:
+                predictor = await self.model_registry.get_predictor(user_id)
+                if predictor is None or predictor.model is None:
+                    self.failed += 1
+                    return
+                await asyncio.to_thread(self._dummy_predict, predictor)
+                self.warmed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error warming model for user {user_id}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _dummy_predict(predictor):
+        predictor.predict_many(np.zeros((1, len(predictor.feature_columns)), dtype=FEATURE_DTYPE))
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "generic_loaded": self.generic_loaded,
+            "users_warmed": self.warmed,
+            "users_failed": self.failed,
+            "users_skipped": self.skipped,
+            "recent_users": len(self.recent_users),
+            "timed_out": self.timed_out,
+            "duration_s": round(self.duration, 3) if self.duration is not None else None,
+        }
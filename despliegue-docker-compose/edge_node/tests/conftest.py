@@ -0,0 +1,25 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def edge_server(monkeypatch):
+    """
+    Importa edge_node.server sin la cola de mensajes ni la base de datos: app.data.message_queue
+    y app.data.database se sustituyen en sys.modules por módulos con lo que el servidor usa de
+    ellos. Las rutas se importan después del servidor, como al arrancar con uvicorn.
+    """
+    message_queue = types.ModuleType("app.data.message_queue")
+    message_queue.EDGE_INGEST_QUEUE = "edge_ingest_queue"
+    database = types.ModuleType("app.data.database")
+
+    def get_user_model_mapping(user_id):
+        return None
+
+    database.get_user_model_mapping = get_user_model_mapping
+    monkeypatch.setitem(sys.modules, "app.data.message_queue", message_queue)
+    monkeypatch.setitem(sys.modules, "app.data.database", database)
+    return importlib.import_module("edge_node.server")
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from edge_node.services.admission import AdmissionController, AdmissionRejected
+
+
+async def hold(controller, release: asyncio.Event):
+    async with controller.admit():
+        await release.wait()
+
+
+def test_requests_beyond_the_queue_are_rejected_with_429():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, latency_slo=1)
+
+    async def main():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(controller, release))
+        queued = asyncio.create_task(hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        assert controller.saturated()
+        release.set()
+        await asyncio.gather(running, queued)
+        return rejected.value
+
+    rejected = asyncio.run(main())
+
+    assert rejected.status_code == 429
+    assert rejected.retry_after >= 1
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["admitted"] == 2
+
+
+def test_queued_requests_are_shed_with_503_after_the_slo():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, latency_slo=0.02)
+
+    async def main():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        release.set()
+        await running
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["rejected"]["slo_timeout"] == 1
+
+
+def test_cold_loads_are_shed_before_warm_predictions():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, latency_slo=1, max_cold_loads=1)
+
+    async def main():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(controller, release))
+        queued = asyncio.create_task(hold(controller, release))
+        await asyncio.sleep(0)
+        # Con peticiones en cola, una carga en frío se rechaza aunque haya huecos de carga libres
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.cold_load():
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+
+        async with controller.cold_load():
+            with pytest.raises(AdmissionRejected):
+                async with controller.cold_load():
+                    pass
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+    assert controller.stats()["rejected"]["cold_load"] == 2
+    assert controller.stats()["rejected"]["queue_full"] == 0
@@ -0,0 +1,72 @@
+import asyncio
+import pickle
+
+import numpy as np
+from prometheus_client import REGISTRY
+from sklearn.ensemble import RandomForestClassifier
+
+from app.config import FEATURE_COLUMNS
+from edge_node.services.model_cache import ModelCache
+from edge_node.services.model_registry import ModelRegistry
+
+
+def model_bytes(seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(100, len(FEATURE_COLUMNS))).astype(np.float32)
+    y = np.where(X[:, 0] > 0, "training", "sleeping")
+    return pickle.dumps(RandomForestClassifier(n_estimators=5, random_state=42).fit(X, y))
+
+
+class FakeCloudAPIClient:
+    def __init__(self):
+        self.models = {None: model_bytes(0), "personalized_user": model_bytes(1)}
+
+    async def download_model(self, user_id=None):
+        return self.models.get(user_id)
+
+
+async def lookup(user_id):
+    return {"model_path": f"/user/{user_id}", "model_type": "personalized"}
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_registry_records_lookups_cold_loads_and_generic_fallbacks():
+    registry = ModelRegistry(ModelCache(max_bytes=100 * 1024 * 1024), FakeCloudAPIClient(), mapping_lookup=lookup)
+    before = {
+        "hits": sample("edge_model_cache_lookups_total", result="hit"),
+        "misses": sample("edge_model_cache_lookups_total", result="miss"),
+        "downloads": sample("edge_stage_duration_seconds_count", stage="model_download"),
+        "unpickles": sample("edge_stage_duration_seconds_count", stage="model_unpickle"),
+        "fallbacks": sample("edge_generic_fallbacks_total", reason="download_failed"),
+    }
+
+    async def main():
+        await registry.get_predictor("personalized_user")
+        await registry.get_predictor("personalized_user")
+        # Mapeo personalizado pero sin modelo en la Cloud API: se sirve el genérico
+        await registry.get_predictor("missing_user")
+
+    asyncio.run(main())
+
+    assert sample("edge_model_cache_lookups_total", result="hit") - before["hits"] == 1
+    assert sample("edge_model_cache_lookups_total", result="miss") - before["misses"] == 2
+    # Usuario personalizado, intento fallido de missing_user y genérico
+    assert sample("edge_stage_duration_seconds_count", stage="model_download") - before["downloads"] == 3
+    assert sample("edge_stage_duration_seconds_count", stage="model_unpickle") - before["unpickles"] == 2
+    assert sample("edge_generic_fallbacks_total", reason="download_failed") - before["fallbacks"] == 1
+
+
+def test_concurrent_cold_loads_of_a_user_are_counted_as_coalesced():
+    registry = ModelRegistry(ModelCache(max_bytes=100 * 1024 * 1024), FakeCloudAPIClient(), mapping_lookup=lookup)
+    before = sample("edge_model_loads_coalesced_total")
+
+    async def main():
+        await asyncio.gather(*[registry.get_predictor("personalized_user") for _ in range(3)])
+
+    asyncio.run(main())
+
+    assert sample("edge_model_loads_coalesced_total") - before == 2
+    assert registry.loads.stats()["coalesced"] == 2
@@ -0,0 +1,78 @@
+from edge_node.services.model_cache import ModelCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used_when_over_budget():
+    cache = ModelCache(max_bytes=100, policy="lru")
+    cache.put("user_a", "model_a", size_bytes=40)
+    cache.put("user_b", "model_b", size_bytes=40)
+    assert cache.get("user_a") == "model_a"
+
+    cache.put("user_c", "model_c", size_bytes=40)
+
+    assert cache.get("user_b") is None
+    assert cache.get("user_a") == "model_a"
+    assert cache.get("user_c") == "model_c"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["current_bytes"] == 80
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_lfu_evicts_least_frequently_used():
+    cache = ModelCache(max_bytes=100, policy="lfu")
+    cache.put("user_a", "model_a", size_bytes=40)
+    cache.put("user_b", "model_b", size_bytes=40)
+    cache.get("user_a")
+    cache.get("user_a")
+    cache.get("user_b")
+
+    cache.put("user_c", "model_c", size_bytes=40)
+
+    assert "user_b" not in cache
+    assert "user_a" in cache
+
+
+def test_pinned_entries_are_never_evicted_and_oversized_models_are_rejected():
+    cache = ModelCache(max_bytes=100, policy="lru")
+    cache.put("generic_fallback", "generic", size_bytes=60, pinned=True)
+
+    assert cache.put("user_a", "model_a", size_bytes=50) is False
+    assert cache.put("user_b", "model_b", size_bytes=30) is True
+    assert cache.put("user_c", "model_c", size_bytes=30) is True
+
+    assert "generic_fallback" in cache
+    assert "user_b" not in cache
+    assert cache.stats()["current_bytes"] == 90
+
+
+def test_replacement_that_does_not_fit_keeps_the_current_model():
+    cache = ModelCache(max_bytes=100)
+    cache.put("generic", "generic_model", size_bytes=60, pinned=True)
+    cache.put("user_a", "model_a_v1", size_bytes=30)
+
+    assert cache.put("user_a", "model_a_v2", size_bytes=50) is False
+
+    assert cache.get("user_a") == "model_a_v1"
+    assert cache.stats()["current_bytes"] == 90
+
+
+def test_idle_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ModelCache(max_bytes=100, policy="lru", ttl_seconds=10, clock=clock)
+    cache.put("user_a", "model_a", size_bytes=10)
+
+    clock.now = 5
+    assert cache.get("user_a") == "model_a"
+    clock.now = 16
+    assert cache.get("user_a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["current_bytes"] == 0
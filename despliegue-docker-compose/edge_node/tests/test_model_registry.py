@@ -0,0 +1,265 @@
+import asyncio
+import json
+import pickle
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.config import FEATURE_COLUMNS
+from app.data import model_events
+from app.data.model_events import ModelUpdateListener
+from edge_node.services.model_cache import ModelCache
+from edge_node.services.model_registry import GENERIC_MODEL_KEY, ModelRegistry, artifact_key_for
+
+
+def model_bytes(seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(100, len(FEATURE_COLUMNS))).astype(np.float32)
+    y = np.where(X[:, 0] > 0, "training", "sleeping")
+    return pickle.dumps(RandomForestClassifier(n_estimators=5, random_state=seed).fit(X, y))
+
+
+class FakeCloudAPIClient:
+    def __init__(self, models):
+        self.models = dict(models)
+        self.downloads = []
+
+    async def download_model(self, user_id=None):
+        self.downloads.append(user_id)
+        return self.models.get(user_id)
+
+
+def make_registry(models, mappings):
+    client = FakeCloudAPIClient(models)
+
+    async def lookup(user_id):
+        model_type = mappings.get(user_id)
+        return {"model_path": f"/user/{user_id}", "model_type": model_type} if model_type else None
+
+    return ModelRegistry(ModelCache(max_bytes=100 * 1024 * 1024), client, mapping_lookup=lookup), client
+
+
+GENERIC, MODEL_A, MODEL_B = model_bytes(0), model_bytes(1), model_bytes(2)
+
+
+def test_personalized_update_swaps_the_model_and_releases_the_previous_artifact():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A}, {"u1": "personalized"})
+
+    async def main():
+        previous = await registry.get_predictor("u1")
+        client.models["u1"] = MODEL_B
+        await registry.handle_model_update("u1", "personalized")
+        return previous, await registry.get_predictor("u1")
+
+    previous, current = asyncio.run(main())
+
+    assert current is not previous
+    assert registry.version == 1
+    assert registry.user_artifacts["u1"] == artifact_key_for(MODEL_B)
+    assert artifact_key_for(MODEL_A) not in registry.model_cache
+
+
+def test_previous_artifact_is_kept_while_another_user_shares_it():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A, "u2": MODEL_A},
+                                     {"u1": "personalized", "u2": "personalized"})
+
+    async def main():
+        assert await registry.get_predictor("u1") is await registry.get_predictor("u2")
+        client.models["u1"] = MODEL_B
+        await registry.handle_model_update("u1", "personalized")
+
+    asyncio.run(main())
+
+    assert registry.user_artifacts["u2"] == artifact_key_for(MODEL_A)
+    assert artifact_key_for(MODEL_A) in registry.model_cache
+
+
+def test_failed_download_keeps_the_current_model():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A}, {"u1": "personalized"})
+
+    async def main():
+        previous = await registry.get_predictor("u1")
+        client.models["u1"] = None
+        await registry.handle_model_update("u1", "personalized")
+        return previous, await registry.get_predictor("u1")
+
+    previous, current = asyncio.run(main())
+
+    assert current is previous
+    assert registry.version == 0
+    assert registry.user_artifacts["u1"] == artifact_key_for(MODEL_A)
+
+
+def test_switch_to_the_generic_model_releases_the_personalized_one():
+    registry, _ = make_registry({None: GENERIC, "u1": MODEL_A}, {"u1": "personalized"})
+
+    async def main():
+        await registry.get_predictor("u1")
+        await registry.handle_model_update("u1", "generic")
+        return await registry.get_predictor("u1"), await registry.get_generic_predictor()
+
+    user_predictor, generic_predictor = asyncio.run(main())
+
+    assert user_predictor is generic_predictor
+    assert registry.version == 1
+    assert registry.user_artifacts["u1"] == GENERIC_MODEL_KEY
+    assert artifact_key_for(MODEL_A) not in registry.model_cache
+
+
+def test_updates_for_users_or_a_generic_model_not_loaded_here_are_ignored():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A}, {})
+
+    async def main():
+        await registry.handle_model_update("u1", "personalized")
+        await registry.handle_model_update(None, "generic")
+
+    asyncio.run(main())
+
+    assert client.downloads == []
+    assert registry.version == 0
+
+
+def test_generic_update_replaces_the_shared_instance():
+    registry, client = make_registry({None: GENERIC}, {})
+
+    async def main():
+        previous = await registry.get_predictor("new_user")
+        client.models[None] = MODEL_B
+        await registry.handle_model_update(None, "generic")
+        return previous, await registry.get_predictor("new_user")
+
+    previous, current = asyncio.run(main())
+
+    assert current is not previous
+    assert registry.version == 1
+    assert registry.generic_content_key == artifact_key_for(MODEL_B)
+
+
+def test_update_during_a_cold_load_is_not_overwritten_by_the_stale_model():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A}, {"u1": "personalized"})
+    download = client.download_model
+
+    async def download_then_update(user_id=None):
+        model_bytes = await download(user_id)
+        if user_id == "u1" and model_bytes == MODEL_A:
+            # Llega un modelo nuevo cuando ya se ha descargado el anterior
+            client.models["u1"] = MODEL_B
+            await registry.handle_model_update("u1", "personalized")
+        return model_bytes
+
+    client.download_model = download_then_update
+
+    async def main():
+        return await registry.get_predictor("u1")
+
+    asyncio.run(main())
+
+    assert registry.user_artifacts["u1"] == artifact_key_for(MODEL_B)
+    assert client.downloads == ["u1", "u1"]
+
+
+def test_only_the_latest_of_concurrent_updates_is_applied():
+    registry, client = make_registry({None: GENERIC, "u1": MODEL_A}, {"u1": "personalized"})
+    download = client.download_model
+
+    async def main():
+        await registry.get_predictor("u1")
+        client.models["u1"] = MODEL_B
+        client.download_model = slow_download
+        first = asyncio.ensure_future(registry.handle_model_update("u1", "personalized"))
+        await asyncio.sleep(0)
+        client.download_model = download
+        # El segundo evento (al genérico) termina antes que el primero
+        await registry.handle_model_update("u1", "generic")
+        await first
+
+    async def slow_download(user_id=None):
+        await asyncio.sleep(0.01)
+        return await download(user_id)
+
+    asyncio.run(main())
+
+    assert registry.user_artifacts["u1"] == GENERIC_MODEL_KEY
+    assert registry.version == 1
+
+
+class FakeChannel:
+    def __init__(self, messages):
+        self.messages = messages
+        self.callback = None
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def queue_declare(self, **kwargs):
+        return type("Declared", (), {"method": type("Method", (), {"queue": "edge-1"})})
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def basic_consume(self, queue, on_message_callback, auto_ack):
+        self.callback = on_message_callback
+
+    def start_consuming(self):
+        for body in self.messages:
+            self.callback(self, None, None, body)
+        raise ConnectionError("connection lost")
+
+
+class FakeConnection:
+    def __init__(self, messages):
+        self._channel = FakeChannel(messages)
+        self.is_open = True
+
+    def channel(self):
+        return self._channel
+
+
+class RecordingStop:
+    """Sustituye al threading.Event del listener: registra las esperas y para tras max_waits."""
+
+    def __init__(self, max_waits):
+        self.max_waits = max_waits
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.max_waits
+
+    def wait(self, delay):
+        self.waits.append(delay)
+
+
+def test_listener_delivers_events_and_reconnects_with_growing_delay(monkeypatch):
+    events = []
+    attempts = []
+
+    def connect(parameters):
+        attempts.append(parameters)
+        if len(attempts) == 3:
+            # Una conexión con éxito: entrega sus eventos (el mal formado se descarta) y se cae
+            return FakeConnection([json.dumps({"user_id": "u1", "model_type": "personalized"}).encode(), b"not json"])
+        raise ConnectionError("broker unavailable")
+
+    monkeypatch.setattr(model_events.pika, "BlockingConnection", connect)
+    listener = ModelUpdateListener(on_event=events.append, reconnect_delay=1, max_reconnect_delay=3)
+    listener._stopping = RecordingStop(max_waits=5)
+
+    listener._run()
+
+    assert events == [{"user_id": "u1", "model_type": "personalized"}]
+    # La espera crece hasta el máximo y vuelve al valor inicial tras conectar
+    assert listener._stopping.waits == [1, 2, 1, 2, 3]
+
+
+def test_listener_survives_a_failing_event_handler():
+    handled = []
+
+    def on_event(event):
+        handled.append(event)
+        raise RuntimeError("registry unavailable")
+
+    listener = ModelUpdateListener(on_event=on_event)
+    listener._on_message(None, None, None, b'{"user_id": null, "model_type": "generic"}')
+    listener._on_message(None, None, None, b'{"user_id": "u1", "model_type": "generic"}')
+
+    assert [event["user_id"] for event in handled] == [None, "u1"]
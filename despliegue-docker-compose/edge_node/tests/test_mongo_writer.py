@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from edge_node.services.mongo_writer import WriteBehindWriter
+
+
+class FakeCollection:
+    def __init__(self, failures=0, rejected_indexes=()):
+        self.batches = []
+        self.failures_left = failures
+        self.rejected_indexes = set(rejected_indexes)
+
+    async def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        if self.failures_left > 0:
+            self.failures_left -= 1
+            raise AutoReconnect("connection reset")
+        self.batches.append(list(documents))
+        if self.rejected_indexes:
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": 11000, "errmsg": "duplicate key"} for i in sorted(self.rejected_indexes)]})
+
+
+def test_documents_are_grouped_into_insert_many_batches():
+    collection = FakeCollection()
+    writer = WriteBehindWriter(collection, max_batch_size=4, flush_interval=0.05)
+
+    async def main():
+        writer.start()
+        await asyncio.gather(*[writer.write({"i": i}) for i in range(10)])
+        await writer.stop()
+
+    asyncio.run(main())
+
+    assert [len(batch) for batch in collection.batches] == [4, 4, 2]
+    stats = writer.stats()
+    assert stats["written_documents"] == 10
+    assert stats["queue_depth"] == 0
+    assert stats["flushes"] == 3
+
+
+def test_flushed_mode_waits_for_the_write_and_retries_connection_errors():
+    collection = FakeCollection(failures=1)
+    writer = WriteBehindWriter(collection, flush_interval=0.01, durability="flushed", retry_delay=0.01)
+
+    async def main():
+        writer.start()
+        await writer.write_many([{"i": 0}, {"i": 1}])
+        written = len(collection.batches)
+        await writer.stop()
+        return written
+
+    assert asyncio.run(main()) == 1
+    assert writer.stats()["written_documents"] == 2
+
+
+def test_flushed_mode_reports_rejected_documents():
+    collection = FakeCollection(rejected_indexes=[1])
+    writer = WriteBehindWriter(collection, flush_interval=0.01, durability="flushed")
+
+    async def main():
+        writer.start()
+        try:
+            with pytest.raises(BulkWriteError):
+                await writer.write_many([{"i": 0}, {"i": 1}, {"i": 2}])
+        finally:
+            await writer.stop()
+
+    asyncio.run(main())
+
+    assert writer.stats()["written_documents"] == 2
+    assert writer.stats()["failed_documents"] == 1
+
+
+class WrittenBeforeDisconnectCollection(FakeCollection):
+    """La primera escritura llega a MongoDB pero la respuesta se pierde con la conexión."""
+
+    async def insert_many(self, documents, ordered=True):
+        if not self.batches:
+            self.batches.append(list(documents))
+            raise AutoReconnect("connection reset after the write")
+        self.batches.append(list(documents))
+        raise BulkWriteError({"writeErrors": [{"index": i, "code": 11000, "errmsg": "duplicate key"} for i in range(len(documents))]})
+
+
+def test_duplicate_keys_on_a_retry_count_as_written():
+    collection = WrittenBeforeDisconnectCollection()
+    writer = WriteBehindWriter(collection, flush_interval=0.01, durability="flushed", retry_delay=0.01)
+
+    async def main():
+        writer.start()
+        try:
+            await writer.write_many([{"i": 0}, {"i": 1}])
+        finally:
+            await writer.stop()
+
+    asyncio.run(main())
+
+    assert len(collection.batches) == 2
+    assert writer.stats()["written_documents"] == 2
+    assert writer.stats()["failed_documents"] == 0
@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+
+from app.data.wire_format import decode_message
+from edge_node.services import batching
+from edge_node.services.publisher import BatchingPublisher
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def queue_declare(self, queue, durable, arguments=None):
+        pass
+
+    def exchange_declare(self, exchange, exchange_type, durable):
+        pass
+
+    def queue_bind(self, exchange, queue, routing_key):
+        pass
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.broker.publish_calls += 1
+        if self.broker.failures_left > 0 or self.broker.publish_calls in self.broker.fail_calls:
+            self.broker.failures_left = max(0, self.broker.failures_left - 1)
+            raise ConnectionError("broker unavailable")
+        self.broker.bodies.append(decode_message(body, properties.content_type))
+        self.broker.routing_keys.append(routing_key)
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        return FakeChannel(self.broker)
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeBroker:
+    def __init__(self, failures=0, fail_calls=()):
+        self.bodies = []
+        self.publish_calls = 0
+        self.fail_calls = set(fail_calls)
+        self.routing_keys = []
+        self.connections = 0
+        self.failures_left = failures
+
+    def connect(self):
+        self.connections += 1
+        return FakeConnection(self)
+
+
+def make_publisher(broker, **kwargs):
+    return BatchingPublisher("edge_data_queue", connection_factory=broker.connect, retry_delay=0.01, **kwargs)
+
+
+def test_messages_are_grouped_into_batches_over_one_connection():
+    broker = FakeBroker()
+    publisher = make_publisher(broker, max_batch_size=10, flush_interval=0.05)
+
+    async def main():
+        publisher.start()
+        await publisher.publish_many([{"user_id": "u1", "i": i} for i in range(25)])
+        await asyncio.sleep(0.2)
+        await publisher.stop()
+
+    asyncio.run(main())
+
+    assert [len(body) for body in broker.bodies] == [10, 10, 5]
+    assert broker.connections == 1
+    assert publisher.stats()["published_messages"] == 25
+
+
+def test_failed_batches_are_retried_and_pending_messages_flushed_on_stop():
+    broker = FakeBroker(failures=2)
+    publisher = make_publisher(broker, max_batch_size=100, flush_interval=10)
+
+    async def main():
+        publisher.start()
+        for i in range(3):
+            await publisher.publish({"user_id": "u1", "i": i})
+        # flush_interval es largo: los mensajes solo salen porque stop() vacía el buffer
+        await publisher.stop()
+
+    asyncio.run(main())
+
+    assert [message["i"] for body in broker.bodies for message in body] == [0, 1, 2]
+    assert publisher.stats()["failed_attempts"] == 2
+    assert publisher.pending() == 0
+
+
+def test_publish_is_rejected_when_the_buffer_stays_full():
+    broker = FakeBroker(failures=1000)
+    publisher = make_publisher(broker, max_batch_size=1, max_pending=1, enqueue_timeout=0.05, shutdown_timeout=0.1)
+
+    async def main():
+        publisher.start()
+        accepted = [await publisher.publish({"user_id": "u1", "i": i}) for i in range(3)]
+        await publisher.stop()
+        return accepted
+
+    accepted = asyncio.run(main())
+
+    assert accepted[:2] == [True, True]
+    assert accepted[2] is False
+    assert publisher.stats()["rejected_messages"] == 1
+
+
+def test_enqueue_only_waits_when_the_queue_is_full(monkeypatch):
+    timed_waits = []
+    wait_for = asyncio.wait_for
+
+    def counting_wait_for(awaitable, timeout):
+        timed_waits.append(timeout)
+        return wait_for(awaitable, timeout)
+
+    monkeypatch.setattr(batching.asyncio, "wait_for", counting_wait_for)
+
+    async def main():
+        queue = asyncio.Queue(maxsize=2)
+        await batching.enqueue(queue, 1, timeout=0.01)
+        await batching.enqueue(queue, 2, timeout=0.01)
+        assert timed_waits == []
+        with pytest.raises(asyncio.TimeoutError):
+            await batching.enqueue(queue, 3, timeout=0.01)
+        return queue.qsize()
+
+    assert asyncio.run(main()) == 2
+    assert timed_waits == [0.01]
+
+
+def test_partitioned_batches_keep_each_user_on_one_partition():
+    broker = FakeBroker()
+    publisher = make_publisher(broker, max_batch_size=100, flush_interval=0.01, partitions=4)
+
+    async def main():
+        publisher.start()
+        await publisher.publish_many([{"user_id": f"u{i % 6}", "i": i} for i in range(30)])
+        await publisher.stop()
+
+    asyncio.run(main())
+
+    partitions_by_user = {}
+    for routing_key, body in zip(broker.routing_keys, broker.bodies):
+        for message in body:
+            partitions_by_user.setdefault(message["user_id"], set()).add(routing_key)
+    assert all(len(partitions) == 1 for partitions in partitions_by_user.values())
+    assert len(partitions_by_user) == 6
+    # El orden de cada usuario se conserva dentro de su partición
+    for body in broker.bodies:
+        for user_id in {message["user_id"] for message in body}:
+            indexes = [message["i"] for message in body if message["user_id"] == user_id]
+            assert indexes == sorted(indexes)
+
+
+def test_only_unconfirmed_partitions_are_retried_after_a_partial_failure():
+    # El segundo basic_publish (segunda partición del lote) falla una vez
+    broker = FakeBroker(fail_calls=[2])
+    publisher = make_publisher(broker, max_batch_size=100, flush_interval=0.01, partitions=4)
+
+    async def main():
+        publisher.start()
+        await publisher.publish_many([{"user_id": f"u{i % 6}", "i": i} for i in range(30)])
+        await publisher.stop()
+
+    asyncio.run(main())
+
+    published = [message["i"] for body in broker.bodies for message in body]
+    assert sorted(published) == list(range(30))
+    assert publisher.stats()["published_messages"] == 30
+    assert publisher.stats()["failed_attempts"] == 1
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from edge_node.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_a_single_execution():
+    single_flight = SingleFlight()
+    executions = []
+
+    async def load():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return "model"
+
+    async def main():
+        return await asyncio.gather(*[single_flight.run("user:alpha", load) for _ in range(5)])
+
+    results = asyncio.run(main())
+
+    assert results == ["model"] * 5
+    assert len(executions) == 1
+    assert single_flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_errors_are_propagated_to_every_waiter():
+    single_flight = SingleFlight()
+
+    async def failing_load():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("download failed")
+
+    async def main():
+        return await asyncio.gather(
+            *[single_flight.run("generic", failing_load) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert single_flight.in_flight() == 0
+
+
+def test_new_call_after_completion_runs_again():
+    single_flight = SingleFlight()
+
+    async def load():
+        return "model"
+
+    async def main():
+        await single_flight.run("generic", load)
+        await single_flight.run("generic", load)
+
+    asyncio.run(main())
+
+    assert single_flight.executions == 2
+    with pytest.raises(KeyError):
+        single_flight._inflight["generic"]
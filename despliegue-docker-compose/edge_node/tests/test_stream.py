@@ -0,0 +1,170 @@
+import importlib
+
+import msgpack
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.data.wire_format import encode_batch
+from edge_node.services.admission import AdmissionController
+
+
+class FakePredictor:
+    def __init__(self, name):
+        self.name = name
+        self.model = object()
+
+    def predict_many(self, features):
+        return [self.name] * len(features)
+
+
+class FakeRegistry:
+    def __init__(self, warm=True):
+        self.version = 0
+        self.warm = warm
+        self.predictors = {}
+        self.resolved = []
+
+    def is_warm(self, user_id):
+        return self.warm
+
+    async def get_predictor(self, user_id):
+        self.resolved.append(user_id)
+        return self.predictors.get(user_id)
+
+
+class FakeRecentUsers:
+    def touch(self, user_id):
+        pass
+
+
+def reading(second, **fields):
+    values = {
+        "session_id": "s1", "timestamp": f"2025-01-01T00:00:{second:02d}",
+        "tic_accx": 0.1, "tic_accy": 0.2, "tic_accz": 9.8,
+        "tic_acclx": 0.0, "tic_accly": 0.0, "tic_acclz": 0.0,
+        "tic_girx": 0.0, "tic_giry": 0.0, "tic_girz": 0.0,
+        "tic_hrppg": 70.0, "tic_step": 1,
+    }
+    values.update(fields)
+    return values
+
+
+@pytest.fixture
+def stream(edge_server):
+    # La ruta importa el servidor del Nodo Edge (ver conftest.py)
+    return importlib.import_module("edge_node.routes.stream")
+
+
+@pytest.fixture
+def edge(stream, monkeypatch):
+    registry = FakeRegistry()
+    registry.predictors["u1"] = FakePredictor("training")
+    published = []
+
+    async def publish_message(message):
+        published.append([message])
+
+    async def publish_batch(messages):
+        published.append(messages)
+
+    monkeypatch.setattr(stream, "model_registry", registry)
+    monkeypatch.setattr(stream, "recent_users", FakeRecentUsers())
+    monkeypatch.setattr(stream, "publish_data_message_async", publish_message)
+    monkeypatch.setattr(stream, "publish_data_batch_async", publish_batch)
+    app = FastAPI()
+    app.include_router(stream.router)
+    return TestClient(app), registry, published
+
+
+def test_invalid_frames_are_answered_without_closing_the_session(edge):
+    client, _, published = edge
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json()["error"] == "Invalid frame"
+        websocket.send_json([])
+        assert websocket.receive_json()["error"] == "Invalid frame"
+        websocket.send_json(reading(0, tic_accx="fast"))
+        invalid = websocket.receive_json()
+        assert invalid["error"] == "Invalid reading"
+        assert invalid["detail"][0]["loc"] == ["tic_accx"]
+
+        websocket.send_json(reading(1))
+        assert websocket.receive_json()["predictions"] == [
+            {"predicted_activity": "training", "timestamp": "2025-01-01T00:00:01"},
+        ]
+    assert len(published) == 1
+
+
+def test_readings_for_another_session_or_user_are_rejected(edge):
+    client, _, published = edge
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        websocket.send_json(reading(0, session_id="s2"))
+        assert "session s2" in websocket.receive_json()["detail"]
+        websocket.send_json([reading(1), reading(2, user_id="u2")])
+        assert "user u2" in websocket.receive_json()["detail"]
+    assert published == []
+
+
+def test_binary_frames_are_answered_in_msgpack(edge):
+    client, _, published = edge
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        websocket.send_bytes(encode_batch([reading(0), reading(1)]))
+        response = msgpack.unpackb(websocket.receive_bytes(), raw=False)
+
+    assert response["session_id"] == "s1"
+    assert [p["predicted_activity"] for p in response["predictions"]] == ["training", "training"]
+    assert [message["user_id"] for message in published[0]] == ["u1", "u1"]
+
+
+def test_predictor_is_resolved_again_only_after_a_registry_swap(edge):
+    client, registry, _ = edge
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        websocket.send_json(reading(0))
+        assert websocket.receive_json()["predictions"][0]["predicted_activity"] == "training"
+        assert registry.resolved == ["u1"]
+
+        registry.predictors["u1"] = FakePredictor("sleeping")
+        registry.version += 1
+        websocket.send_json(reading(1))
+        assert websocket.receive_json()["predictions"][0]["predicted_activity"] == "sleeping"
+        websocket.send_json(reading(2))
+        websocket.receive_json()
+    assert registry.resolved == ["u1", "u1"]
+
+
+def test_cold_session_is_closed_when_admission_sheds_model_loads(edge, stream, monkeypatch):
+    client, registry, _ = edge
+    registry.warm = False
+    monkeypatch.setattr(stream, "admission_controller", AdmissionController(max_cold_loads=0))
+
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert closed.value.code == 1013
+    assert registry.resolved == []
+
+
+def test_frames_are_shed_while_the_node_is_saturated(edge, stream, monkeypatch):
+    client, _, published = edge
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(stream, "admission_controller", controller)
+
+    with client.websocket_connect("/ws/u1/s1") as websocket:
+        # Otra petición ocupa el único hueco de ejecución
+        controller.in_flight = 1
+        websocket.send_json(reading(0))
+        overloaded = websocket.receive_json()
+        assert overloaded["error"] == "Overloaded"
+        assert overloaded["status_code"] == 429
+        assert overloaded["retry_after"] >= 1
+
+        controller.in_flight = 0
+        websocket.send_json(reading(1))
+        assert websocket.receive_json()["predictions"][0]["timestamp"] == "2025-01-01T00:00:01"
+
+    assert len(published) == 1
+    assert controller.rejected["queue_full"] == 1
+    assert controller.admitted == 1
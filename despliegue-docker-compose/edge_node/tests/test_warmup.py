@@ -0,0 +1,63 @@
+import asyncio
+
+from app.config import FEATURE_COLUMNS
+from edge_node.services.model_cache import ModelCache
+from edge_node.services.warmup import ModelWarmer, RecentUsers
+
+
+class FakePredictor:
+    model = object()
+    feature_columns = FEATURE_COLUMNS
+
+    def __init__(self):
+        self.predictions = 0
+
+    def predict_many(self, features):
+        assert features.shape == (1, len(FEATURE_COLUMNS))
+        self.predictions += 1
+        return ["sleeping"]
+
+
+class FakeRegistry:
+    def __init__(self, max_bytes=1000):
+        self.model_cache = ModelCache(max_bytes=max_bytes)
+        self.loaded = []
+
+    async def get_generic_predictor(self):
+        return FakePredictor()
+
+    async def get_predictor(self, user_id):
+        self.loaded.append(user_id)
+        predictor = FakePredictor()
+        self.model_cache.put(user_id, predictor, size_bytes=400)
+        return predictor
+
+
+def test_recent_users_survive_a_restart_in_recency_order(tmp_path):
+    path = str(tmp_path / "edge" / "recent_users.json")
+    clock = iter(range(100))
+    users = RecentUsers(path, max_users=3, clock=lambda: next(clock))
+    for user_id in ["u1", "u2", "u3", "u1", "u4"]:
+        users.touch(user_id)
+    users.save()
+
+    restored = RecentUsers(path, max_users=3)
+    restored.load()
+
+    assert restored.most_recent(10) == ["u4", "u1", "u3"]
+
+
+def test_warmer_loads_recent_users_until_the_cache_starts_evicting(tmp_path):
+    users = RecentUsers(str(tmp_path / "recent_users.json"))
+    for user_id in ["u1", "u2", "u3", "u4"]:
+        users.touch(user_id)
+    registry = FakeRegistry(max_bytes=1000)
+    warmer = ModelWarmer(registry, users, max_users=10, concurrency=1)
+
+    assert not warmer.ready
+    asyncio.run(warmer.run())
+
+    assert warmer.ready
+    # 400 bytes por modelo: la tercera carga ya expulsa de la caché (1000 bytes) y se deja de precargar
+    assert registry.loaded == ["u4", "u3", "u2"]
+    assert warmer.stats()["users_skipped"] == 1
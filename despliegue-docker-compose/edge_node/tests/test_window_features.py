@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from app.config import FEATURE_COLUMNS
+from app.features.window_features import (
+    ALL_FEATURE_COLUMNS, RollingWindow, SessionFeatureStore, add_window_features, labeled_window_training_data,
+    window_feature_columns,
+)
+
+
+def make_samples(count, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for i in range(count):
+        sample = {column: float(value) for column, value in zip(FEATURE_COLUMNS, rng.normal(size=len(FEATURE_COLUMNS)))}
+        sample['tic_hrppg'] = float(rng.uniform(60, 180))
+        sample['timestamp'] = pd.Timestamp("2025-01-01") + pd.Timedelta(seconds=i)
+        samples.append(sample)
+    return samples
+
+
+def test_rolling_window_matches_naive_statistics():
+    values = np.random.default_rng(1).normal(size=200) * 10
+    window = RollingWindow(size=7)
+    for i, value in enumerate(values):
+        window.add(value)
+        expected = values[max(0, i - 6):i + 1]
+        mean, variance, minimum, maximum = window.stats()
+        assert np.isclose(mean, expected.mean())
+        assert np.isclose(variance, expected.var())
+        assert minimum == expected.min()
+        assert maximum == expected.max()
+
+
+def test_offline_features_match_online_features():
+    samples = make_samples(30)
+    df = pd.DataFrame(samples)
+    df['session_id'] = ['s1' if i % 3 else 's2' for i in range(len(df))]
+
+    # Offline recibe las filas desordenadas; las ordena por timestamp dentro de cada sesión
+    offline = add_window_features(df.sample(frac=1, random_state=0), window_sizes=[5])
+
+    store = SessionFeatureStore(max_sessions=10, idle_seconds=0, window_sizes=[5])
+    online = store.update_many([(row['session_id'], row) for row in df.to_dict('records')])
+
+    columns = FEATURE_COLUMNS + window_feature_columns([5])
+    np.testing.assert_array_equal(offline.loc[df.index, columns].to_numpy(dtype=np.float32), online)
+
+
+def test_offline_features_do_not_mix_users_sharing_a_session_id():
+    df = pd.DataFrame(make_samples(20))
+    df['user_id'] = ['u1' if i % 2 else 'u2' for i in range(len(df))]
+    df['session_id'] = 's1'
+
+    offline = add_window_features(df, window_sizes=[5])
+
+    store = SessionFeatureStore(max_sessions=10, idle_seconds=0, window_sizes=[5])
+    online = store.update_many([(f"{row['user_id']}:{row['session_id']}", row) for row in df.to_dict('records')])
+    columns = FEATURE_COLUMNS + window_feature_columns([5])
+    np.testing.assert_array_equal(offline[columns].to_numpy(dtype=np.float32), online)
+
+
+def test_store_bounds_sessions_and_evicts_idle_ones():
+    now = [0.0]
+    store = SessionFeatureStore(max_sessions=2, idle_seconds=60, clock=lambda: now[0])
+    sample = make_samples(1)[0]
+
+    assert store.update("u1:s1", sample).shape == (1, len(ALL_FEATURE_COLUMNS))
+    store.update("u1:s2", sample)
+    store.update("u1:s3", sample)
+    assert len(store) == 2
+
+    now[0] = 120
+    store.update("u1:s4", sample)
+    assert len(store) == 1
+    assert store.stats()["evictions"] == 3
+
+
+def test_training_windows_include_the_unlabeled_samples_the_edge_saw():
+    df = pd.DataFrame(make_samples(20))
+    df['user_id'] = 'u1'
+    df['session_id'] = 's1'
+    df['estado_real'] = ['training' if i % 4 == 0 else None for i in range(len(df))]
+
+    training = labeled_window_training_data(df, window_sizes=[5])
+
+    store = SessionFeatureStore(max_sessions=10, idle_seconds=0, window_sizes=[5])
+    online = store.update_many([("u1:s1", row) for row in df.to_dict('records')])
+    columns = FEATURE_COLUMNS + window_feature_columns([5])
+    assert list(training['estado_real']) == ['training'] * 5
+    np.testing.assert_array_equal(training[columns].to_numpy(dtype=np.float32), online[df['estado_real'].notna().to_numpy()])
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from typing import Optional, Tuple
+
+from app.config import MODEL_ARTIFACT_CACHE_DIR, MODEL_ARTIFACT_CACHE_MAX_BYTES
+
+
+class ModelArtifactCache:
+    """
+    Caché en disco de los modelos descargados de la Cloud API, compartida por los clientes
+    de los Nodos Edge y Fog.
+
+    Cada artefacto se guarda una sola vez con el hash de su contenido como nombre
+    (<sha256>.pkl), y un índice (index.json) relaciona cada URL con el ETag y el fichero de
+    la última versión descargada. Con ello el cliente puede enviar If-None-Match y, si la
+    Cloud API responde 304, leer el modelo del disco en lugar de volver a descargarlo,
+    también tras un reinicio del contenedor.
+
+    Las escrituras son atómicas (fichero temporal + os.replace). Si se supera max_bytes se
+    borran los artefactos usados hace más tiempo que no estén referenciados por el índice:
+    cada lectura o escritura de un artefacto actualiza su fecha de modificación (LRU).
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory: str = MODEL_ARTIFACT_CACHE_DIR, max_bytes: int = MODEL_ARTIFACT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = self._load_index()
+
+    def get(self, url: str) -> Tuple[Optional[str], Optional[bytes]]:
+        """
+        Devuelve (etag, bytes) de la última versión guardada para la URL, o (None, None) si no
+        hay ninguna o el fichero ya no está en disco.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+        if not entry:
+            return None, None
+        path = self._artifact_path(entry["digest"])
+        try:
+            with open(path, "rb") as f:
+                model_bytes = f.read()
+        except OSError:
+            with self._lock:
+                self._index.pop(url, None)
+            return None, None
+        self._touch(path)
+        return entry["etag"], model_bytes
+
+    def put(self, url: str, etag: Optional[str], model_bytes: bytes):
+        """Guarda la versión descargada de la URL junto con su ETag."""
+        if not etag:
+            return
+        digest = hashlib.sha256(model_bytes).hexdigest()
+        path = self._artifact_path(digest)
+        try:
+            if os.path.exists(path):
+                self._touch(path)
+            else:
+                self._write_atomic(path, model_bytes)
+            with self._lock:
+                self._index[url] = {"etag": etag, "digest": digest}
+                self._write_atomic(os.path.join(self.directory, self.INDEX_FILE), json.dumps(self._index).encode())
+                self._prune()
+        except OSError as e:
+            print(f"Could not store model from {url} in the local artifact cache: {e}", file=sys.stderr)
+
+    def _touch(self, path: str):
+        # La fecha de modificación es la del último uso: _prune borra primero los menos usados
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _artifact_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def _load_index(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, self.INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path: str, content: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _prune(self):
+        # Se llama con el lock tomado
+        if self.max_bytes <= 0:
+            return
+        referenced = {entry["digest"] for entry in self._index.values()}
+        artifacts = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                artifacts.append((stat.st_mtime, name[:-len(".pkl")], stat.st_size))
+        total = sum(size for _, _, size in artifacts)
+        for _, digest, size in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            if digest not in referenced:
+                os.remove(self._artifact_path(digest))
+                total -= size
@@ -1,34 +1,57 @@
+import asyncio
 import requests
+import httpx # Cliente HTTP asíncrono para el Nodo Edge
 import os
 import json
 import io # Para manejar datos binarios como archivos en memoria
 import pandas as pd # Necesario para pd.DataFrame en get_user_data_from_cloud
 # Importar la configuración centralizada
-from app.config import CLOUD_API_HOST, CLOUD_API_PORT
+from app.config import CLOUD_API_HOST, CLOUD_API_PORT, CLOUD_API_MAX_CONNECTIONS, CLOUD_API_TIMEOUT_SECONDS, EDGE_MODEL_TIER
+from fog_node.artifact_cache import ModelArtifactCache
+
+
+def model_url(base_url: str, user_id: str = None, tier: str = None):
+    """URL de un modelo (genérico o de usuario) y de su variante para un nivel, y su descripción."""
+    if user_id:
+        url = f"{base_url}/user/{user_id}"
+        model_type = f"user {user_id}"
+    else:
+        url = f"{base_url}/generic"
+        model_type = "generic"
+    if tier:
+        # La URL completa (con el tier) es también la clave de la caché de artefactos
+        url = f"{url}?tier={tier}"
+        model_type = f"{model_type} ({tier})"
+    return url, model_type
 
 class CloudAPIClient:
-    def __init__(self):
+    def __init__(self, artifact_cache: ModelArtifactCache = None):
         self.base_url = f"http://{CLOUD_API_HOST}:{CLOUD_API_PORT}/models"
+        # Copia local de los modelos descargados para hacer descargas condicionales (ETag)
+        self.artifact_cache = artifact_cache or ModelArtifactCache()
         self.data_url = f"http://{CLOUD_API_HOST}:{CLOUD_API_PORT}/data" # Nueva URL base para datos
         self.users_url = f"http://{CLOUD_API_HOST}:{CLOUD_API_PORT}/users" # Nueva URL base para usuarios (mapeo de modelos)
         print(f"CloudAPIClient initialized. Models URL: {self.base_url}, Data URL: {self.data_url}, Users URL: {self.users_url}")
 
 
-    def download_model(self, user_id: str = None):
+    def download_model(self, user_id: str = None, tier: str = None):
         """
         Descarga el modelo genérico o un modelo de usuario específico de la Cloud API.
-        Retorna los bytes del modelo si tiene éxito, None en caso contrario.
+        Con tier se pide la variante de ese nivel (edge, fog); si no existe, la API sirve el
+        modelo por defecto. Retorna los bytes del modelo si tiene éxito, None en caso contrario.
         """
-        if user_id:
-            url = f"{self.base_url}/user/{user_id}"
-            model_type = f"user {user_id}"
-        else:
-            url = f"{self.base_url}/generic"
-            model_type = "generic"
+        url, model_type = model_url(self.base_url, user_id, tier)
+
+        cached_etag, cached_bytes = self.artifact_cache.get(url)
+        headers = {"If-None-Match": cached_etag} if cached_etag else {}
 
         try:
             print(f"Attempting to download {model_type} model from {url}...")
-            response = requests.get(url, stream=True) # stream=True para descargar archivos grandes
+            response = requests.get(url, stream=True, headers=headers) # stream=True para descargar archivos grandes
+            if response.status_code == 304:
+                # La copia local sigue siendo la versión actual: no se vuelve a descargar
+                print(f"{model_type} model not modified. Using local copy.")
+                return cached_bytes
             response.raise_for_status() # Lanza HTTPError para respuestas 4xx/5xx
 
             # Leer el contenido del archivo en un buffer de Bytes
@@ -38,22 +61,25 @@ class CloudAPIClient:
             model_bytes.seek(0) # Rebobinar el buffer al inicio
 
             print(f"Successfully downloaded {model_type} model.")
+            self.artifact_cache.put(url, response.headers.get("ETag"), model_bytes.getvalue())
             return model_bytes.getvalue() # Retorna los bytes brutos del modelo
         except requests.exceptions.RequestException as e:
             print(f"Error downloading {model_type} model from {url}: {e}")
             return None
 
-    def upload_user_model(self, user_id: str, model_bytes: bytes):
+    def upload_user_model(self, user_id: str, model_bytes: bytes, tier: str = None, metrics: dict = None):
         """
         Sube un modelo de usuario a la Cloud API.
-        model_bytes debe ser los bytes del modelo serializado.
+        model_bytes debe ser los bytes del modelo serializado. Con tier se sube la variante de
+        ese nivel, junto a sus métricas (app.models.model_variants.train_variant).
         """
-        url = f"{self.base_url}/user/{user_id}"
+        url, _ = model_url(self.base_url, user_id, tier)
         files = {'model_file': (f'{user_id}_activity_model.pkl', model_bytes, 'application/octet-stream')}
+        data = {'metrics': json.dumps(metrics)} if metrics else None
 
         try:
             print(f"Attempting to upload user {user_id} model to {url}...")
-            response = requests.post(url, files=files)
+            response = requests.post(url, files=files, data=data)
             response.raise_for_status()
             print(f"Successfully uploaded user {user_id} model: {response.json()}")
             return True
@@ -84,6 +110,27 @@ class CloudAPIClient:
             return pd.DataFrame()
 
 
+    def get_user_session_streams_from_cloud(self, user_id: str):
+        """
+        Obtiene todas las muestras (etiquetadas o no) de las sesiones del usuario con alguna
+        muestra etiquetada, para calcular las características de ventana como el Nodo Edge.
+        Retorna un DataFrame de pandas (vacío si hay un error).
+        """
+        url = f"{self.data_url}/user/{user_id}/sessions"
+        try:
+            print(f"Attempting to fetch session streams for user {user_id} from {url}...")
+            response = requests.get(url)
+            response.raise_for_status()
+            df = pd.DataFrame(response.json().get("data", []))
+            if not df.empty:
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+            print(f"Successfully fetched {len(df)} session samples for user {user_id}.")
+            return df
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching session streams for user {user_id} from {url}: {e}")
+            return pd.DataFrame()
+
+
     def get_user_model_mapping_from_cloud(self, user_id: str):
         """
         Obtiene el mapeo del modelo de un usuario desde la Cloud API.
@@ -120,4 +167,108 @@ class CloudAPIClient:
             return True
         except requests.exceptions.RequestException as e:
             print(f"Error updating model mapping for user {user_id} in {url}: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def get_pending_labeled_summary_from_cloud(self):
+        """
+        Obtiene, por usuario, las muestras etiquetadas aún no usadas para el fine-tuning y la
+        marca de agua de su último fine-tuning. Retorna una lista de diccionarios, o None si
+        hay un error.
+        """
+        url = f"{self.data_url}/labeled/pending"
+        try:
+            print(f"Attempting to fetch pending labeled data summary from {url}...")
+            response = requests.get(url)
+            response.raise_for_status()
+            return response.json().get("users", [])
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching pending labeled data summary from {url}: {e}")
+            return None
+
+    def update_training_watermark_in_cloud(self, user_id: str, trained_until: str):
+        """
+        Guarda en la Cloud API la marca de agua del último fine-tuning de un usuario (el
+        timestamp de la muestra más reciente con la que se entrenó).
+        """
+        url = f"{self.users_url}/{user_id}/training_watermark"
+        try:
+            response = requests.put(url, json={"trained_until": trained_until})
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"Error updating training watermark for user {user_id} in {url}: {e}")
+            return False
+
+
+class AsyncCloudAPIClient:
+    """
+    Versión asíncrona de CloudAPIClient para el Nodo Edge.
+    Todas las peticiones comparten un pool de conexiones HTTP (keep-alive), de modo que las
+    descargas de modelos no bloquean el event loop y reutilizan las conexiones con la Cloud API.
+    """
+    def __init__(self, max_connections: int = CLOUD_API_MAX_CONNECTIONS, timeout: float = CLOUD_API_TIMEOUT_SECONDS,
+                 artifact_cache: ModelArtifactCache = None, tier: str = EDGE_MODEL_TIER):
+        self.base_url = f"http://{CLOUD_API_HOST}:{CLOUD_API_PORT}/models"
+        # Variante de los modelos que se descarga (la del presupuesto del Nodo Edge)
+        self.tier = tier
+        self.artifact_cache = artifact_cache or ModelArtifactCache()
+        self.users_url = f"http://{CLOUD_API_HOST}:{CLOUD_API_PORT}/users"
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        print(f"AsyncCloudAPIClient initialized. Models URL: {self.base_url}, Users URL: {self.users_url}")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # El cliente se crea de forma perezosa para que quede ligado al event loop en ejecución
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    async def download_model(self, user_id: str = None):
+        """
+        Descarga el modelo genérico o un modelo de usuario específico de la Cloud API, en la
+        variante del nivel de este cliente (self.tier). Si no existe esa variante, la API
+        sirve el modelo por defecto. Retorna los bytes del modelo si tiene éxito, None en caso contrario.
+        """
+        url, model_type = model_url(self.base_url, user_id, self.tier)
+
+        # La caché local está en disco: sus lecturas y escrituras se hacen en un hilo
+        cached_etag, cached_bytes = await asyncio.to_thread(self.artifact_cache.get, url)
+        headers = {"If-None-Match": cached_etag} if cached_etag else {}
+
+        try:
+            print(f"Attempting to download {model_type} model from {url}...")
+            response = await self._get_client().get(url, headers=headers)
+            if response.status_code == 304:
+                print(f"{model_type} model not modified. Using local copy.")
+                return cached_bytes
+            response.raise_for_status()
+            print(f"Successfully downloaded {model_type} model.")
+            await asyncio.to_thread(self.artifact_cache.put, url, response.headers.get("ETag"), response.content)
+            return response.content
+        except httpx.HTTPError as e:
+            print(f"Error downloading {model_type} model from {url}: {e}")
+            return None
+
+    async def get_user_model_mapping_from_cloud(self, user_id: str):
+        """
+        Obtiene el mapeo del modelo de un usuario desde la Cloud API.
+        Retorna un diccionario con la información del mapeo, o None si no existe o hay un error.
+        """
+        url = f"{self.users_url}/{user_id}/model_mapping"
+        try:
+            response = await self._get_client().get(url)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            print(f"Error fetching model mapping for user {user_id} from {url}: {e}")
+            return None
+
+    async def aclose(self):
+        """Cierra el pool de conexiones (al apagar el servicio)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,79 @@
+import sys
+
+
+class FineTuneState:
+    """
+    Muestras etiquetadas nuevas de cada usuario desde su último fine-tuning, acumuladas de las
+    notificaciones del Data Ingestor, y marca de agua de cada usuario (el timestamp de la
+    muestra más reciente ya usada para entrenar).
+
+    La marca de agua se guarda en la base de datos central (a través de la Cloud API), así que
+    el estado no se pierde al reiniciar el Fog Trainer: al arrancar se carga con load() a partir
+    del resumen de la Cloud API, que ya cuenta las muestras posteriores a cada marca de agua.
+    Las notificaciones que solo traen muestras incluidas en ese resumen no se vuelven a contar.
+    """
+
+    def __init__(self, min_samples: int):
+        self.min_samples = min_samples
+        self.loaded = False
+        self.pending = {}  # user_id -> {"new_labeled_samples", "label_counts", "max_timestamp"}
+        self.trained_watermarks = {}  # user_id -> timestamp (ISO) de la última muestra entrenada
+        self._loaded_until = {}  # user_id -> timestamp (ISO) de la última muestra contada por load()
+
+    def load(self, summary: list):
+        """Carga el resumen de la Cloud API (CloudAPIClient.get_pending_labeled_summary_from_cloud)."""
+        for entry in summary:
+            user_id = entry["user_id"]
+            if entry.get("trained_until"):
+                self.trained_watermarks[user_id] = entry["trained_until"]
+            if entry.get("new_labeled_samples"):
+                self.pending[user_id] = {
+                    "new_labeled_samples": entry["new_labeled_samples"],
+                    "label_counts": dict(entry.get("label_counts") or {}),
+                    "max_timestamp": entry.get("max_timestamp"),
+                }
+                if entry.get("max_timestamp"):
+                    self._loaded_until[user_id] = entry["max_timestamp"]
+        self.loaded = True
+
+    def collect(self, notification_messages: list) -> list:
+        """
+        Acumula las notificaciones por usuario y retorna los usuarios para los que merece la pena
+        descargar los datos: los que acumulan al menos min_samples muestras etiquetadas nuevas.
+        Las notificaciones sin recuento (formato anterior, solo user_id) se comprueban
+        descargando los datos, como antes.
+        """
+        users_to_process = set()
+        for msg in notification_messages:
+            user_id = msg.get('user_id')
+            if not user_id:
+                continue
+            if 'new_labeled_samples' not in msg:
+                users_to_process.add(user_id)
+                continue
+            max_timestamp = msg.get('max_timestamp')
+            if max_timestamp and (max_timestamp <= self.trained_watermarks.get(user_id, "")
+                                  or max_timestamp <= self._loaded_until.get(user_id, "")):
+                # Datos ya usados en el último fine-tuning, o ya contados al cargar el estado
+                continue
+            pending = self.pending.setdefault(user_id, {"new_labeled_samples": 0, "label_counts": {}, "max_timestamp": None})
+            pending["new_labeled_samples"] += msg['new_labeled_samples']
+            for label, count in (msg.get('label_counts') or {}).items():
+                pending["label_counts"][label] = pending["label_counts"].get(label, 0) + count
+            if max_timestamp and (pending["max_timestamp"] is None or max_timestamp > pending["max_timestamp"]):
+                pending["max_timestamp"] = max_timestamp
+
+        for user_id, pending in self.pending.items():
+            if pending["new_labeled_samples"] >= self.min_samples:
+                users_to_process.add(user_id)
+            else:
+                print(f"User {user_id}: {pending['new_labeled_samples']} new labeled samples {pending['label_counts']} "
+                      f"(waiting for {self.min_samples}).", file=sys.stderr)
+        return sorted(users_to_process)
+
+    def mark_fine_tuned(self, user_id: str, trained_until: str):
+        """Descuenta las muestras pendientes del usuario y avanza su marca de agua tras el fine-tuning."""
+        self.pending.pop(user_id, None)
+        self._loaded_until.pop(user_id, None)
+        if trained_until and trained_until > self.trained_watermarks.get(user_id, ""):
+            self.trained_watermarks[user_id] = trained_until
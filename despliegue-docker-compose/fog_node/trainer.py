@@ -8,12 +8,19 @@ import sys
 
 from app.models.ticwatch_predictor import TicWatchPredictor
 from app.data.message_queue import consume_messages, INGEST_FOG_NOTIFICATION_QUEUE
-from app.config import FEATURE_COLUMNS
+from app.config import FEATURE_COLUMNS, TRAIN_WITH_WINDOW_FEATURES, FOG_MODEL_VARIANT_TIERS
+from app.models.model_variants import train_variant
+from app.features.window_features import ALL_FEATURE_COLUMNS, labeled_window_training_data
 from fog_node.cloud_api_client import CloudAPIClient
+from fog_node.fine_tune_state import FineTuneState
 
 # Umbral de datos para disparar el fine-tuning
 MIN_SAMPLES_FOR_FINE_TUNING = 20 # Número mínimo de nuevas muestras etiquetadas para un usuario
 
+# Muestras etiquetadas pendientes y marcas de agua del último fine-tuning de cada usuario.
+# Se carga de la Cloud API en el primer ciclo, para no perderlas al reiniciar el Fog Trainer
+fine_tune_state = FineTuneState(MIN_SAMPLES_FOR_FINE_TUNING)
+
 def process_and_fine_tune_models():
     """
     Procesa los mensajes de la cola de notificación, agrupa los datos por usuario
@@ -24,6 +31,15 @@ def process_and_fine_tune_models():
     # Instanciar el cliente de la Cloud API
     cloud_api_client = CloudAPIClient()
 
+    if not fine_tune_state.loaded:
+        # Sin el estado guardado no se consumen notificaciones: se contarían desde cero
+        summary = cloud_api_client.get_pending_labeled_summary_from_cloud()
+        if summary is None:
+            print("Could not load the pending labeled data summary from Cloud API. Retrying later...", file=sys.stderr)
+            return
+        fine_tune_state.load(summary)
+        print(f"Fog Trainer: Loaded fine-tuning state for {len(summary)} users.", file=sys.stderr)
+
     # 1. Consumir todos los mensajes de la cola de notificación
     raw_notification_messages = consume_messages(INGEST_FOG_NOTIFICATION_QUEUE)
 
@@ -33,19 +49,15 @@ def process_and_fine_tune_models():
 
     print(f"[{datetime.now()}] Fog Trainer: Consumed {len(raw_notification_messages)} notification messages.", file=sys.stderr)
 
-    # Los mensajes de notificación solo contienen user_id y timestamp.
-    # Extraer los user_id únicos de los mensajes de notificación
-    users_to_process = set()
-    for msg in raw_notification_messages:
-        user_id = msg.get('user_id')
-        if user_id:
-            users_to_process.add(user_id)
-    
+    # Las notificaciones traen el número de muestras etiquetadas nuevas de cada usuario: solo se
+    # descargan los datos de los usuarios que ya tienen suficientes para el fine-tuning
+    users_to_process = fine_tune_state.collect(raw_notification_messages)
+
     if not users_to_process:
-        print("No valid user IDs found in notification messages. Waiting...", file=sys.stderr)
+        print("No users with enough new labeled data in notification messages. Waiting...", file=sys.stderr)
         return
 
-    print(f"Users with new data to check for fine-tuning: {list(users_to_process)}", file=sys.stderr)
+    print(f"Users with new data to check for fine-tuning: {users_to_process}", file=sys.stderr)
 
     for user_id in users_to_process: # Iterar sobre los user_id únicos
         # 2. Obtener todos los datos etiquetados para este usuario de la DB central a través de la Cloud API
@@ -59,8 +71,18 @@ def process_and_fine_tune_models():
 
         print(f"User {user_id}: Fine-tuning model with {len(user_training_df)} samples.", file=sys.stderr)
 
-        # Preparar datos para el entrenamiento
-        X_user = user_training_df[FEATURE_COLUMNS]
+        # Preparar datos para el entrenamiento (con las mismas características de ventana que el Edge, si están activas)
+        feature_columns = FEATURE_COLUMNS
+        if TRAIN_WITH_WINDOW_FEATURES:
+            # Las ventanas se calculan sobre las sesiones completas (también las muestras sin
+            # etiquetar), como en el Edge, y después se entrena solo con las etiquetadas
+            session_streams_df = cloud_api_client.get_user_session_streams_from_cloud(user_id)
+            if session_streams_df.empty:
+                print(f"User {user_id}: Session streams not available. Skipping fine-tuning.", file=sys.stderr)
+                continue
+            user_training_df = labeled_window_training_data(session_streams_df)
+            feature_columns = ALL_FEATURE_COLUMNS
+        X_user = user_training_df[feature_columns]
         y_user = user_training_df['estado_real']
 
         # 3. Cargar el modelo actual del usuario (personalizado o genérico) desde la Cloud API
@@ -93,7 +115,7 @@ def process_and_fine_tune_models():
 
         # 4. Realizar el fine-tuning
         try:
-            predictor.train_model(X_user, y_user) # train_model de RandomForest re-entrena con los nuevos datos
+            predictor.train_model(X_user, y_user, feature_columns) # train_model de RandomForest re-entrena con los nuevos datos
 
             # 5. Serializar el modelo ajustado a bytes y subirlo a la Cloud API
             updated_model_bytes = pickle.dumps(predictor.model)
@@ -102,12 +124,34 @@ def process_and_fine_tune_models():
             upload_success = cloud_api_client.upload_user_model(user_id, updated_model_bytes)
 
             if upload_success:
+                # Variantes del modelo del usuario para los niveles con menos recursos (Edge). Se
+                # suben antes de actualizar el mapeo, que es lo que hace recargar el modelo al Edge.
+                # La Cloud API borra las variantes anteriores al recibir el modelo nuevo: si una
+                # falla, ese nivel recibe el modelo por defecto en lugar de una variante obsoleta
+                for tier in FOG_MODEL_VARIANT_TIERS:
+                    try:
+                        variant_bytes, metrics = train_variant(user_training_df, y_user, tier, feature_columns)
+                    except Exception as e:
+                        print(f"User {user_id}: Failed to build '{tier}' model variant: {e}. "
+                              f"The default model will be served instead.", file=sys.stderr)
+                        continue
+                    print(f"User {user_id}: Uploading '{tier}' model variant: {metrics}", file=sys.stderr)
+                    if not cloud_api_client.upload_user_model(user_id, variant_bytes, tier=tier, metrics=metrics):
+                        print(f"User {user_id}: Failed to upload '{tier}' model variant. "
+                              f"The default model will be served instead.", file=sys.stderr)
+
                 update_mapping_success = cloud_api_client.update_user_model_mapping_in_cloud(
                     user_id=user_id,
                     model_path=cloud_api_client.base_url + f"/user/{user_id}",  # Ruta donde se guardará el modelo en la Cloud API
                     model_type="personalized"  # Tipo de modelo personalizado o genérico
                 )
                 if update_mapping_success:
+                    # Solo con el mapeo actualizado el Edge usa el modelo nuevo: hasta entonces
+                    # las muestras siguen pendientes y el siguiente ciclo lo vuelve a intentar
+                    trained_until = pd.Timestamp(user_training_df['timestamp'].max()).isoformat()
+                    fine_tune_state.mark_fine_tuned(user_id, trained_until)
+                    if not cloud_api_client.update_training_watermark_in_cloud(user_id, trained_until):
+                        print(f"User {user_id}: Failed to save training watermark in Cloud API.", file=sys.stderr)
                     print(f"User {user_id}: Model mapping updated successfully in Cloud API.", file=sys.stderr)
                     print(f"User {user_id}: Fine-tuning and upload complete.", file=sys.stderr)
                 else:
@@ -3,4 +3,6 @@ import os
 # --- Configuración del Servicio Unificado ---
 STRATEGY = os.getenv("STRATEGY", "weighted") # Estrategia por defecto
 # La URL de Prometheus para la monitorización
-PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus.monitoring.svc.cluster.local:9090")
\ No newline at end of file
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus.monitoring.svc.cluster.local:9090")
+# Latencia p99 de las peticiones del Nodo Edge (ms) a partir de la cual el MAPE-K propone escalar
+EDGE_P99_LATENCY_THRESHOLD_MS = float(os.getenv("EDGE_P99_LATENCY_THRESHOLD_MS", 500))
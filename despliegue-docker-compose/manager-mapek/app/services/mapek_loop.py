@@ -1,7 +1,7 @@
 import time
 from typing import Optional, Dict, Any
 import requests
-from ..config import PROMETHEUS_URL
+from ..config import PROMETHEUS_URL, EDGE_P99_LATENCY_THRESHOLD_MS
 from app.services.node_monitor import nodes_status # Importamos el estado de los nodos
 
 # --- Almacenamiento de Conocimiento del MAPE-K ---
@@ -33,6 +33,12 @@ def analyze(resource_usage: Dict[str, Any]) -> Dict[str, Any]:
                 "action_needed": "scale_up",
                 "reason": f"Uso de CPU alto ({usage['cpu_load']:.2f}%) - Escalar servicio"
             }
+        # Si la latencia p99 de las predicciones del Nodo Edge supera el umbral
+        if usage.get("edge_p99_latency_ms", 0.0) > EDGE_P99_LATENCY_THRESHOLD_MS and ip not in anomalies:
+            anomalies[ip] = {
+                "action_needed": "scale_up",
+                "reason": f"Latencia p99 del Nodo Edge alta ({usage['edge_p99_latency_ms']:.1f} ms) - Escalar servicio"
+            }
         # Ejemplo: Si la memoria supera el 85%
         if usage.get("memory_usage", 0.0) > 85:
             if ip not in anomalies:
@@ -1,3 +1,4 @@
+import math
 import time
 import requests
 from typing import Dict
@@ -7,6 +8,11 @@ from ..shared_state import active_users_per_node, user_count_lock
 # Diccionario para almacenar el estado de los nodos
 nodes_status: Dict[str, Dict] = {}
 
+# Métricas de aplicación que exporta el Nodo Edge en /metrics (ver edge_node/services/metrics.py)
+EDGE_P99_LATENCY_QUERY = 'histogram_quantile(0.99, sum by(instance, le) (rate(edge_request_duration_seconds_bucket[1m])))'
+EDGE_SATURATED_QUERY = 'max by(instance) (edge_saturated)'
+EDGE_READY_QUERY = 'min by(instance) (edge_ready)'
+
 def query_prometheus(metric: str) -> Dict[str, float]:
     """Consulta Prometheus y devuelve las métricas por instancia (IP del nodo)."""
     try:
@@ -34,6 +40,10 @@ def monitor_nodes():
         # Consulta el uso de CPU y memoria
         cpu_usage_by_ip = query_prometheus('100 - (avg by(instance) (irate(node_cpu_seconds_total{mode="idle"}[1m])) * 100)')
         memory_usage_by_ip = query_prometheus('(node_memory_MemTotal_bytes - node_memory_MemAvailable_bytes) / node_memory_MemTotal_bytes * 100')
+        # Estado del Nodo Edge de cada nodo: latencia p99 de sus peticiones, saturación y calentamiento
+        edge_latency_by_ip = query_prometheus(EDGE_P99_LATENCY_QUERY)
+        edge_saturated_by_ip = query_prometheus(EDGE_SATURATED_QUERY)
+        edge_ready_by_ip = query_prometheus(EDGE_READY_QUERY)
 
         # El primer bucle es para actualizar los nodos que están online
         for ip in set(cpu_usage_by_ip.keys()) | set(memory_usage_by_ip.keys()):
@@ -51,6 +61,11 @@ def monitor_nodes():
             nodes_status[ip]["status"] = "online"
             nodes_status[ip]["current_load"]["cpu_load"] = cpu_usage_by_ip.get(ip, 0.0)
             nodes_status[ip]["current_load"]["memory_usage"] = memory_usage_by_ip.get(ip, 0.0)
+            # Sin tráfico reciente histogram_quantile devuelve NaN: se considera latencia 0
+            edge_latency = edge_latency_by_ip.get(ip, 0.0)
+            nodes_status[ip]["current_load"]["edge_p99_latency_ms"] = 0.0 if math.isnan(edge_latency) else edge_latency * 1000
+            # Un Nodo Edge saturado o calentando modelos no debe recibir usuarios nuevos
+            nodes_status[ip]["accepting_users"] = not edge_saturated_by_ip.get(ip, 0.0) and bool(edge_ready_by_ip.get(ip, 1.0))
         
         # Marcar nodos que no responden como offline y reiniciar su contador de usuarios
         online_ips = cpu_usage_by_ip.keys()
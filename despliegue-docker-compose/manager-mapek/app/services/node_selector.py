@@ -33,7 +33,10 @@ class NodeSelector:
 
     def select_node(self):
         node_roles = self.get_node_roles()
-        online_nodes_info = [(ip, info) for ip, info in nodes_status.items() if info["status"] == "online"]
+        online_nodes_info = [
+            (ip, info) for ip, info in nodes_status.items()
+            if info["status"] == "online" and info.get("accepting_users", True)
+        ]
         
         priority_order = ["edge", "fog", "cloud"]
         
@@ -5,3 +5,6 @@ NODE_IPS = [
 ]
 
 STRATEGY = "weighted"  # opciones posibles: "least_users", "weighted"
+
+# Puerto del Nodo Edge en cada nodo: su /health indica si está saturado (control de admisión)
+EDGE_SERVICE_PORT = 8000
@@ -1,7 +1,7 @@
 import threading
 import time
 import requests
-from app.config import NODE_IPS
+from app.config import NODE_IPS, EDGE_SERVICE_PORT
 from app.main import active_users_per_node, user_count_lock
 
 nodes_status = {ip: {} for ip in NODE_IPS} # Diccionario para almacenar el estado de cada nodo
@@ -19,10 +19,27 @@ def fetch_node_status(ip):
         pass
     return {"status": "offline"}
 
+def fetch_edge_saturation(ip):
+    """
+    Consulta el /health del Nodo Edge. Retorna True si su control de admisión indica que
+    está saturado o si aún está calentando sus modelos (503 con "ready": false): en ambos
+    casos no se le deben asignar más usuarios por ahora.
+    """
+    try:
+        response = requests.get(f"http://{ip}:{EDGE_SERVICE_PORT}/health", timeout=2)
+        if response.status_code in (200, 503):
+            health = response.json()
+            return bool(health.get("saturated", False)) or not health.get("ready", True)
+    except:
+        pass
+    return False
+
 def monitor_nodes():
     while True:
         for ip in NODE_IPS:
             nodes_status[ip] = fetch_node_status(ip)
+            if nodes_status[ip]["status"] == "online":
+                nodes_status[ip]["saturated"] = fetch_edge_saturation(ip)
         with user_count_lock:
             # Actualiza el conteo de usuarios para cada nodo en el estado
             for ip in list(nodes_status.keys()):
@@ -33,7 +33,11 @@ class NodeSelector:
 
     def select_node(self):
         node_roles = self.get_node_roles()
-        online_nodes_info = [(ip, info) for ip, info in nodes_status.items() if info["status"] == "online"]
+        # Los nodos saturados (control de admisión del Edge) se excluyen hasta que se recuperen
+        online_nodes_info = [
+            (ip, info) for ip, info in nodes_status.items()
+            if info["status"] == "online" and not info.get("saturated", False)
+        ]
         
         priority_order = ["edge", "fog", "cloud"]
         
@@ -5,8 +5,10 @@ import sys # Importar sys para stderr
 import random # <--- ¡IMPORTANTE: Añadir esta importación!
 
 from app.models.ticwatch_predictor import TicWatchPredictor
-from app.data.database import create_tables, insert_ticwatch_data, get_all_training_data
-from app.config import GENERIC_MODEL_PATH, FEATURE_COLUMNS, MODELS_DIR
+from app.data.database import create_tables, get_all_training_data
+from app.data.ticwatch_writer import TicWatchBatchWriter
+from app.config import GENERIC_MODEL_PATH, FEATURE_COLUMNS, MODELS_DIR, CLOUD_MODEL_VARIANT_TIERS
+from app.models.model_variants import train_variant
 from cloud_node.model_repository import ModelRepository
 
 def generate_initial_model():
@@ -65,14 +67,16 @@ def generate_initial_model():
 
     print(f"Generated {len(dummy_data)} dummy data points.", file=sys.stderr)
 
-    # 3. Insertar datos dummy en la base de datos
+    # 3. Insertar datos dummy en la base de datos (un único COPY en una transacción)
     print("Inserting dummy data into the database...", file=sys.stderr)
-    for data_point in dummy_data:
-        try:
-            insert_ticwatch_data(data_point)
-        except Exception as e:
-            print(f"ERROR inserting dummy data point: {data_point}. Error: {e}", file=sys.stderr)
-            sys.exit(1)
+    batch_writer = TicWatchBatchWriter()
+    try:
+        batch_writer.write(dummy_data)
+    except Exception as e:
+        print(f"ERROR inserting {len(dummy_data)} dummy data points. Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        batch_writer.close()
     print("Dummy data inserted into the database.", file=sys.stderr)
 
     # 4. Recuperar datos para entrenar el modelo inicial
@@ -111,6 +115,16 @@ def generate_initial_model():
         print(f"ERROR saving initial generic model: {e}", file=sys.stderr)
         sys.exit(1) # Salir si falla el guardado del modelo
 
+    # 6. Variantes del modelo inicial para los niveles Edge y Fog (si fallan se sirve el modelo por defecto)
+    for tier in CLOUD_MODEL_VARIANT_TIERS:
+        try:
+            variant_bytes, metrics = train_variant(training_data, y_initial, tier)
+            variant_path = model_repo.save_model(variant_bytes, "generic_activity_model", is_generic=True, tier=tier)
+            model_repo.save_variant_metrics(variant_path, metrics)
+            print(f"Initial '{tier}' model variant saved to {variant_path}: {metrics}", file=sys.stderr)
+        except Exception as e:
+            print(f"ERROR generating '{tier}' variant of the initial model: {e}", file=sys.stderr)
+
     print("--- generate_initial_model: Initial model generation complete ---", file=sys.stderr)
 
 if __name__ == "__main__":
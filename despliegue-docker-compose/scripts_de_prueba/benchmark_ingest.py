@@ -0,0 +1,418 @@
+import argparse
+import heapq
+import json
+import random
+import resource
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.config import (INGESTOR_PREFETCH_COUNT, INGESTOR_MAX_BATCH_SIZE, INGESTOR_FLUSH_INTERVAL_SECONDS,
+                        INGESTOR_DEDUP_CACHE_SIZE, INGESTOR_NOTIFICATION_WINDOW_SECONDS, INGESTOR_WRITE_METHOD,
+                        FEATURE_COLUMNS)
+from app.data.ticwatch_writer import NATURAL_KEY_COLUMNS, TICWATCH_COLUMNS, TicWatchBatchWriter, ticwatch_row
+from app.data.wire_format import encode_message
+from data_ingestor.consumer import IngestConsumer
+from data_ingestor.dedup import RecentKeyFilter
+from data_ingestor.notifications import NotificationCoalescer
+
+# Benchmark de rendimiento del Data Ingestor sin red: el mismo IngestConsumer que ejecuta
+# data_ingestor/ingestor.py, con un broker en memoria en lugar de RabbitMQ y, como base de
+# datos, SQLite embebido (por defecto), un Postgres local (--store postgres --dsn ...) o
+# ninguna (--store null, solo el coste del consumidor). Un productor publica lotes sintéticos
+# de muestras TicWatch al ritmo indicado y se informa de filas/s, lag extremo a extremo
+# (p50/p99), CPU y memoria. Con --min-rows-per-second sale con error si no se alcanza.
+# Uso: python -m scripts_de_prueba.benchmark_ingest --rate 20000 --duration 10 [--json]
+
+BENCHMARK_QUEUE = "benchmark_ingest_queue"
+BENCHMARK_NOTIFICATION_QUEUE = "benchmark_fog_notification_queue"
+ACTIVITIES = ["sleeping", "sedentary", "training"]
+# Valores de los sensores pre-generados: el productor comparte el GIL con el consumidor y no
+# debe ser lo que limite el rendimiento medido
+FEATURE_POOL_SIZE = 1024
+
+
+class InProcessBroker:
+    """
+    Colas en memoria compartidas por el productor (publish, desde cualquier hilo) y las
+    conexiones de los consumidores (connect). Los mensajes confirmados con ack se cuentan y se
+    guarda su lag (ahora - cabecera published_at).
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queues = {}
+        self.published_messages = 0
+        self.acked_messages = 0
+        self.lags = []
+        self.last_ack_at = None
+
+    def queue(self, name: str) -> deque:
+        return self.queues.setdefault(name, deque())
+
+    def publish(self, queue_name: str, body: bytes, properties):
+        with self.condition:
+            self.queue(queue_name).append((body, properties))
+            self.published_messages += 1
+            self.condition.notify_all()
+
+    def connect(self) -> "InProcessConnection":
+        return InProcessConnection(self)
+
+    def pending(self) -> int:
+        with self.condition:
+            return sum(len(queue) for name, queue in self.queues.items() if name != BENCHMARK_NOTIFICATION_QUEUE)
+
+
+class InProcessConnection:
+    """
+    Lo que usa IngestConsumer de pika.BlockingConnection y de su canal (channel() retorna la
+    propia conexión): entrega con prefetch, ack/nack múltiple, call_later y
+    add_callback_threadsafe. Como en pika, los callbacks se ejecutan en el hilo de
+    start_consuming().
+    """
+
+    def __init__(self, broker: InProcessBroker):
+        self.broker = broker
+        self.is_open = True
+        self._prefetch_count = 0
+        self._consumers = OrderedDict()  # cola -> callback
+        self._unacked = OrderedDict()  # delivery tag -> (cola, body, properties)
+        self._next_tag = 1
+        self._timers = []
+        self._timer_seq = 0
+        self._threadsafe_callbacks = deque()
+        self._consuming = False
+
+    def channel(self):
+        return self
+
+    def close(self):
+        self.is_open = False
+
+    def call_later(self, delay, callback):
+        self._timer_seq += 1
+        timer = [time.monotonic() + delay, self._timer_seq, callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        timer[2] = None
+
+    def add_callback_threadsafe(self, callback):
+        with self.broker.condition:
+            self._threadsafe_callbacks.append(callback)
+            self.broker.condition.notify_all()
+
+    def basic_qos(self, prefetch_count=0, global_qos=False):
+        self._prefetch_count = prefetch_count
+
+    def queue_declare(self, queue, durable=False, passive=False, exclusive=False, arguments=None):
+        with self.broker.condition:
+            message_count = len(self.broker.queue(queue))
+        return SimpleNamespace(method=SimpleNamespace(queue=queue, message_count=message_count))
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self._consumers[queue] = on_message_callback
+        return queue
+
+    def basic_cancel(self, consumer_tag):
+        self._consumers.pop(consumer_tag, None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.broker.publish(routing_key, body, properties)
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        now = time.time()
+        acked = self._settle(delivery_tag, multiple)
+        with self.broker.condition:
+            self.broker.acked_messages += len(acked)
+            self.broker.last_ack_at = now
+            for _, _, properties in acked:
+                published_at = (properties.headers or {}).get("published_at")
+                if published_at is not None:
+                    self.broker.lags.append(now - published_at)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        settled = self._settle(delivery_tag, multiple)
+        if requeue:
+            with self.broker.condition:
+                for queue, body, properties in reversed(settled):
+                    self.broker.queue(queue).appendleft((body, properties))
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open:
+            self._run_threadsafe_callbacks()
+            self._run_due_timers()
+            if not self._consuming or self._deliver_one():
+                continue
+            with self.broker.condition:
+                if not self._threadsafe_callbacks and not self._deliverable():
+                    next_timer = self._timers[0][0] - time.monotonic() if self._timers else 0.05
+                    self.broker.condition.wait(timeout=min(max(next_timer, 0.0), 0.05))
+
+    def _settle(self, delivery_tag, multiple) -> list:
+        tags = [tag for tag in self._unacked if tag <= delivery_tag] if multiple else [delivery_tag]
+        return [self._unacked.pop(tag) for tag in tags if tag in self._unacked]
+
+    def _deliverable(self):
+        # Se llama con el lock del broker tomado
+        if self._prefetch_count and len(self._unacked) >= self._prefetch_count:
+            return None
+        for queue in self._consumers:
+            if self.broker.queue(queue):
+                return queue
+        return None
+
+    def _deliver_one(self) -> bool:
+        with self.broker.condition:
+            queue = self._deliverable()
+            if queue is None:
+                return False
+            body, properties = self.broker.queue(queue).popleft()
+        tag, self._next_tag = self._next_tag, self._next_tag + 1
+        self._unacked[tag] = (queue, body, properties)
+        self._consumers[queue](self, SimpleNamespace(delivery_tag=tag), properties, body)
+        return True
+
+    def _run_threadsafe_callbacks(self):
+        while True:
+            with self.broker.condition:
+                if not self._threadsafe_callbacks:
+                    return
+                callback = self._threadsafe_callbacks.popleft()
+            callback()
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self._timers)
+            if callback is not None:
+                callback()
+
+
+class SQLiteBatchStore:
+    """
+    Sustituto embebido de TicWatchBatchWriter: cada lote se carga en una tabla temporal y pasa
+    a una tabla con las columnas de ticwatch_data y el mismo índice único de la clave natural
+    con INSERT OR IGNORE, en una transacción. Retorna las muestras insertadas.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._connection = None
+
+    def write(self, samples: list) -> int:
+        if self._connection is None:
+            # Se usa solo en el hilo del consumidor; close() se llama cuando ya ha terminado
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS ticwatch_data ({', '.join(TICWATCH_COLUMNS)})")
+            self._connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ticwatch_data_natural_key "
+                                     f"ON ticwatch_data ({', '.join(NATURAL_KEY_COLUMNS)})")
+            self._connection.execute(f"CREATE TEMP TABLE ticwatch_data_staging ({', '.join(TICWATCH_COLUMNS)})")
+        rows = [tuple(value.isoformat() if isinstance(value, datetime) else value for value in ticwatch_row(sample))
+                for sample in samples]
+        key_length = len(NATURAL_KEY_COLUMNS)
+        match = " AND ".join(f"t.{column} = s.{column}" for column in NATURAL_KEY_COLUMNS)
+        with self._connection:
+            self._connection.execute("DELETE FROM ticwatch_data_staging")
+            self._connection.executemany(
+                f"INSERT INTO ticwatch_data_staging VALUES ({', '.join('?' for _ in TICWATCH_COLUMNS)})", rows)
+            # Sin RETURNING (SQLite < 3.35): las claves nuevas se leen antes de insertarlas
+            new_keys = set(self._connection.execute(
+                f"SELECT {', '.join('s.' + column for column in NATURAL_KEY_COLUMNS)} FROM ticwatch_data_staging s "
+                f"WHERE NOT EXISTS (SELECT 1 FROM ticwatch_data t WHERE {match})"))
+            self._connection.execute("INSERT OR IGNORE INTO ticwatch_data SELECT * FROM ticwatch_data_staging")
+        inserted = []
+        for sample, row in zip(samples, rows):
+            if row[:key_length] in new_keys:
+                new_keys.discard(row[:key_length])
+                inserted.append(sample)
+        return inserted
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+class NullStore:
+    """No guarda nada: mide solo el consumo, la decodificación y la validación."""
+
+    def write(self, samples: list) -> list:
+        return samples
+
+    def close(self):
+        pass
+
+
+def feature_pool(size: int = FEATURE_POOL_SIZE) -> list:
+    return [{column: random.uniform(-1, 1) for column in FEATURE_COLUMNS} for _ in range(size)]
+
+
+def synthetic_batch(batch_size: int, users: int, start: datetime, sequence: int, labeled_fraction: float,
+                    features: list) -> list:
+    """Lote de muestras TicWatch con timestamps crecientes por usuario (sin claves repetidas)."""
+    rows = []
+    for i in range(batch_size):
+        index = sequence * batch_size + i
+        row = dict(features[index % len(features)])
+        row.update(
+            user_id=f"benchmark_user_{index % users}",
+            session_id="benchmark_session",
+            timestamp=(start + timedelta(milliseconds=index // users * 20)).isoformat(),
+            tic_step=index,
+            ticwatchconnected=True,
+            estado_real=random.choice(ACTIVITIES) if random.random() < labeled_fraction else None,
+        )
+        rows.append(row)
+    return rows
+
+
+def produce(broker: InProcessBroker, rate: float, duration: float, batch_size: int, users: int,
+            wire_format: str, labeled_fraction: float, stop: threading.Event):
+    """Publica lotes de batch_size muestras a razón de rate muestras/s durante duration segundos."""
+    start = datetime.now()
+    features = feature_pool()
+    interval = batch_size / rate
+    began = time.monotonic()
+    sequence = 0
+    while not stop.is_set() and time.monotonic() - began < duration:
+        body, content_type = encode_message(synthetic_batch(batch_size, users, start, sequence, labeled_fraction, features),
+                                           wire_format)
+        broker.publish(BENCHMARK_QUEUE, body, SimpleNamespace(content_type=content_type, headers={"published_at": time.time()}))
+        sequence += 1
+        # Ritmo fijo: si el productor se retrasa no recupera el tiempo con ráfagas
+        time.sleep(max(0.0, began + sequence * interval - time.monotonic()))
+    return sequence
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def build_store(store: str, dsn: str = None, sqlite_path: str = ":memory:", write_method: str = INGESTOR_WRITE_METHOD):
+    if store == "sqlite":
+        return SQLiteBatchStore(sqlite_path)
+    if store == "postgres":
+        return TicWatchBatchWriter(dsn=dsn, method=write_method) if dsn else TicWatchBatchWriter(method=write_method)
+    if store == "null":
+        return NullStore()
+    raise ValueError(f"Unsupported store '{store}'. Expected one of ('sqlite', 'postgres', 'null').")
+
+
+def run_benchmark(rate: float = 20000, duration: float = 10, batch_size: int = 100, users: int = 50,
+                  wire_format: str = "msgpack", labeled_fraction: float = 0.1, store: str = "sqlite",
+                  dsn: str = None, sqlite_path: str = ":memory:", prefetch_count: int = INGESTOR_PREFETCH_COUNT,
+                  max_batch_size: int = INGESTOR_MAX_BATCH_SIZE, flush_interval: float = INGESTOR_FLUSH_INTERVAL_SECONDS,
+                  dedup_cache_size: int = INGESTOR_DEDUP_CACHE_SIZE, drain_timeout: float = 30) -> dict:
+    broker = InProcessBroker()
+    batch_store = build_store(store, dsn, sqlite_path)
+    consumer = IngestConsumer(
+        BENCHMARK_QUEUE,
+        store_batch=batch_store.write,
+        recent_keys=RecentKeyFilter(dedup_cache_size) if dedup_cache_size else None,
+        notifications=NotificationCoalescer(INGESTOR_NOTIFICATION_WINDOW_SECONDS),
+        notification_queue=BENCHMARK_NOTIFICATION_QUEUE,
+        prefetch_count=prefetch_count,
+        max_batch_size=max_batch_size,
+        flush_interval=flush_interval,
+        lag_interval=3600,
+        connection_factory=broker.connect,
+    )
+    consumer_cpu = {}
+
+    def consume():
+        consumer.run()
+        consumer_cpu["seconds"] = time.thread_time()
+
+    consumer_thread = threading.Thread(target=consume, name="ingest-consumer")
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.time()
+    consumer_thread.start()
+    stop_producer = threading.Event()
+    batches = produce(broker, rate, duration, batch_size, users, wire_format, labeled_fraction, stop_producer)
+    produced_at = time.time()
+
+    # Se espera a que el consumidor vacíe la cola (o a drain_timeout) antes de pararlo
+    deadline = time.monotonic() + drain_timeout
+    while broker.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    consumer.stop()
+    consumer_thread.join()
+    batch_store.close()
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    elapsed = max((broker.last_ack_at or produced_at) - started, 1e-9)
+    stats = consumer.stats()
+    return {
+        "store": store,
+        "wire_format": wire_format,
+        "offered_rate": rate,
+        "published_samples": batches * batch_size,
+        "stored_samples": stats["stored_samples"],
+        "duplicate_samples": stats["duplicate_samples"],
+        "backlog_messages": broker.pending(),
+        "committed_batches": stats["committed_batches"],
+        "failed_batches": stats["failed_batches"],
+        "published_notifications": stats["published_notifications"],
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(stats["stored_samples"] / elapsed, 1),
+        "lag_p50_ms": None if not broker.lags else round(percentile(broker.lags, 0.50) * 1000, 2),
+        "lag_p99_ms": None if not broker.lags else round(percentile(broker.lags, 0.99) * 1000, 2),
+        "consumer_cpu_seconds": round(consumer_cpu.get("seconds", 0.0), 3),
+        "process_cpu_seconds": round((usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime), 3),
+        # En Linux ru_maxrss está en KiB
+        "peak_rss_mb": round(usage_after.ru_maxrss / 1024, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark sin red del Data Ingestor.")
+    parser.add_argument("--rate", type=float, default=20000, help="muestras/s que publica el productor")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de publicación")
+    parser.add_argument("--batch-size", type=int, default=100, help="muestras por mensaje (lote del Nodo Edge)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--wire-format", choices=("json", "msgpack"), default="msgpack")
+    parser.add_argument("--labeled-fraction", type=float, default=0.1)
+    parser.add_argument("--store", choices=("sqlite", "postgres", "null"), default="sqlite")
+    parser.add_argument("--dsn", help="Postgres local para --store postgres (por defecto DATABASE_URL)")
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--prefetch-count", type=int, default=INGESTOR_PREFETCH_COUNT)
+    parser.add_argument("--max-batch-size", type=int, default=INGESTOR_MAX_BATCH_SIZE)
+    parser.add_argument("--flush-interval", type=float, default=INGESTOR_FLUSH_INTERVAL_SECONDS)
+    parser.add_argument("--dedup-cache-size", type=int, default=INGESTOR_DEDUP_CACHE_SIZE)
+    parser.add_argument("--min-rows-per-second", type=float, help="sale con código 1 si no se alcanza")
+    parser.add_argument("--json", action="store_true", help="imprime el resultado en JSON")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        rate=args.rate, duration=args.duration, batch_size=args.batch_size, users=args.users,
+        wire_format=args.wire_format, labeled_fraction=args.labeled_fraction, store=args.store, dsn=args.dsn,
+        sqlite_path=args.sqlite_path, prefetch_count=args.prefetch_count, max_batch_size=args.max_batch_size,
+        flush_interval=args.flush_interval, dedup_cache_size=args.dedup_cache_size,
+    )
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"Data Ingestor ({results['store']}, {results['wire_format']}, {results['offered_rate']:.0f} muestras/s ofrecidas):")
+        for name, value in results.items():
+            print(f"  {name:<26} {value}")
+    if args.min_rows_per_second is not None and results["rows_per_second"] < args.min_rows_per_second:
+        print(f"Rendimiento por debajo del mínimo: {results['rows_per_second']} < {args.min_rows_per_second} filas/s.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
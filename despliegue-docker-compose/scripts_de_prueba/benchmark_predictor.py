@@ -0,0 +1,86 @@
+import pickle
+import random
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from app.config import FEATURE_COLUMNS
+from app.models.ticwatch_predictor import TicWatchPredictor
+from app.schemas.ticwatch_schema import TicWatchData
+
+# Micro-benchmark de la latencia por llamada de TicWatchPredictor.
+# Compara el pre-procesado anterior (DataFrame de una fila a partir de model_dump())
+# con el vector de NumPy construido directamente desde los campos Pydantic, y la
+# inferencia de scikit-learn con la del modelo compilado (CompiledForest).
+# Uso: python -m scripts_de_prueba.benchmark_predictor [iteraciones]
+
+ACTIVITIES = ["sleeping", "sedentary", "training"]
+
+
+def build_model(num_samples: int = 3000) -> RandomForestClassifier:
+    """Entrena un RandomForest con datos sintéticos, igual que lo haría generate_initial_model."""
+    rows = [[random.uniform(-1, 1) for _ in FEATURE_COLUMNS] for _ in range(num_samples)]
+    X = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    y = [random.choice(ACTIVITIES) for _ in range(num_samples)]
+    return RandomForestClassifier(random_state=42).fit(X, y)
+
+
+def build_sample() -> TicWatchData:
+    values = {column: random.uniform(-1, 1) for column in FEATURE_COLUMNS}
+    values["tic_step"] = random.randint(0, 100)
+    return TicWatchData(session_id="benchmark_session", timestamp=datetime.now(), **values)
+
+
+def preprocess_dataframe(data: TicWatchData) -> pd.DataFrame:
+    """Pre-procesado anterior de TicWatchPredictor.preprocess_data (una fila de Pandas)."""
+    return pd.DataFrame([data.model_dump()])[FEATURE_COLUMNS]
+
+
+def time_per_call(function, iterations: int) -> float:
+    """Devuelve la latencia media por llamada en microsegundos."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_benchmark(iterations: int = 2000):
+    model_bytes = pickle.dumps(build_model())
+    dataframe_model = pickle.loads(model_bytes) # Conserva los nombres de columnas, como los modelos antiguos
+    predictor = TicWatchPredictor(model_bytes=model_bytes)
+    sample = build_sample()
+    vector = predictor.preprocess_data(sample)
+    batch = predictor.preprocess_many([build_sample() for _ in range(64)])
+
+    results = {
+        "preprocess (DataFrame)": time_per_call(lambda: preprocess_dataframe(sample), iterations),
+        "preprocess (NumPy)": time_per_call(lambda: predictor.preprocess_data(sample), iterations),
+        "predict (DataFrame)": time_per_call(lambda: dataframe_model.predict(preprocess_dataframe(sample)), iterations),
+        "predict (NumPy)": time_per_call(lambda: predictor.predict(sample), iterations),
+        "predict (vector ya pre-procesado)": time_per_call(lambda: predictor.predict(vector), iterations),
+        "predict_proba (NumPy)": time_per_call(lambda: predictor.predict_proba(sample), iterations),
+        "1 fila: scikit-learn": time_per_call(lambda: predictor.model.predict(vector), iterations),
+        "1 fila: compilado": time_per_call(lambda: predictor.compiled.predict(vector), iterations),
+        "64 filas: scikit-learn": time_per_call(lambda: predictor.model.predict(batch), iterations),
+        "64 filas: compilado": time_per_call(lambda: predictor.compiled.predict(batch), iterations),
+    }
+
+    print(f"Latencia media por llamada ({iterations} iteraciones):")
+    for name, microseconds in results.items():
+        print(f"  {name:<36} {microseconds:10.1f} us")
+    speedup = results["preprocess (DataFrame)"] / results["preprocess (NumPy)"]
+    print(f"Pre-procesado NumPy {speedup:.1f}x más rápido que DataFrame.")
+    for rows in ("1 fila", "64 filas"):
+        speedup = results[f"{rows}: scikit-learn"] / results[f"{rows}: compilado"]
+        print(f"Inferencia compilada ({rows}) {speedup:.1f}x más rápida que scikit-learn.")
+    return results
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore")
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run_benchmark(iterations)
@@ -9,6 +9,7 @@ import time
 import random
 import sys
 from app.data.message_queue import publish_data_message, EDGE_INGEST_QUEUE
+from app.data.ticwatch_writer import copy_ticwatch_rows
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -120,14 +121,8 @@ def insert_sample_ticwatch_data(user_id, num_samples, with_labels=False):
             )
             data_list.append(row)
 
-        query = """
-            INSERT INTO ticwatch_data (
-                user_id, session_id, timestamp, tic_accx, tic_accy, tic_accz,
-                tic_acclx, tic_accly, tic_acclz, tic_girx, tic_giry, tic_girz,
-                tic_hrppg, tic_step, ticwatchconnected, estado_real, predicted_state
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """
-        cur.executemany(query, data_list)
+        # Las filas siguen el orden de TICWATCH_COLUMNS: un único COPY en lugar de un INSERT por fila
+        copy_ticwatch_rows(cur, data_list)
         conn.commit()
         print(f"Insertados {len(data_list)} puntos de datos de ejemplo para el usuario {user_id} en la DB (con etiquetas={with_labels}).")
     except Exception as e:
@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+from fog_node.artifact_cache import ModelArtifactCache
+
+URL = "http://cloud/models/user/u1?tier=edge"
+
+
+def artifacts(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pkl"))
+
+
+def test_index_survives_a_restart(tmp_path):
+    ModelArtifactCache(str(tmp_path)).put(URL, '"v1"', b"model v1")
+
+    restarted = ModelArtifactCache(str(tmp_path))
+
+    assert restarted.get(URL) == ('"v1"', b"model v1")
+    assert restarted.get("http://cloud/models/generic") == (None, None)
+
+
+def test_versions_without_etag_are_not_cached(tmp_path):
+    cache = ModelArtifactCache(str(tmp_path))
+    cache.put(URL, None, b"model v1")
+
+    assert cache.get(URL) == (None, None)
+    assert artifacts(tmp_path) == []
+
+
+def test_missing_artifact_is_treated_as_a_cache_miss(tmp_path):
+    cache = ModelArtifactCache(str(tmp_path))
+    cache.put(URL, '"v1"', b"model v1")
+    for name in artifacts(tmp_path):
+        os.remove(tmp_path / name)
+
+    assert cache.get(URL) == (None, None)
+
+
+def test_old_unreferenced_artifacts_are_pruned_to_the_byte_budget(tmp_path):
+    cache = ModelArtifactCache(str(tmp_path), max_bytes=20)
+    # Dos URLs con artefactos de 10 bytes: llenan el presupuesto
+    cache.put(URL, '"v1"', b"edge-v1...")
+    cache.put("http://cloud/models/generic", '"g1"', b"generic-1.")
+    old_artifacts = artifacts(tmp_path)
+    past = os.path.getmtime(tmp_path / old_artifacts[0]) - 60
+    for name in old_artifacts:
+        os.utime(tmp_path / name, (past, past))
+
+    cache.put(URL, '"v2"', b"edge-v2...")
+
+    # Se borra la versión anterior de URL (ya sin referencias); la del genérico se conserva
+    assert cache.get(URL) == ('"v2"', b"edge-v2...")
+    assert cache.get("http://cloud/models/generic") == ('"g1"', b"generic-1.")
+    assert len(artifacts(tmp_path)) == 2
+    assert sum(os.path.getsize(tmp_path / name) for name in artifacts(tmp_path)) <= 20
+
+
+def test_referenced_artifacts_are_kept_even_over_the_budget(tmp_path):
+    cache = ModelArtifactCache(str(tmp_path), max_bytes=5)
+    cache.put(URL, '"v1"', b"model v1")
+
+    assert cache.get(URL) == ('"v1"', b"model v1")
+
+
+def test_recently_read_artifacts_outlive_older_writes(tmp_path):
+    cache = ModelArtifactCache(str(tmp_path), max_bytes=30)
+    cache.put(URL, '"v1"', b"edge-v1...")
+    cache.put("http://cloud/models/generic", '"g1"', b"generic-1.")
+    edge_v1, generic_1 = (tmp_path / f"{hashlib.sha256(content).hexdigest()}.pkl" for content in (b"edge-v1...", b"generic-1."))
+    # edge-v1 se escribió antes, pero se ha leído después que generic-1
+    past = os.path.getmtime(edge_v1) - 120
+    os.utime(edge_v1, (past, past))
+    os.utime(generic_1, (past + 60, past + 60))
+    cache.get(URL)
+
+    cache.put(URL, '"v2"', b"edge-v2...")
+    cache.put("http://cloud/models/generic", '"g2"', b"generic-2.")
+
+    # Sin referencias las dos, se borra la usada hace más tiempo
+    assert edge_v1.exists()
+    assert not generic_1.exists()
@@ -0,0 +1,11 @@
+from scripts_de_prueba.benchmark_ingest import run_benchmark
+
+
+def test_offline_benchmark_stores_every_published_sample():
+    results = run_benchmark(rate=2000, duration=0.3, batch_size=50, users=5, store="sqlite", flush_interval=0.01)
+
+    assert results["published_samples"] > 0
+    assert results["stored_samples"] == results["published_samples"]
+    assert results["backlog_messages"] == 0 and results["failed_batches"] == 0
+    assert results["lag_p50_ms"] <= results["lag_p99_ms"]
+    assert results["rows_per_second"] > 0
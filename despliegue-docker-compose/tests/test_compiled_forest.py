@@ -0,0 +1,50 @@
+import pickle
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.models.compiled_forest import CompiledForest
+from app.models.ticwatch_predictor import TicWatchPredictor
+
+
+def fit_forest(seed=0, n_samples=800, n_features=11):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_samples, n_features)).astype(np.float32)
+    # Etiquetas con ruido para que haya árboles profundos y empates entre clases
+    y = np.where(X[:, 0] + rng.normal(scale=0.8, size=n_samples) > 0, "training", "sedentary")
+    y[rng.random(n_samples) < 0.2] = "sleeping"
+    return RandomForestClassifier(n_estimators=30, random_state=42).fit(X, y), rng
+
+
+def test_compiled_forest_matches_sklearn_exactly():
+    model, rng = fit_forest()
+    compiled = CompiledForest.from_sklearn(model)
+    X = rng.normal(size=(2000, 11)).astype(np.float32)
+
+    np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+    np.testing.assert_array_equal(compiled.predict(X[:1]), model.predict(X[:1]))
+
+
+def test_predictor_uses_the_compiled_forest_transparently():
+    model, rng = fit_forest(seed=1)
+    predictor = TicWatchPredictor(model_bytes=pickle.dumps(model))
+    X = rng.normal(size=(50, 11)).astype(np.float32)
+
+    assert predictor.compiled is not None
+    assert predictor.predict_many(X) == model.predict(X).tolist()
+    assert predictor.predict(X[0]) == model.predict(X[:1])[0]
+    assert predictor.predict_proba(X[0]) == dict(zip(model.classes_.tolist(), model.predict_proba(X[:1])[0].tolist()))
+
+
+def test_compiled_only_predictor_releases_the_sklearn_forest():
+    model, rng = fit_forest(seed=2)
+    model_bytes = pickle.dumps(model)
+    predictor = TicWatchPredictor(model_bytes=model_bytes, compiled_only=True)
+    X = rng.normal(size=(50, 11)).astype(np.float32)
+
+    assert predictor.model is predictor.compiled
+    assert not hasattr(predictor.model, "estimators_")
+    assert predictor.model_size_bytes == predictor.compiled.nbytes < len(model_bytes)
+    assert predictor.predict_many(X) == model.predict(X).tolist()
+    assert predictor.predict_proba(X[0]) == dict(zip(model.classes_.tolist(), model.predict_proba(X[:1])[0].tolist()))
@@ -0,0 +1,45 @@
+from fog_node.fine_tune_state import FineTuneState
+
+
+def notification(user_id, count, max_timestamp, label="training"):
+    return {"user_id": user_id, "new_labeled_samples": count, "label_counts": {label: count}, "max_timestamp": max_timestamp}
+
+
+def test_restarted_state_resumes_from_the_cloud_summary_without_recounting():
+    state = FineTuneState(min_samples=20)
+    # Resumen de la Cloud API tras un reinicio: 15 muestras pendientes de u1 y la marca de agua de u2
+    state.load([
+        {"user_id": "u1", "new_labeled_samples": 15, "label_counts": {"training": 15},
+         "max_timestamp": "2025-01-01T00:10:00", "trained_until": None},
+        {"user_id": "u2", "new_labeled_samples": 0, "label_counts": {},
+         "max_timestamp": None, "trained_until": "2025-01-01T00:05:00"},
+    ])
+
+    # Notificación de muestras ya contadas en el resumen (llegó a la cola antes del reinicio)
+    assert state.collect([notification("u1", 15, "2025-01-01T00:10:00")]) == []
+    assert state.pending["u1"]["new_labeled_samples"] == 15
+
+    # Muestras nuevas: u1 alcanza el umbral; las de u2 anteriores a su marca de agua no cuentan
+    users = state.collect([
+        notification("u1", 5, "2025-01-01T00:11:00", label="sleeping"),
+        notification("u2", 30, "2025-01-01T00:04:00"),
+    ])
+
+    assert users == ["u1"]
+    assert state.pending["u1"]["label_counts"] == {"training": 15, "sleeping": 5}
+    assert "u2" not in state.pending
+
+
+def test_fine_tuning_resets_the_pending_samples_and_advances_the_watermark():
+    state = FineTuneState(min_samples=20)
+    state.load([])
+    assert state.collect([notification("u1", 25, "2025-01-01T00:10:00")]) == ["u1"]
+
+    # Mientras el mapeo no se actualiza (no se llama a mark_fine_tuned), el usuario sigue pendiente
+    assert state.collect([]) == ["u1"]
+
+    state.mark_fine_tuned("u1", "2025-01-01T00:10:00")
+
+    assert state.collect([notification("u1", 25, "2025-01-01T00:09:00")]) == []
+    assert state.trained_watermarks["u1"] == "2025-01-01T00:10:00"
+    assert "u1" not in state.pending
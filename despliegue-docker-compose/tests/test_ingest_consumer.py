@@ -0,0 +1,238 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.data.ingest_partitions import assign_partitions
+from app.data.wire_format import encode_message
+from data_ingestor.consumer import IngestConsumer, PartitionedIngestConsumer
+from data_ingestor.dedup import RecentKeyFilter
+from data_ingestor.notifications import NotificationCoalescer
+
+
+class FakeConnection:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        self.timers.append(callback)
+        return callback
+
+    def remove_timeout(self, timer):
+        self.timers.remove(timer)
+
+
+class FakeChannel:
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+        self.consuming = set()
+        self.published = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.nacks.append((delivery_tag, multiple, requeue))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, json.loads(body)))
+
+    def basic_consume(self, queue, on_message_callback):
+        self.consuming.add(queue)
+        return queue
+
+    def basic_cancel(self, consumer_tag):
+        self.consuming.remove(consumer_tag)
+
+
+def make_consumer(store_batch, notified=None, **kwargs):
+    consumer = IngestConsumer("edge_data_queue", store_batch=store_batch, notify=notified.update if notified is not None else None,
+                              retry_delay=0, sleep=lambda seconds: None, **kwargs)
+    consumer._connection = FakeConnection()
+    consumer._channel = FakeChannel()
+    return consumer
+
+
+def deliver(consumer, tag, rows, wire_format="msgpack"):
+    body, content_type = encode_message(rows, wire_format)
+    properties = SimpleNamespace(content_type=content_type, headers={"published_at": 0.0})
+    consumer._on_message(consumer._channel, SimpleNamespace(delivery_tag=tag), properties, body)
+
+
+def rows(user_id, n):
+    return [{"user_id": user_id, "session_id": "s1", "timestamp": f"2025-01-01T00:00:{i:02d}", "tic_accx": 0.5, "tic_accy": 0.0,
+             "tic_accz": 0.0, "tic_acclx": 0.0, "tic_accly": 0.0, "tic_acclz": 0.0, "tic_girx": 0.0, "tic_giry": 0.0,
+             "tic_girz": 0.0, "tic_hrppg": 70.0, "tic_step": i} for i in range(n)]
+
+
+def test_micro_batches_are_acked_once_after_the_store_commits():
+    stored, notified = [], set()
+    consumer = make_consumer(stored.append, notified, max_batch_size=5)
+
+    deliver(consumer, 1, rows("u1", 3))
+    deliver(consumer, 2, rows("u2", 2), wire_format="json")
+    # Se alcanza max_batch_size: el micro-lote se guarda sin esperar al temporizador
+    assert [len(batch) for batch in stored] == [5]
+    assert consumer._channel.acks == [(2, True)]
+    assert notified == {"u1", "u2"}
+
+    deliver(consumer, 3, rows("u3", 1))
+    assert consumer._channel.acks == [(2, True)]
+    consumer._connection.timers.pop()()
+    assert consumer._channel.acks == [(2, True), (3, True)]
+    assert stored[-1][0]["timestamp"].year == 2025
+
+
+def test_failed_store_requeues_the_micro_batch_without_acking():
+    def failing_store(samples):
+        raise ConnectionError("database unavailable")
+
+    consumer = make_consumer(failing_store, max_batch_size=2, max_store_attempts=3)
+
+    deliver(consumer, 7, rows("u1", 2))
+
+    assert consumer._channel.acks == []
+    assert consumer._channel.nacks == [(7, True, True)]
+    assert consumer.stats()["failed_batches"] == 1
+
+
+def test_rows_that_cannot_be_stored_are_isolated_and_dead_lettered():
+    stored, notified = [], set()
+
+    def store(samples):
+        if any(sample["tic_step"] == 3 for sample in samples):
+            raise ValueError("value out of range for column tic_step")
+        stored.extend(samples)
+
+    consumer = make_consumer(store, notified, max_batch_size=6, max_store_attempts=2, dead_letter_exchange="ingest_dead_letter")
+
+    deliver(consumer, 4, rows("u1", 6))
+
+    # Se guardan las demás muestras y se confirma el lote: la fila defectuosa no vuelve a la cola
+    assert sorted(sample["tic_step"] for sample in stored) == [0, 1, 2, 4, 5]
+    assert consumer._channel.acks == [(4, True)]
+    assert consumer._channel.nacks == []
+    assert notified == {"u1"}
+    [(routing_key, dead_letters)] = consumer._channel.published
+    assert routing_key == "edge_data_queue"
+    assert [entry["sample"]["tic_step"] for entry in dead_letters] == [3]
+    assert "out of range" in dead_letters[0]["error"]
+    assert consumer.stats()["dead_letter_samples"] == 1
+
+
+def test_batch_is_requeued_when_no_part_of_it_can_be_stored():
+    def failing_store(samples):
+        raise ConnectionError("database unavailable")
+
+    consumer = make_consumer(failing_store, max_batch_size=4, max_store_attempts=2, dead_letter_exchange="ingest_dead_letter")
+
+    deliver(consumer, 5, rows("u1", 4))
+
+    assert consumer._channel.nacks == [(5, True, True)]
+    assert consumer._channel.published == []
+
+
+def test_redelivered_samples_are_dropped_and_acked_without_notifying():
+    stored, notified = [], set()
+    consumer = make_consumer(stored.append, notified, max_batch_size=3, recent_keys=RecentKeyFilter(max_keys=10))
+
+    deliver(consumer, 1, rows("u1", 3))
+    notified.clear()
+    # Reenvío del mismo lote (p. ej. desde el diario del Edge): se confirma sin guardar nada
+    deliver(consumer, 2, rows("u1", 3))
+
+    assert [len(batch) for batch in stored] == [3]
+    assert consumer._channel.acks == [(1, True), (2, True)]
+    assert notified == set()
+    assert consumer.stats()["duplicate_samples"] == 3
+
+
+def test_labeled_samples_are_coalesced_into_one_notification_per_user_and_window():
+    now = [0.0]
+    notifications = NotificationCoalescer(window_seconds=30, clock=lambda: now[0])
+    consumer = make_consumer(lambda samples: None, max_batch_size=4, notifications=notifications,
+                             notification_queue="ingest_fog_notification_queue")
+
+    labeled = rows("u1", 4)
+    for sample, label in zip(labeled, ["walk", "walk", None, "run"]):
+        sample["estado_real"] = label
+    deliver(consumer, 1, labeled)
+    deliver(consumer, 2, rows("u2", 4))  # sin etiquetar: no se notifica
+    consumer._publish_notifications()
+    assert consumer._channel.published == []
+
+    now[0] = 30.0
+    consumer._publish_notifications()
+    (queue, message), = consumer._channel.published
+    assert queue == "ingest_fog_notification_queue"
+    assert message["user_id"] == "u1" and message["new_labeled_samples"] == 3
+    assert message["label_counts"] == {"walk": 2, "run": 1}
+    assert message["max_timestamp"] == "2025-01-01T00:00:03"
+    assert len(notifications) == 0
+
+
+def test_only_samples_the_database_inserted_are_notified():
+    now = [0.0]
+    notifications = NotificationCoalescer(window_seconds=0, clock=lambda: now[0])
+
+    def store(samples):
+        # Las dos primeras ya estaban en la base de datos (ON CONFLICT DO NOTHING)
+        return samples[2:]
+
+    consumer = make_consumer(store, max_batch_size=4, notifications=notifications,
+                             notification_queue="ingest_fog_notification_queue")
+    labeled = rows("u1", 4)
+    for sample in labeled:
+        sample["estado_real"] = "walk"
+    deliver(consumer, 1, labeled)
+    consumer._publish_notifications()
+
+    (_, message), = consumer._channel.published
+    assert message["new_labeled_samples"] == 2
+    assert consumer.stats()["stored_samples"] == 2 and consumer.stats()["duplicate_samples"] == 2
+
+
+def test_notification_watermark_compares_naive_and_aware_timestamps():
+    notifications = NotificationCoalescer(window_seconds=0)
+    latest = datetime(2025, 1, 1, 1, 0, 0, tzinfo=timezone(timedelta(hours=-1)))
+    notifications.add([
+        {"user_id": "u1", "estado_real": "walk", "timestamp": datetime(2025, 1, 1, 1, 30, 0)},
+        {"user_id": "u1", "estado_real": "walk", "timestamp": latest},
+        {"user_id": "u1", "estado_real": "walk", "timestamp": datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)},
+    ])
+
+    message, = notifications.pop_due()
+    # 01:00 a las -01:00 son las 02:00 UTC: posterior a las 01:30 sin zona horaria (UTC)
+    assert message["max_timestamp"] == latest.isoformat()
+
+
+def test_partitions_are_split_evenly_and_reassigned_when_a_member_leaves():
+    members = ["a", "b", "c"]
+    owned = {member: assign_partitions(member, members, 24) for member in members}
+    assert set().union(*owned.values()) == set(range(24))
+    assert [len(partitions) for partitions in owned.values()] == [8, 8, 8]
+
+    after_leave = {member: assign_partitions(member, ["a", "b"], 24) for member in ["a", "b"]}
+    assert after_leave["a"] | after_leave["b"] == set(range(24))
+    assert [len(partitions) for partitions in after_leave.values()] == [12, 12]
+
+
+def test_partitioned_consumer_flushes_before_releasing_partitions():
+    stored = []
+    consumer = PartitionedIngestConsumer("edge_data_queue", stored.append, partitions=8, member_id="a", max_batch_size=100,
+                                         retry_delay=0, sleep=lambda seconds: None)
+    consumer._connection = FakeConnection()
+    consumer._channel = FakeChannel()
+
+    consumer._rebalance()
+    assert consumer.owned_partitions == set(range(8))
+    deliver(consumer, 1, rows("u1", 2))
+
+    joined = b'{"member": "b", "event": "alive"}'
+    consumer._on_member_message(consumer._channel, None, None, joined)
+
+    assert consumer.owned_partitions == assign_partitions("a", ["b"], 8)
+    assert consumer._channel.consuming == {f"edge_data_queue.p{p}" for p in consumer.owned_partitions}
+    # El micro-lote en curso se guardó y confirmó antes de soltar particiones
+    assert [len(batch) for batch in stored] == [2]
+    assert consumer._channel.acks == [(1, True)]
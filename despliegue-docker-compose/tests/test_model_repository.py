@@ -0,0 +1,83 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from cloud_node.api.dependencies import get_model_repository
+from cloud_node.api.routes import models
+from cloud_node.api.routes.models import resolve_variant
+from cloud_node.model_repository import ModelRepository
+
+
+def make_repository(tmp_path):
+    repository = ModelRepository()
+    repository.models_dir = str(tmp_path)
+    repository.generic_model_path = str(tmp_path / "generic_activity_model.pkl")
+    repository.user_models_dir = str(tmp_path / "users")
+    os.makedirs(repository.user_models_dir, exist_ok=True)
+    return repository
+
+
+def test_replacing_the_default_model_discards_its_stale_variants(tmp_path):
+    repository = make_repository(tmp_path)
+    repository.save_model(b"model v1", "u1", is_generic=False)
+    edge_path = repository.save_model(b"edge v1", "u1", is_generic=False, tier="edge")
+    repository.save_variant_metrics(edge_path, {"size_bytes": 7})
+    get_path = lambda tier: repository.get_user_model_path("u1", tier)
+    assert resolve_variant(get_path, "edge") == (edge_path, "edge")
+
+    default_path = repository.save_model(b"model v2", "u1", is_generic=False)
+
+    # Sin variante del modelo nuevo, el Edge recibe el modelo por defecto
+    assert not os.path.exists(edge_path)
+    assert not os.path.exists(f"{edge_path}.metrics.json")
+    assert resolve_variant(get_path, "edge") == (default_path, "cloud")
+
+
+def test_variant_older_than_the_default_model_is_not_served(tmp_path):
+    repository = make_repository(tmp_path)
+    default_path = repository.save_model(b"model", "generic_activity_model")
+    edge_path = repository.get_generic_model_path("edge")
+    with open(edge_path, "wb") as f:
+        f.write(b"stale edge variant")
+    stale_time = os.path.getmtime(default_path) - 60
+    os.utime(edge_path, (stale_time, stale_time))
+
+    assert resolve_variant(repository.get_generic_model_path, "edge") == (default_path, "cloud")
+
+
+def make_client(repository):
+    app = FastAPI()
+    app.include_router(models.router, prefix="/models")
+    app.dependency_overrides[get_model_repository] = lambda: repository
+    return TestClient(app)
+
+
+def test_matching_if_none_match_is_answered_with_304(tmp_path):
+    repository = make_repository(tmp_path)
+    repository.save_model(b"generic model", "generic_activity_model")
+    client = make_client(repository)
+
+    response = client.get("/models/generic")
+    etag = response.headers["ETag"]
+    assert response.content == b"generic model"
+    assert response.headers["X-Model-Tier"] == "cloud"
+
+    not_modified = client.get("/models/generic", headers={"If-None-Match": f'"other", {etag}'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == etag
+
+
+def test_etag_changes_when_the_model_is_saved_again(tmp_path):
+    repository = make_repository(tmp_path)
+    path = repository.save_model(b"model v1", "u1", is_generic=False)
+    first_etag = repository.get_model_etag(path)
+    assert repository.get_model_etag(path) == first_etag
+
+    repository.save_model(b"model v2", "u1", is_generic=False)
+
+    assert repository.get_model_etag(path) != first_etag
+    response = make_client(repository).get("/models/user/u1", headers={"If-None-Match": first_etag})
+    assert response.status_code == 200
+    assert response.content == b"model v2"
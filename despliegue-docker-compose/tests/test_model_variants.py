@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from app.config import FEATURE_COLUMNS
+from app.models.compiled_forest import CompiledForest
+from app.models.model_variants import train_variant
+from app.models.ticwatch_predictor import TicWatchPredictor
+
+
+def make_dataset(count=600, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.normal(size=(count, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    labels = np.where(data[FEATURE_COLUMNS[0]] > 0, "training", np.where(data[FEATURE_COLUMNS[1]] > 0, "sedentary", "sleeping"))
+    return data, pd.Series(labels)
+
+
+def test_edge_variant_fits_its_byte_budget_and_loads_compiled():
+    data, labels = make_dataset()
+    budget = {"n_estimators": 30, "max_depth": 8, "max_bytes": 60_000, "float32_thresholds": True}
+
+    variant_bytes, metrics = train_variant(data, labels, "edge", budget=budget)
+
+    assert len(variant_bytes) <= budget["max_bytes"]
+    assert metrics["size_bytes"] == len(variant_bytes)
+    assert metrics["n_estimators"] < budget["n_estimators"]
+    assert metrics["holdout"] and 0 < metrics["accuracy"] <= 1
+    assert metrics["latency_p99_ms"] > 0
+
+    predictor = TicWatchPredictor(model_bytes=variant_bytes)
+    assert isinstance(predictor.model, CompiledForest)
+    assert predictor.model.threshold.dtype == np.float32
+    features = data[FEATURE_COLUMNS].to_numpy(dtype=np.float32)[:5]
+    assert set(predictor.predict_many(features)) <= {"training", "sedentary", "sleeping"}
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import pytest
+
+from app.data.ticwatch_writer import TICWATCH_COLUMNS, TicWatchBatchWriter, copy_buffer
+
+
+class FakeCursor:
+    """Simula ticwatch_data con su índice único: guarda las claves de las filas insertadas."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.returned = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.connection.statements.append(sql)
+        if sql.startswith("CREATE UNIQUE INDEX") and self.connection.index_fails:
+            raise psycopg2.Error("could not create unique index")
+        if sql.startswith("WITH batch"):
+            inserted = []
+            for key, ordinal in self.connection.staged:
+                if key not in self.connection.keys:
+                    self.connection.keys.add(key)
+                    inserted.append((ordinal,))
+            self.returned = inserted
+
+    def fetchall(self):
+        return self.returned
+
+    def copy_expert(self, sql, buffer):
+        if self.connection.fail:
+            raise RuntimeError("copy failed")
+        self.connection.statements.append(sql)
+        lines = [line.split("\t") for line in buffer.read().splitlines()]
+        self.connection.staged = [((user_id, session_id, stored_timestamp(timestamp)), int(values[-1]))
+                                  for user_id, session_id, timestamp, *values in lines]
+
+
+def stored_timestamp(text):
+    # Como una columna timestamp de PostgreSQL: los instantes con zona horaria se guardan en UTC y sin ella
+    timestamp = datetime.fromisoformat(text)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+class FakeConnection:
+    def __init__(self, fail=False, index_fails=False):
+        self.fail = fail
+        self.index_fails = index_fails
+        self.closed = 0
+        self.statements = []
+        self.keys = set()
+        self.staged = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def sample(i, **overrides):
+    row = {column: 0.5 for column in TICWATCH_COLUMNS}
+    row.update(user_id="u1", session_id="s1", timestamp=datetime(2025, 1, 1, 0, 0, i), tic_step=i,
+               ticwatchconnected=True, estado_real=None, predicted_state=None)
+    row.update(overrides)
+    return row
+
+
+def test_copy_buffer_escapes_text_and_encodes_nulls_and_booleans():
+    line = copy_buffer([("a\tb\\c\nd", None, True, 1.25, datetime(2025, 1, 1, 12, 30))]).read()
+
+    assert line == "a\\tb\\\\c\\nd\t\\N\tt\t1.25\t2025-01-01T12:30:00\n"
+
+
+def test_batch_is_written_with_one_copy_and_one_commit_skipping_duplicates():
+    connections = []
+
+    def connect(dsn):
+        connections.append(FakeConnection(fail=len(connections) == 0))
+        return connections[-1]
+
+    writer = TicWatchBatchWriter(dsn="postgresql://test", connect=connect)
+    with pytest.raises(RuntimeError):
+        writer.write([sample(0)])
+    # El lote fallido hace rollback y la conexión se descarta
+    assert connections[0].rollbacks == 1 and connections[0].closed
+
+    assert len(writer.write([sample(i) for i in range(3)])) == 3
+    # Un reenvío parcial (y una muestra repetida dentro del lote) no duplica filas: solo se
+    # retorna la muestra insertada de verdad
+    assert [row["tic_step"] for row in writer.write([sample(2), sample(3), sample(3)])] == [3]
+
+    # El índice único se crea una sola vez, al conectar por primera vez
+    assert connections[0].statements[0].startswith("CREATE UNIQUE INDEX IF NOT EXISTS ticwatch_data_natural_key")
+    statements = connections[1].statements
+    assert [sql.split(" (")[0] for sql in statements[:3]] == [
+        "CREATE TEMP TABLE IF NOT EXISTS ticwatch_data_staging ON COMMIT DELETE ROWS AS SELECT user_id, session_id, timestamp, tic_accx, tic_accy, tic_accz, tic_acclx, tic_accly, tic_acclz, tic_girx, tic_giry, tic_girz, tic_hrppg, tic_step, ticwatchconnected, estado_real, predicted_state, 0 AS ord FROM ticwatch_data WITH NO DATA",
+        "COPY ticwatch_data_staging",
+        "WITH batch AS",
+    ]
+    assert "ON CONFLICT DO NOTHING RETURNING user_id, session_id, timestamp" in statements[2]
+    assert statements[2].endswith("SELECT b.ord FROM batch b JOIN inserted i USING (user_id, session_id, timestamp) ORDER BY b.ord")
+    assert writer.duplicate_rows == 2
+
+
+def test_duplicates_are_still_filtered_and_the_index_retried_when_it_cannot_be_created():
+    now = [0.0]
+    connection = FakeConnection(index_fails=True)
+    writer = TicWatchBatchWriter(dsn="postgresql://test", connect=lambda dsn: connection,
+                                 index_retry_interval=60, clock=lambda: now[0])
+
+    assert len(writer.write([sample(0), sample(1)])) == 2
+    assert len(writer.write([sample(1), sample(2)])) == 1
+    assert not writer.has_natural_key_index
+    inserts = [sql for sql in connection.statements if sql.startswith("WITH batch")]
+    assert all("WHERE NOT EXISTS" in sql for sql in inserts)
+
+    # Eliminados los duplicados, el índice se crea en el siguiente intento
+    connection.index_fails = False
+    now[0] = 60
+    writer.write([sample(3)])
+    assert writer.has_natural_key_index
+    assert "ON CONFLICT DO NOTHING" in connection.statements[-1]
+    assert sum(sql.startswith("CREATE UNIQUE INDEX") for sql in connection.statements) == 2
+
+
+def test_inserted_samples_are_matched_by_position_whatever_their_timestamp_type():
+    connection = FakeConnection()
+    writer = TicWatchBatchWriter(dsn="postgresql://test", connect=lambda dsn: connection)
+    madrid = timezone(timedelta(hours=1))
+    aware = sample(0, timestamp=datetime(2025, 1, 1, 1, 0, 0, tzinfo=madrid))
+
+    # PostgreSQL retornaría la clave con un timestamp sin zona horaria, distinto del de la muestra
+    assert writer.write([aware, sample(1)]) == [aware, sample(1)]
+    # El mismo instante sin zona horaria (en UTC) es un duplicado
+    assert writer.write([sample(0), sample(2)]) == [sample(2)]
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+import msgpack
+import pytest
+
+from app.data.wire_format import MSGPACK_CONTENT_TYPE, decode_batch, decode_message, encode_batch, encode_message
+
+
+def sample_rows(n, session_id="s1"):
+    return [
+        {
+            "session_id": session_id,
+            "timestamp": f"2025-06-01T10:00:{i % 60:02d}.250000",
+            "tic_accx": 0.5 + i, "tic_accy": -1.25, "tic_accz": 9.75,
+            "tic_acclx": 0.0, "tic_accly": 0.125, "tic_acclz": -0.5,
+            "tic_girx": 1.5, "tic_giry": 2.5, "tic_girz": -3.5,
+            "tic_hrppg": 72.0,
+            "tic_step": i,
+            "ticwatchconnected": True,
+            "user_id": "u1",
+        }
+        for i in range(n)
+    ]
+
+
+def test_columnar_batch_round_trips_and_is_smaller_than_json():
+    rows = sample_rows(50)
+
+    body, content_type = encode_message(rows, "msgpack")
+
+    assert content_type == MSGPACK_CONTENT_TYPE
+    assert decode_message(body, content_type) == rows
+    assert len(body) < len(json.dumps(rows)) / 2
+    # float32 en la API: los valores representables en float32 no cambian
+    assert decode_batch(encode_batch(rows, value_dtype="<f4")) == rows
+
+
+def test_decode_accepts_plain_samples_and_rejects_inconsistent_batches():
+    row = sample_rows(1)[0]
+    assert decode_batch(msgpack.packb(row)) == [row]
+    assert decode_batch(msgpack.packb([row, row])) == [row, row]
+
+    payload = msgpack.unpackb(encode_batch(sample_rows(3)))
+    payload["n"] = 4
+    with pytest.raises(ValueError):
+        decode_batch(msgpack.packb(payload))
+
+
+def test_timestamps_keep_their_utc_offset_like_json():
+    rows = sample_rows(3)
+    rows[0]["timestamp"] = "2025-01-01T10:00:00+02:00"
+    rows[1]["timestamp"] = "2025-01-01T10:00:00Z"
+
+    decoded = decode_message(*encode_message(rows, "msgpack"))
+
+    # El mismo instante y la misma hora local que por JSON; sin zona se sigue decodificando sin zona
+    assert [row["timestamp"] for row in decoded] == [
+        "2025-01-01T10:00:00+02:00", "2025-01-01T10:00:00+00:00", rows[2]["timestamp"],
+    ]
+    json_rows = decode_message(*encode_message(rows, "json"))
+    assert [datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00")) for row in json_rows] == \
+        [datetime.fromisoformat(row["timestamp"]) for row in decoded]